@@ -1,18 +1,94 @@
+from src.pipelines.forecast_scheduler import ForecastScheduler
 from src.pipelines.prediction_pipeline import PredictionPipeline
-from fastapi import FastAPI
-from typing import List
-from pydantic import BaseModel
+from src.pipelines.request_models import Batch_params, Covariate_params
+from src.utils.drift_monitor import DriftMonitor
+from src.utils.exception import CustomException
+from src.utils.forecast_cache import ForecastCache
+from src.utils.instrumentation import metrics_registry, span
+from src.utils.logger import logging
+from src.utils.model_registry import model_registry
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+import asyncio
+import time
 
 # initialising FastAPI
 app = FastAPI()
+forecast_cache = ForecastCache()
+drift_monitor = DriftMonitor()
+pipeline_obj = PredictionPipeline(registry = model_registry, cache = forecast_cache, drift_monitor = drift_monitor)
+forecast_scheduler = ForecastScheduler(pipeline = pipeline_obj)
+request_seconds = metrics_registry.histogram("http_request_duration_seconds", "Latency of the API requests by route and status")
 
-# creating the class inheriting the BaseModel class for custom data types
-class Covariate_params(BaseModel):
-    store_nbr: int
-    family: str
-    horizon: int
-    onpromotion: List[int]
-    is_holiday: List[int]
+def serving_samples():
+    cache = forecast_cache.metrics()
+    scheduler = forecast_scheduler.stats()
+    samples = [
+        (f"forecast_cache_{name}_total", "counter", f"Forecast cache {name}", {}, cache[name])
+        for name in ("hits", "misses", "evictions", "expirations", "invalidations")
+    ]
+    samples.append(("forecast_cache_entries", "gauge", "Forecasts held in the cache", {}, cache["entries"]))
+    samples.extend([
+        ("forecast_scheduler_queue_depth", "gauge", "Requests waiting in the scheduler queue", {}, scheduler["queue_depth"]),
+        ("forecast_scheduler_in_flight_batches", "gauge", "Batches being forecasted", {}, scheduler["in_flight_batches"]),
+        ("forecast_scheduler_requests_total", "counter", "Requests submitted to the scheduler", {}, scheduler["requests"]),
+        ("forecast_scheduler_rejected_total", "counter", "Requests rejected by a full scheduler queue", {}, scheduler["rejected"]),
+        ("forecast_scheduler_batches_total", "counter", "Batches dispatched by the scheduler", {}, scheduler["batches"]),
+        ("forecast_scheduler_mean_wait_ms", "gauge", "Mean queueing delay of the scheduled requests", {}, scheduler["mean_wait_ms"])
+    ])
+    samples.extend(
+        ("forecast_scheduler_batches_by_size", "counter", "Dispatched batches by the upper bound of their size", {"max_size": bucket}, count)
+        for bucket, count in scheduler["batch_size_histogram"].items()
+    )
+    return samples
+
+def drift_samples():
+    drift_monitor.reload_if_changed()
+    samples = []
+    for window in ("data", "requests"):
+        for feature, summary in drift_monitor.scores(window)["features"].items():
+            labels = {"window": window, "feature": feature}
+            if summary["psi_mean"] is not None:
+                samples.append(("drift_psi_mean", "gauge", "Mean population stability index of the scored series against the reference", labels, summary["psi_mean"]))
+            samples.append(("drift_series_alert", "gauge", "Series whose population stability index is above the alert threshold", labels, summary["rows_alert"]))
+    return samples
+
+metrics_registry.register_collector(serving_samples)
+metrics_registry.register_collector(drift_samples)
+
+# loading the models and series once per process before serving requests, unless they were preloaded before fork
+@app.on_event("startup")
+async def load_artifacts():
+    try:
+        model_registry.get()
+        if not drift_monitor.load():
+            logging.info("no drift profile found, forecast requests are not monitored for drift")
+    except Exception as e:
+        logging.info(CustomException(e))
+        print(CustomException(e))
+    await forecast_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await forecast_scheduler.stop()
+
+# timing every request and recording it in the latency histograms and the instrumentation log
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    with span("http_request", sample_memory = False, method = request.method) as attributes:
+        start = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            # labelling by route template keeps unknown paths from growing the histograms
+            route = request.scope.get("route")
+            attributes["path"] = route.path if route is not None else "unmatched"
+            attributes["status_code"] = status_code
+            request_seconds.observe(time.perf_counter() - start, method = request.method, path = attributes["path"], status = status_code)
+    return response
 
 # creating API method
 @app.get("/")
@@ -32,20 +108,96 @@ async def get_forecasts(params: Covariate_params):
     ***API Response***
     An Ndarray representing the responses for each input JSON object with sales returned in floating point numbers 
     """
-    pipeline_obj = PredictionPipeline()
-
     store_nbr = params.store_nbr
     family = params.family
     horizon = params.horizon
     onpromotion = params.onpromotion
     is_holiday = params.is_holiday
 
-    response = pipeline_obj.produce_forecasts(
-        store_nbr = store_nbr,
-        family = family,
-        horizon = horizon,
-        onpromotion = onpromotion,
-        is_holiday = is_holiday
-    )
-    
+    # requests arriving together are coalesced into one batched prediction run on a worker thread
+    try:
+        response = await forecast_scheduler.submit({
+            "store_nbr": store_nbr,
+            "family": family,
+            "horizon": horizon,
+            "onpromotion": onpromotion,
+            "is_holiday": is_holiday
+        })
+    except asyncio.QueueFull as e:
+        raise HTTPException(status_code = 503, detail = str(e))
+    except Exception as e:
+        logging.info(CustomException(e))
+        print(CustomException(e))
+        response = None
+
     return response
+
+@app.post("/batch")
+async def get_batch_forecasts(params: Batch_params):
+    """
+    This endpoint returns forecasts for many series in one call. Series with the same horizon are forecasted together
+    in a single pass of the LightGBM Model.
+
+    ***Parameters***
+    A JSON object with a single key:
+    - requests: list[object] -> A list of JSON objects, each with the same fields as the ones accepted by the "/" endpoint
+
+    ***API Response***
+    A JSON object of equal length arrays, with one position per supplied request :
+    - store_nbr, family, horizon: The series and horizon of each request
+    - forecasts: The forecasted sales of each request, or null if it could not be forecasted
+    - errors: The reason a request could not be forecasted, or null if it succeeded
+    """
+    requests = [
+        {
+            "store_nbr": request.store_nbr,
+            "family": request.family,
+            "horizon": request.horizon,
+            "onpromotion": request.onpromotion,
+            "is_holiday": request.is_holiday
+        }
+        for request in params.requests
+    ]
+
+    response = await run_in_threadpool(pipeline_obj.produce_batch_forecasts, requests = requests)
+
+    return response
+
+@app.get("/models")
+async def get_model_report():
+    """
+    This endpoint reports the version of the artifacts being served along with the load time and memory footprint of each artifact.
+    """
+    return model_registry.report()
+
+@app.get("/metrics/cache")
+async def get_cache_metrics():
+    """
+    This endpoint reports the size of the forecast cache along with its hit, miss, eviction, expiry and invalidation counters.
+    """
+    return forecast_cache.metrics()
+
+@app.get("/metrics/scheduler")
+async def get_scheduler_metrics():
+    """
+    This endpoint reports the queue depth of the forecast scheduler along with its batch sizes and queueing delays.
+    """
+    return forecast_scheduler.stats()
+
+@app.get("/metrics/drift")
+async def get_drift_metrics(window: str = "requests"):
+    """
+    This endpoint reports the drift of the sales and covariates against the training reference, per feature and for the most drifted series,
+    for the covariates of the forecast requests (window=requests) or the dates added to the training data (window=data).
+    """
+    if window not in ("data", "requests"):
+        raise HTTPException(status_code = 422, detail = "window must be data or requests")
+    drift_monitor.reload_if_changed()
+    return drift_monitor.scores(window)
+
+@app.get("/metrics", response_class = PlainTextResponse)
+async def get_metrics():
+    """
+    This endpoint exposes the request and span latency histograms together with the cache and scheduler counters in the Prometheus text format.
+    """
+    return metrics_registry.render()
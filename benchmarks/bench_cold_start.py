@@ -0,0 +1,115 @@
+"""
+Benchmark of the cold start of the serving entry points on the artifacts in ./artifacts. Every run starts a fresh
+uvicorn process and reports the time until the port answers and until the first forecast is returned, along with
+the import time of the entry point in a fresh interpreter and the heavy modules the import pulls in.
+
+    python -m benchmarks.bench_cold_start --entries app serving --repeats 3
+"""
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+
+HEAVY_MODULES = ("darts", "pandas", "scipy", "sklearn", "lightgbm", "joblib", "torch")
+
+
+def import_profile(entry):
+    code = (
+        "import time, sys, json; start = time.perf_counter(); import " + entry + "; "
+        "print(json.dumps({'seconds': time.perf_counter() - start, "
+        f"'modules': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output = True, text = True, check = True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(port, path, payload = None, timeout = 60.0):
+    data = json.dumps(payload).encode() if payload is not None else None
+    http_request = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}",
+        data = data,
+        method = "GET",
+        headers = {"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(http_request, timeout = timeout) as response:
+        return response.status, json.loads(response.read())
+
+
+def cold_start(entry, payload, timeout):
+
+    """
+    This function is responsible for starting the entry point in a new server process and timing it until it
+    accepts connections and until it returns its first forecast
+    """
+
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{entry}:app", "--port", str(port), "--log-level", "warning"],
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL
+    )
+    try:
+        port_open = None
+        while time.perf_counter() - start < timeout:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout = 0.1):
+                    port_open = time.perf_counter() - start
+                    break
+            except OSError:
+                time.sleep(0.01)
+        if port_open is None:
+            raise TimeoutError(f"{entry} did not open its port within {timeout}s")
+
+        status, forecast = request(port, "/", payload, timeout = timeout)
+        first_forecast = time.perf_counter() - start
+        if status != 200 or not isinstance(forecast, list):
+            raise RuntimeError(f"{entry} answered its first request with {forecast}")
+        return port_open, first_forecast
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Cold start benchmark of the serving entry points")
+    parser.add_argument("--entries", nargs = "+", default = ["app", "serving"])
+    parser.add_argument("--repeats", type = int, default = 3)
+    parser.add_argument("--store-nbr", type = int, default = 1)
+    parser.add_argument("--family", default = "AUTOMOTIVE")
+    parser.add_argument("--horizon", type = int, default = 15)
+    parser.add_argument("--timeout", type = float, default = 120.0)
+    args = parser.parse_args()
+
+    payload = {
+        "store_nbr": args.store_nbr,
+        "family": args.family,
+        "horizon": args.horizon,
+        "onpromotion": [0] * args.horizon,
+        "is_holiday": [0] * args.horizon
+    }
+
+    print(f"{'entry':<10} {'import s':>9} {'port open s':>12} {'first forecast s':>17}  heavy modules imported")
+    for entry in args.entries:
+        imports = [import_profile(entry) for _ in range(args.repeats)]
+        starts = [cold_start(entry, payload, args.timeout) for _ in range(args.repeats)]
+        print(
+            f"{entry:<10} {np.median([profile['seconds'] for profile in imports]):>9.3f} "
+            f"{np.median([port_open for port_open, _ in starts]):>12.3f} "
+            f"{np.median([first_forecast for _, first_forecast in starts]):>17.3f}  {', '.join(imports[0]['modules']) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark of the vectorised Hampel filter used by DataTransformation against the per-series hampel package.
+Parity of the two is covered by tests/test_outlier_filter.py.
+
+    python -m benchmarks.bench_hampel --records 1684 --series 1782
+"""
+from src.utils.outlier_filter import hampel_filter
+from hampel import hampel
+import argparse
+import time
+import numpy as np
+
+
+def synthetic_sales(records, series, seed):
+    rng = np.random.default_rng(seed)
+    sales = rng.gamma(2.0, 40.0, size = (records, series)).round(2)
+    sales[rng.random(sales.shape) < 0.02] *= 30
+    sales[:, : max(1, series // 50)] = 0.0
+    return sales
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Hampel filter benchmark")
+    parser.add_argument("--records", type = int, default = 1684)
+    parser.add_argument("--series", type = int, default = 1782)
+    parser.add_argument("--window-size", type = int, default = 7)
+    parser.add_argument("--n-sigma", type = float, default = 3.0)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    sales = synthetic_sales(args.records, args.series, args.seed)
+
+    start = time.perf_counter()
+    reference = np.stack([
+        hampel(sales[:, column], window_size = args.window_size, n_sigma = args.n_sigma).filtered_data
+        for column in range(sales.shape[1])
+    ], axis = 1)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    filtered = hampel_filter(sales, window_size = args.window_size, n_sigma = args.n_sigma)
+    vectorised_seconds = time.perf_counter() - start
+
+    print(f"records x series      : {args.records} x {args.series}")
+    print(f"outliers replaced     : {int((filtered != sales.astype(np.float32)).sum())}")
+    print(f"hampel package        : {reference_seconds:.3f}s")
+    print(f"vectorised filter     : {vectorised_seconds:.3f}s")
+    print(f"speed-up              : {reference_seconds / vectorised_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the booster-level FastForecaster against LightGBMModel.predict on the artifacts in ./artifacts.
+Parity of the two engines is covered by tests/test_fast_inference.py.
+
+    python -m benchmarks.bench_inference --series 64 --horizons 1 7 30 --repeats 20
+"""
+from src.utils import generate_covariates
+from src.utils.model_registry import ModelRegistry, ModelRegistryConfig
+import argparse
+import time
+import numpy as np
+
+
+def darts_forecast(artifacts, series_names, horizon, onpromotion, is_holiday):
+    covariate = generate_covariates(
+        horizon = horizon,
+        onpromotion = onpromotion,
+        oil_forecasts = list(artifacts.oil_forecasts),
+        is_holiday = is_holiday,
+        trained_last_date = artifacts.trained_last_date
+    )
+    predictions = artifacts.trained_model.predict(
+        n = horizon,
+        series = [artifacts.timeseries_data[series_name] for series_name in series_names],
+        past_covariates = [artifacts.covariates[series_name].append(covariate) for series_name in series_names]
+    )
+    return np.stack([prediction.values(copy = False)[:, 0] for prediction in predictions])
+
+
+def fast_forecast(artifacts, series_names, horizon, onpromotion, is_holiday):
+    forecaster = artifacts.fast_forecaster
+    rows = forecaster.covariate_rows({
+        "onpromotion": onpromotion,
+        "dcoilwtico": artifacts.oil_forecasts,
+        "is_holiday": is_holiday
+    }, n = horizon)
+    return forecaster.predict(series_names, np.repeat(rows[np.newaxis], len(series_names), axis = 0))
+
+
+def timed(function, repeats, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Fast inference benchmark")
+    parser.add_argument("--series", type = int, default = 64)
+    parser.add_argument("--horizons", type = int, nargs = "+", default = [1, 7, 30])
+    parser.add_argument("--repeats", type = int, default = 20)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    artifacts = ModelRegistry(ModelRegistryConfig(inference_engine = "fast", track_memory = False)).load()
+    if artifacts.fast_forecaster is None:
+        raise SystemExit("the trained model cannot be served by the fast forecaster, see the logs for the reason")
+
+    rng = np.random.default_rng(args.seed)
+    keys = list(artifacts.fast_forecaster.keys_index)
+    series_names = [keys[i] for i in rng.choice(len(keys), size = min(args.series, len(keys)), replace = False)]
+
+    print(f"{'horizon':>7} {'series':>6} {'darts 1 ms':>10} {'fast 1 ms':>9} {'darts batch ms':>14} {'fast batch ms':>13}")
+    for horizon in args.horizons:
+        onpromotion = rng.integers(0, 20, size = horizon).tolist()
+        is_holiday = rng.integers(0, 2, size = horizon).tolist()
+
+        inputs = (artifacts, series_names[:1], horizon, onpromotion, is_holiday)
+        batch_inputs = (artifacts, series_names, horizon, onpromotion, is_holiday)
+        print(
+            f"{horizon:>7} {len(series_names):>6}"
+            f" {timed(darts_forecast, args.repeats, *inputs):>10.2f} {timed(fast_forecast, args.repeats, *inputs):>9.2f}"
+            f" {timed(darts_forecast, args.repeats, *batch_inputs):>14.2f} {timed(fast_forecast, args.repeats, *batch_inputs):>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
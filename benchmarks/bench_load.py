@@ -0,0 +1,252 @@
+"""
+Load test of the forecast endpoint. Requests are driven through the ASGI app in-process with httpx, or against a
+running server with --url, by a closed loop of concurrent clients. Payloads are drawn over the series keys of the
+served artifacts, with promotions and holidays copied from a random window of each series' own history. Every
+combination of concurrency level and horizon mix is run in turn, and latency percentiles, throughput and error
+rates are written to a JSON report that the next run can be compared against.
+
+    python -m benchmarks.bench_load --concurrency 1 8 32 --mixes short mixed long --requests 500 --output load.json
+    python -m benchmarks.bench_load --entry serving --baseline load.json --fail-on-regression
+    python -m benchmarks.bench_load --url http://127.0.0.1:8000 --concurrency 16 64
+"""
+from src.utils.covariate_store import CovariateStore
+from src.utils.model_registry import ModelRegistryConfig
+import importlib
+import argparse
+import asyncio
+import ast
+import json
+import os
+import platform
+import subprocess
+import time
+import httpx
+import numpy as np
+
+# share of the requests asking for each horizon
+HORIZON_MIXES = {
+    "short": {1: 0.5, 7: 0.5},
+    "mixed": {1: 0.25, 7: 0.25, 15: 0.25, 30: 0.25},
+    "long": {30: 1.0}
+}
+
+
+class PayloadGenerator:
+    """
+    Draws Covariate_params payloads over the keys of the series in the covariate store, with the promotions and
+    holidays of a random window of the series' last history_days dates
+    """
+
+    def __init__(self, covariates_path:str, history_days:int = 365, seed:int = 0):
+        covariates = CovariateStore.load(covariates_path)
+        self.series_keys = list(covariates.keys_index)
+        self.onpromotion = covariates.series_values[:, -history_days:, covariates.series_features.index("onpromotion")]
+        self.is_holiday = covariates.series_values[:, -history_days:, covariates.series_features.index("is_holiday")]
+        self.rng = np.random.default_rng(seed)
+
+    def payload(self, horizon:int) -> dict:
+        position = int(self.rng.integers(len(self.series_keys)))
+        start = int(self.rng.integers(self.onpromotion.shape[1] - horizon + 1))
+        store_nbr, family = ast.literal_eval(self.series_keys[position])
+        return {
+            "store_nbr": store_nbr,
+            "family": family,
+            "horizon": horizon,
+            "onpromotion": [int(value) for value in self.onpromotion[position, start:start + horizon]],
+            "is_holiday": [int(value) for value in self.is_holiday[position, start:start + horizon]]
+        }
+
+    def payloads(self, mix:dict, n:int) -> list:
+        horizons = self.rng.choice(list(mix), size = n, p = np.array(list(mix.values())) / sum(mix.values()))
+        return [self.payload(int(horizon)) for horizon in horizons]
+
+
+def is_forecast(body, horizon:int) -> bool:
+    # the endpoint answers 200 with a message or null when a forecast fails
+    return isinstance(body, list) and len(body) == horizon and all(isinstance(value, (int, float)) for value in body)
+
+
+async def run_level(client:httpx.AsyncClient, payloads:list, concurrency:int, timeout:float) -> dict:
+
+    """
+    This function is responsible for sending the payloads from concurrency clients, each sending its next request as
+    soon as the previous one is answered, and summarising the latencies and outcomes
+    """
+
+    latencies = np.empty(len(payloads))
+    outcomes = [None] * len(payloads)
+    next_index = iter(range(len(payloads)))
+
+    async def client_loop():
+        for index in next_index:
+            payload = payloads[index]
+            start = time.perf_counter()
+            try:
+                response = await client.request("GET", "/", json = payload, timeout = timeout)
+                outcome = str(response.status_code) if response.status_code != 200 else (
+                    "ok" if is_forecast(response.json(), payload["horizon"]) else "invalid_forecast"
+                )
+            except httpx.TimeoutException:
+                outcome = "timeout"
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            latencies[index] = time.perf_counter() - start
+            outcomes[index] = outcome
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+
+    ok = np.array([outcome == "ok" for outcome in outcomes])
+    ok_latencies = latencies[ok] * 1000 if ok.any() else np.array([np.nan])
+    counts = {outcome: outcomes.count(outcome) for outcome in sorted(set(outcomes))}
+    return {
+        "requests": len(payloads),
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(ok.sum() / seconds, 2),
+        "error_rate": round(1 - ok.mean(), 4),
+        "outcomes": counts,
+        "p50_ms": round(float(np.percentile(ok_latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(ok_latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(ok_latencies, 99)), 2),
+        "mean_ms": round(float(np.mean(ok_latencies)), 2),
+        "max_ms": round(float(np.max(ok_latencies)), 2)
+    }
+
+
+async def run_sweep(args, generator:PayloadGenerator):
+
+    """
+    This function is responsible for running every mix at every concurrency level against the app in-process, with
+    its startup and shutdown events, or against the server at args.url
+    """
+
+    if args.url:
+        client = httpx.AsyncClient(base_url = args.url)
+        lifespan = None
+    else:
+        app = importlib.import_module(args.entry).app
+        client = httpx.AsyncClient(transport = httpx.ASGITransport(app = app), base_url = "http://loadtest")
+        lifespan = app.router.lifespan_context(app)
+
+    results = []
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            if args.entry == "serving" and not args.url:
+                # the slim entry point loads its artifacts in the background, the sweep starts once they are served
+                while (await client.get("/ready")).status_code != 200:
+                    await asyncio.sleep(0.1)
+            models = (await client.get("/models")).json()
+
+            for mix in args.mixes:
+                for concurrency in args.concurrency:
+                    await run_level(client, generator.payloads(HORIZON_MIXES[mix], args.warm_up), concurrency, args.timeout)
+                    row = {
+                        "mix": mix,
+                        "concurrency": concurrency,
+                        **await run_level(client, generator.payloads(HORIZON_MIXES[mix], args.requests), concurrency, args.timeout)
+                    }
+                    results.append(row)
+                    print(
+                        f"{mix:<8} {concurrency:>11} {row['throughput_rps']:>9.1f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                        f"{row['p99_ms']:>9.2f} {row['error_rate']:>7.2%}"
+                    )
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+    return results, models
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output = True,
+            text = True,
+            check = True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+
+    """
+    This function is responsible for flagging the runs whose p95 latency or throughput got worse than the baseline
+    run of the same mix and concurrency by more than the tolerance, or whose error rate went up
+    """
+
+    reference = {(row["mix"], row["concurrency"]): row for row in baseline}
+    regressions = []
+    for row in results:
+        previous = reference.get((row["mix"], row["concurrency"]))
+        if previous is None:
+            continue
+        row["baseline_p95_ms"] = previous["p95_ms"]
+        row["baseline_throughput_rps"] = previous["throughput_rps"]
+        name = f"{row['mix']} x{row['concurrency']}"
+        if row["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name} p95: {previous['p95_ms']}ms -> {row['p95_ms']}ms")
+        if row["throughput_rps"] < previous["throughput_rps"] / (1 + tolerance):
+            regressions.append(f"{name} throughput: {previous['throughput_rps']}/s -> {row['throughput_rps']}/s")
+        if row["error_rate"] > previous["error_rate"]:
+            regressions.append(f"{name} error rate: {previous['error_rate']:.2%} -> {row['error_rate']:.2%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Load test of the forecast endpoint over concurrency levels and horizon mixes")
+    parser.add_argument("--entry", default = "app", choices = ["app", "serving"], help = "module of the ASGI app driven in-process")
+    parser.add_argument("--url", help = "load a running server instead of the app in-process")
+    parser.add_argument("--concurrency", nargs = "+", type = int, default = [1, 8, 32])
+    parser.add_argument("--mixes", nargs = "+", choices = list(HORIZON_MIXES), default = list(HORIZON_MIXES))
+    parser.add_argument("--requests", type = int, default = 500, help = "requests per concurrency level and mix")
+    parser.add_argument("--warm-up", type = int, default = 20, help = "requests sent and left out before every run")
+    parser.add_argument("--timeout", type = float, default = 30.0)
+    parser.add_argument("--covariates", default = ModelRegistryConfig.covariates_path, help = "covariate store the payloads are drawn from")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--output", help = "write the report of this run to a JSON file")
+    parser.add_argument("--baseline", help = "report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type = float, default = 0.25, help = "relative worsening over the baseline reported as a regression")
+    parser.add_argument("--fail-on-regression", action = "store_true")
+    args = parser.parse_args()
+
+    generator = PayloadGenerator(args.covariates, seed = args.seed)
+    print(f"{'mix':<8} {'concurrency':>11} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    results, models = asyncio.run(run_sweep(args, generator))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.tolerance)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "target": args.url or args.entry,
+        "git_revision": git_revision(),
+        "artifacts_version": models.get("version"),
+        "inference_engine": models.get("inference_engine", models.get("source")),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "series": len(generator.series_keys),
+        "requests_per_run": args.requests,
+        "seed": args.seed,
+        "results": results,
+        "regressions": regressions
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent = 2)
+        print(f"results written to {args.output}")
+
+    if regressions:
+        print("regressions over the baseline:\n" + "\n".join(regressions))
+        if args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Benchmark of the training stages and the serving path on synthetic data at several scales. Each scale runs in a
+fresh process and working directory, every stage from integrate_data onwards is timed with its peak resident memory
+sampled, and the results are compared against a stored baseline to flag regressions.
+
+    python -m benchmarks.bench_pipeline --scales 4x3x400 8x6x600 16x12x800 --save-baseline
+    python -m benchmarks.bench_pipeline --scales 4x3x400 8x6x600 16x12x800 --fail-on-regression
+"""
+from benchmarks.synthetic_data import write
+from src.utils.instrumentation import MemorySampler, current_rss
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import ast
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+
+MB = 1024 * 1024
+
+
+def measure(function, *args, **kwargs):
+    sampler = MemorySampler(interval = 0.02)
+    sampler.start()
+    rss_start = current_rss()
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        peak = sampler.stop()
+    return result, {"seconds": round(seconds, 4), "peak_mb": round(peak / MB, 1), "delta_mb": round((peak - rss_start) / MB, 1)}
+
+
+def run_scale(scale, number_of_test_days, horizon, repeats, backtest, seed):
+
+    """
+    This function is responsible for running the pipeline stages and the serving path on one scale of synthetic data,
+    inside a temporary working directory so the artifacts of the repository are left alone
+    """
+
+    n_stores, n_families, n_days = (int(part) for part in scale.split("x"))
+    workdir = tempfile.mkdtemp(prefix = f"bench-{scale}-")
+    os.chdir(workdir)
+    try:
+        from src.pipelines.train_pipeline import build_stages
+        from src.pipelines.prediction_pipeline import PredictionPipeline
+        from src.utils.model_registry import ModelRegistry, ModelRegistryConfig
+
+        rows = []
+        _, row = measure(write, "artifacts", n_stores = n_stores, n_families = n_families, n_days = n_days, seed = seed)
+        rows.append({"stage": "generate_data", **row})
+
+        # data_ingestion needs the database, the synthetic data replaces its outputs
+        for stage in build_stages(number_of_test_days = number_of_test_days, backtest = backtest)[1:]:
+            started_at = time.time()
+            _, row = measure(stage.run)
+            missing = [path for path in stage.outputs if not os.path.exists(path) or os.path.getmtime(path) < started_at - 1]
+            if missing:
+                raise RuntimeError(f"stage {stage.name} did not write {missing} at scale {scale}")
+            rows.append({"stage": stage.name, **row})
+
+        registry = ModelRegistry(ModelRegistryConfig(track_memory = False))
+        artifacts, row = measure(registry.load)
+        rows.append({"stage": "serving.load", **row})
+
+        pipeline = PredictionPipeline(registry = registry, cache = None)
+        requests = [
+            {
+                "store_nbr": store_nbr,
+                "family": family,
+                "horizon": horizon,
+                "onpromotion": [1] * horizon,
+                "is_holiday": [0] * horizon
+            }
+            for store_nbr, family in (ast.literal_eval(str(component)) for component in artifacts.timeseries_data.components)
+        ]
+
+        for name, function in (
+            ("serving.single", lambda: pipeline.produce_forecasts(**requests[0])),
+            ("serving.batch", lambda: pipeline.produce_batch_forecasts(requests))
+        ):
+            timings = [measure(function)[1] for _ in range(repeats)]
+            rows.append({
+                "stage": name,
+                "seconds": round(float(np.median([timing["seconds"] for timing in timings])), 4),
+                "peak_mb": max(timing["peak_mb"] for timing in timings),
+                "delta_mb": max(timing["delta_mb"] for timing in timings)
+            })
+
+        return [{"scale": scale, "series": n_stores * n_families, "days": n_days, **row} for row in rows]
+    finally:
+        shutil.rmtree(workdir, ignore_errors = True)
+
+
+def compare(results, baseline, tolerance, noise_seconds):
+
+    """
+    This function is responsible for flagging the stages whose time or peak memory grew beyond the tolerance over the baseline
+    """
+
+    reference = {(row["scale"], row["stage"]): row for row in baseline}
+    regressions = []
+    for row in results:
+        previous = reference.get((row["scale"], row["stage"]))
+        if previous is None:
+            continue
+        row["baseline_seconds"] = previous["seconds"]
+        row["time_ratio"] = round(row["seconds"] / previous["seconds"], 2) if previous["seconds"] else None
+        # sub-noise stages are too jittery to compare on their ratio alone
+        if row["seconds"] - previous["seconds"] > noise_seconds and row["seconds"] > previous["seconds"] * (1 + tolerance):
+            regressions.append(f"{row['scale']} {row['stage']}: {previous['seconds']}s -> {row['seconds']}s")
+        if row["delta_mb"] - previous["delta_mb"] > 16 and row["delta_mb"] > previous["delta_mb"] * (1 + tolerance):
+            regressions.append(f"{row['scale']} {row['stage']}: {previous['delta_mb']}MB -> {row['delta_mb']}MB")
+    return regressions
+
+
+def scaling_exponents(results):
+
+    """
+    This function is responsible for estimating how each stage's time grows with the number of records, as the slope
+    of log time against log records between the smallest and largest scales
+    """
+
+    exponents = {}
+    for stage in dict.fromkeys(row["stage"] for row in results):
+        rows = [row for row in results if row["stage"] == stage]
+        if len(rows) < 2:
+            continue
+        first, last = rows[0], rows[-1]
+        records = (last["series"] * last["days"]) / (first["series"] * first["days"])
+        if records > 1 and first["seconds"] > 0 and last["seconds"] > 0:
+            exponents[stage] = round(math.log(last["seconds"] / first["seconds"]) / math.log(records), 2)
+    return exponents
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Pipeline and serving benchmark on synthetic data at several scales")
+    parser.add_argument("--scales", nargs = "+", default = ["4x3x400", "8x6x600", "16x12x800"], metavar = "STORESxFAMILIESxDAYS")
+    parser.add_argument("--number-of-test-days", type = int, default = 15)
+    parser.add_argument("--horizon", type = int, default = 15)
+    parser.add_argument("--repeats", type = int, default = 5)
+    parser.add_argument("--backtest", action = "store_true")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--baseline", default = os.path.join("benchmarks", "baseline.json"))
+    parser.add_argument("--save-baseline", action = "store_true")
+    parser.add_argument("--output", help = "also write the results of this run to a JSON file")
+    parser.add_argument("--tolerance", type = float, default = 0.25, help = "relative growth over the baseline reported as a regression")
+    parser.add_argument("--noise-seconds", type = float, default = 0.05)
+    parser.add_argument("--fail-on-regression", action = "store_true")
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        # a fresh process per scale keeps the peak memory of one scale out of the next
+        with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context("spawn")) as executor:
+            results.extend(executor.submit(
+                run_scale,
+                scale,
+                args.number_of_test_days,
+                args.horizon,
+                args.repeats,
+                args.backtest,
+                args.seed
+            ).result())
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.tolerance, args.noise_seconds)
+
+    print(f"{'scale':<12} {'stage':<16} {'seconds':>9} {'peak MB':>9} {'delta MB':>9} {'baseline':>9} {'ratio':>6}")
+    for row in results:
+        print(
+            f"{row['scale']:<12} {row['stage']:<16} {row['seconds']:>9.3f} {row['peak_mb']:>9.1f} {row['delta_mb']:>9.1f} "
+            f"{row.get('baseline_seconds', float('nan')):>9.3f} {row.get('time_ratio') or float('nan'):>6.2f}"
+        )
+    exponents = scaling_exponents(results)
+    if exponents:
+        print("time ~ records^k: " + ", ".join(f"{stage} {exponent}" for stage, exponent in exponents.items()))
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cpu_count": os.cpu_count(),
+        "scales": args.scales,
+        "results": results,
+        "scaling_exponents": exponents,
+        "regressions": regressions
+    }
+    for path in ([args.baseline] if args.save_baseline else []) + ([args.output] if args.output else []):
+        with open(path, "w") as file:
+            json.dump(report, file, indent = 2)
+        print(f"results written to {path}")
+
+    if regressions:
+        print("regressions over the baseline:\n" + "\n".join(regressions))
+        if args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark of the memory used by several serving workers on the artifacts in ./artifacts. Workers are forked the
+way gunicorn forks them and each forecasts every series before reporting its proportional set size (PSS), which
+splits shared pages between the processes sharing them, so the sum over workers is the RAM the pool really uses.
+
+    independent   every worker loads its own artifacts after the fork, as with uvicorn --workers
+    preload       the parent loads the artifacts and the workers share them copy-on-write
+    preload-mmap  as preload, with the training series memory-mapped from the page cache
+
+    python -m benchmarks.bench_shared_memory --workers 4 --horizon 15
+"""
+from src.utils.model_registry import ModelRegistry, ModelRegistryConfig
+from src.pipelines.prediction_pipeline import PredictionPipeline
+import multiprocessing
+import argparse
+import ast
+import gc
+
+MB = 1024 * 1024
+MODES = ("independent", "preload", "preload-mmap")
+
+
+def memory_usage():
+    usage = {}
+    with open("/proc/self/smaps_rollup") as file:
+        for line in file:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                usage[parts[0][:-1].lower()] = int(parts[1]) * 1024
+    return usage
+
+
+def serve(registry, horizon, results, done):
+    pipeline = PredictionPipeline(registry = registry, cache = None)
+    artifacts = registry.get()
+    requests = [
+        {"store_nbr": store_nbr, "family": family, "horizon": horizon, "onpromotion": [1] * horizon, "is_holiday": [0] * horizon}
+        for store_nbr, family in (ast.literal_eval(str(component)) for component in artifacts.timeseries_data.components)
+    ]
+    pipeline.produce_batch_forecasts(requests)
+    results.put(memory_usage())
+    # every worker stays alive until all of them reported, so shared pages are split between all of them
+    done.wait()
+
+
+def run_mode(mode, workers, horizon):
+    context = multiprocessing.get_context("fork")
+    registry = ModelRegistry(ModelRegistryConfig(track_memory = False, memory_map = mode == "preload-mmap", reload_check_interval = -1))
+    if mode != "independent":
+        registry.load()
+        gc.freeze()
+
+    results = context.Queue()
+    done = context.Event()
+    processes = [context.Process(target = serve, args = (registry, horizon, results, done)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    usages = [results.get() for _ in processes]
+    done.set()
+    for process in processes:
+        process.join()
+    gc.unfreeze()
+
+    return {
+        "pss_mb": sum(usage["pss"] for usage in usages) / MB,
+        "private_mb": sum(usage["private_clean"] + usage["private_dirty"] for usage in usages) / MB,
+        "rss_mb": sum(usage["rss"] for usage in usages) / MB
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Memory used by forked serving workers with and without shared artifacts")
+    parser.add_argument("--workers", type = int, default = 4)
+    parser.add_argument("--horizon", type = int, default = 15)
+    parser.add_argument("--modes", nargs = "+", choices = MODES, default = list(MODES))
+    args = parser.parse_args()
+
+    print(f"{'mode':<14} {'workers':>7} {'total PSS MB':>13} {'private MB':>11} {'PSS/worker':>11}")
+    for mode in args.modes:
+        usage = run_mode(mode, args.workers, args.horizon)
+        print(f"{mode:<14} {args.workers:>7} {usage['pss_mb']:>13.1f} {usage['private_mb']:>11.1f} {usage['pss_mb'] / args.workers:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
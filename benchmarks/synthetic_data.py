@@ -0,0 +1,119 @@
+"""
+Generator of synthetic store-sales inputs shaped like the collections loaded by DataIngestion, at a configurable
+number of stores, product families and days. Writes raw_data, oil, stores and holidays artifacts that the training
+pipeline can run on from integrate_data onwards.
+
+    python -m benchmarks.synthetic_data --stores 54 --families 33 --days 1684 --output artifacts
+"""
+from src.utils.artifact_store import ArtifactStore
+from src.components.data_ingestion import DataIngestionConfig
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+FAMILIES = (
+    "AUTOMOTIVE", "BABY CARE", "BEAUTY", "BEVERAGES", "BOOKS", "BREAD/BAKERY", "CELEBRATION", "CLEANING", "DAIRY",
+    "DELI", "EGGS", "FROZEN FOODS", "GROCERY I", "GROCERY II", "HARDWARE", "HOME AND KITCHEN I", "HOME AND KITCHEN II",
+    "HOME APPLIANCES", "HOME CARE", "LADIESWEAR", "LAWN AND GARDEN", "LINGERIE", "LIQUOR,WINE,BEER", "MAGAZINES",
+    "MEATS", "PERSONAL CARE", "PET SUPPLIES", "PLAYERS AND ELECTRONICS", "POULTRY", "PREPARED FOODS", "PRODUCE",
+    "SCHOOL AND OFFICE SUPPLIES", "SEAFOOD"
+)
+LOCATIONS = (("Quito", "Pichincha"), ("Guayaquil", "Guayas"), ("Cuenca", "Azuay"), ("Ambato", "Tungurahua"), ("Manta", "Manabi"))
+
+
+def generate(n_stores = 54, n_families = 33, n_days = 1684, start = "2013-01-01", seed = 0):
+
+    """
+    This function is responsible for generating the sales, oil, stores and holidays frames. Sales follow a weekly
+    season and a slow trend per series with occasional spikes, the oil price is a random walk with weekend and
+    random gaps, and Christmas day is missing from the sales as in the original dataset.
+    """
+
+    rng = np.random.default_rng(seed)
+    families = list(FAMILIES[:n_families]) + [f"FAMILY {number}" for number in range(len(FAMILIES) + 1, n_families + 1)]
+
+    # the sales have no records on Christmas, so extra dates are generated to keep n_days of history
+    dates = pd.date_range(start, periods = n_days + n_days // 365 + 1)
+    dates = dates[~((dates.month == 12) & (dates.day == 25))][:n_days]
+
+    locations = rng.integers(0, len(LOCATIONS), n_stores)
+    stores = pd.DataFrame({
+        "store_nbr": np.arange(1, n_stores + 1),
+        "city": [LOCATIONS[location][0] for location in locations],
+        "state": [LOCATIONS[location][1] for location in locations],
+        "type": rng.choice(list("ABCDE"), n_stores),
+        "cluster": rng.integers(1, 18, n_stores)
+    })
+
+    n_series = n_stores * n_families
+    level = rng.gamma(1.5, 60.0, n_series)
+    weekly = 1.0 + 0.3 * np.sin(2 * np.pi * (np.arange(len(dates))[:, np.newaxis] + rng.integers(0, 7, n_series)) / 7)
+    trend = 1.0 + np.linspace(0.0, 1.0, len(dates))[:, np.newaxis] * rng.normal(0.2, 0.1, n_series)
+    sales = level * weekly * trend * rng.gamma(8.0, 1 / 8.0, (len(dates), n_series))
+    sales[rng.random(sales.shape) < 0.005] *= 15
+    sales[:, rng.random(n_series) < 0.03] = 0.0
+
+    raw_data = pd.DataFrame({
+        "id": np.arange(len(dates) * n_series),
+        "date": np.repeat(dates.strftime("%Y-%m-%d"), n_series),
+        "store_nbr": np.tile(np.repeat(stores["store_nbr"].to_numpy(), n_families), len(dates)),
+        "family": np.tile(families, len(dates) * n_stores),
+        "sales": sales.reshape(-1).round(3),
+        "onpromotion": rng.poisson(2.0, len(dates) * n_series)
+    })
+
+    oil_dates = pd.date_range(dates[0], dates[-1])
+    oil_dates = oil_dates[oil_dates.dayofweek < 5]
+    oil = pd.DataFrame({
+        "date": oil_dates.strftime("%Y-%m-%d"),
+        "dcoilwtico": (90 + np.cumsum(rng.normal(0.0, 0.8, len(oil_dates)))).clip(20, None).round(2)
+    })
+    oil.loc[rng.random(len(oil)) < 0.03, "dcoilwtico"] = np.nan
+
+    n_holidays = max(10, len(dates) // 20)
+    locales = rng.choice(["National", "Regional", "Local"], n_holidays, p = [0.6, 0.1, 0.3])
+    places = [LOCATIONS[location] for location in rng.integers(0, len(LOCATIONS), n_holidays)]
+    holidays = pd.DataFrame({
+        "date": rng.choice(dates.strftime("%Y-%m-%d"), n_holidays),
+        "type": rng.choice(["Holiday", "Work Day", "Additional", "Transfer", "Bridge", "Event"], n_holidays),
+        "locale": locales,
+        "locale_name": [
+            "Ecuador" if locale == "National" else place[1] if locale == "Regional" else place[0]
+            for locale, place in zip(locales, places)
+        ],
+        "description": "synthetic holiday",
+        "transferred": rng.random(n_holidays) < 0.1
+    })
+
+    return raw_data, oil, stores, holidays
+
+
+def write(directory = "artifacts", **kwargs):
+
+    """
+    This function is responsible for writing the generated frames to the artifact paths DataIngestion writes to, under directory
+    """
+
+    config = DataIngestionConfig()
+    artifactstore = ArtifactStore()
+    for frame, path in zip(generate(**kwargs), (config.raw_data, config.oil, config.stores, config.holidays)):
+        artifactstore.save(frame, os.path.join(directory, os.path.basename(path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Synthetic store-sales data generator")
+    parser.add_argument("--stores", type = int, default = 54)
+    parser.add_argument("--families", type = int, default = 33)
+    parser.add_argument("--days", type = int, default = 1684)
+    parser.add_argument("--start", default = "2013-01-01")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--output", default = "artifacts")
+    args = parser.parse_args()
+
+    write(args.output, n_stores = args.stores, n_families = args.families, n_days = args.days, start = args.start, seed = args.seed)
+    print(f"wrote {args.stores * args.families} series over {args.days} days to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
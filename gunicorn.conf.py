@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for serving the API with several uvicorn workers that share one copy of the artifacts.
+The models and series are loaded in the parent process before the workers are forked, so their memory is
+shared copy-on-write, and the training series are memory-mapped so their pages are shared through the page
+cache even after a worker reloads newer artifacts.
+
+    gunicorn app:app -c gunicorn.conf.py
+"""
+import gc
+import multiprocessing
+import os
+
+# read by the model registry when the app is preloaded below
+os.environ.setdefault("SERVING_MEMORY_MAP", "1")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    from src.utils.model_registry import model_registry
+
+    # the oil forecasts are cached at training time, so loading normally starts no LightGBM threads in the parent
+    model_registry.load()
+    # keeps the garbage collector of the workers from writing to, and so copying, the pages of the preloaded objects
+    gc.freeze()
+    server.log.info(f"preloaded artifacts version {model_registry.get().version} for {server.cfg.workers} workers")
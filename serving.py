@@ -0,0 +1,149 @@
+"""
+Slim serving entry point with the API of app.py for containers that need to start fast. Importing it loads
+nothing heavier than FastAPI and numpy, the port opens at once, and the inference bundle is loaded together
+with LightGBM on a background thread. Requests arriving during the warm-up wait for it to finish. Without an
+up-to-date bundle, the warm-up falls back to the full Darts artifacts.
+
+    uvicorn serving:app --host 0.0.0.0 --port 8000
+"""
+import time
+import_started = time.perf_counter()
+
+from src.pipelines.forecast_scheduler import ForecastScheduler
+from src.pipelines.prediction_pipeline import PredictionPipeline
+from src.pipelines.request_models import Batch_params, Covariate_params
+from src.utils.drift_monitor import DriftMonitor
+from src.utils.exception import CustomException
+from src.utils.forecast_cache import ForecastCache
+from src.utils.inference_bundle import BundleRegistry
+from src.utils.logger import logging
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import ast
+
+# initialising FastAPI
+app = FastAPI()
+forecast_cache = ForecastCache()
+bundle_registry = BundleRegistry()
+drift_monitor = DriftMonitor()
+pipeline_obj = PredictionPipeline(registry = bundle_registry, cache = forecast_cache, drift_monitor = drift_monitor)
+forecast_scheduler = ForecastScheduler(pipeline = pipeline_obj)
+cold_start = {"import_seconds": round(time.perf_counter() - import_started, 4)}
+warm_up = None
+
+
+def load_and_warm_up():
+
+    """
+    This function is responsible for loading the served artifacts and running one forecast through them, so the
+    first request does not pay for loading LightGBM or paging in the booster
+    """
+
+    start = time.perf_counter()
+    artifacts = bundle_registry.load()
+    cold_start["load_seconds"] = round(time.perf_counter() - start, 4)
+    drift_monitor.load()
+
+    store_nbr, family = ast.literal_eval(next(iter(artifacts.covariates)))
+    PredictionPipeline(registry = bundle_registry).produce_batch_forecasts([
+        {"store_nbr": store_nbr, "family": family, "horizon": 1, "onpromotion": [0], "is_holiday": [0]}
+    ])
+    cold_start["warm_up_seconds"] = round(time.perf_counter() - start, 4)
+    logging.info(f"serving warmed up in {cold_start['warm_up_seconds']}s after importing in {cold_start['import_seconds']}s")
+
+
+async def wait_for_warm_up():
+    try:
+        await asyncio.shield(warm_up)
+    except Exception as e:
+        raise HTTPException(status_code = 503, detail = f"artifacts could not be loaded: {e}")
+
+
+# opening the port straight away and warming up in the background
+@app.on_event("startup")
+async def start_warm_up():
+    global warm_up
+    warm_up = asyncio.get_running_loop().run_in_executor(None, load_and_warm_up)
+    await forecast_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await forecast_scheduler.stop()
+
+@app.get("/")
+async def get_forecasts(params: Covariate_params):
+    """
+    This endpoint returns the forecasts of one series, with the same parameters and response as the "/" endpoint of app.py.
+    """
+    await wait_for_warm_up()
+    try:
+        response = await forecast_scheduler.submit({
+            "store_nbr": params.store_nbr,
+            "family": params.family,
+            "horizon": params.horizon,
+            "onpromotion": params.onpromotion,
+            "is_holiday": params.is_holiday
+        })
+    except asyncio.QueueFull as e:
+        raise HTTPException(status_code = 503, detail = str(e))
+    except Exception as e:
+        logging.info(CustomException(e))
+        print(CustomException(e))
+        response = None
+
+    return response
+
+@app.post("/batch")
+async def get_batch_forecasts(params: Batch_params):
+    """
+    This endpoint returns forecasts for many series in one call, with the same parameters and response as the "/batch" endpoint of app.py.
+    """
+    await wait_for_warm_up()
+    requests = [
+        {
+            "store_nbr": request.store_nbr,
+            "family": request.family,
+            "horizon": request.horizon,
+            "onpromotion": request.onpromotion,
+            "is_holiday": request.is_holiday
+        }
+        for request in params.requests
+    ]
+
+    return await run_in_threadpool(pipeline_obj.produce_batch_forecasts, requests = requests)
+
+@app.get("/health")
+async def get_health():
+    """
+    This endpoint reports that the server is up, whether or not it has warmed up.
+    """
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def get_readiness():
+    """
+    This endpoint reports the import, load and warm-up times of the server, answering 503 until the warm-up has finished.
+    """
+    if warm_up is None or not warm_up.done():
+        raise HTTPException(status_code = 503, detail = {"status": "warming up", **cold_start})
+    if warm_up.exception() is not None:
+        raise HTTPException(status_code = 503, detail = {"status": "failed", "error": str(warm_up.exception()), **cold_start})
+    return {"status": "ready", **cold_start}
+
+@app.get("/metrics/drift")
+async def get_drift_metrics(window: str = "requests"):
+    """
+    This endpoint reports the drift of the sales and covariates against the training reference, as the "/metrics/drift" endpoint of app.py.
+    """
+    if window not in ("data", "requests"):
+        raise HTTPException(status_code = 422, detail = "window must be data or requests")
+    drift_monitor.reload_if_changed()
+    return drift_monitor.scores(window)
+
+@app.get("/models")
+async def get_model_report():
+    """
+    This endpoint reports whether the inference bundle or the full artifacts are served, along with their version.
+    """
+    return bundle_registry.report()
@@ -1,38 +1,153 @@
 from src.utils.exception import CustomException
 from src.utils.logger import logging
-from datetime import datetime, timedelta
+from src.utils.instrumentation import instrument
+from src.utils.artifact_store import ArtifactStore, PartitionedDataset
+from src.utils.covariate_store import CovariateStore
+from src.utils.outlier_filter import hampel_filter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
 from dataclasses import dataclass
-from hampel import hampel
+from functools import partial
 from darts import TimeSeries
 from sklearn.feature_selection import VarianceThreshold
+import ast
 import joblib
-import pandas as pd
+import multiprocessing
 import numpy as np
+import pandas as pd
 import os
+import shutil
 import warnings
 warnings.filterwarnings(action = "ignore")
 
 
 @dataclass
 class DataTransformationConfig:
-    oil:str = os.path.join("artifacts", "oil.csv")
-    data:str = os.path.join("artifacts", "raw_data.csv")
-    stores:str = os.path.join("artifacts", "stores.csv")
-    holidays:str = os.path.join("artifacts", "holidays.csv")
-    processed_data:str = os.path.join("artifacts", "processed_data.csv")
-    train_data:str = os.path.join("artifacts", "train_data.csv")
-    test_data:str = os.path.join("artifacts", "test_data.csv")
+    oil:str = os.path.join("artifacts", "oil.parquet")
+    data:str = os.path.join("artifacts", "raw_data.parquet")
+    stores:str = os.path.join("artifacts", "stores.parquet")
+    holidays:str = os.path.join("artifacts", "holidays.parquet")
+    processed_data:str = os.path.join("artifacts", "processed_data.parquet")
+    train_data:str = os.path.join("artifacts", "train_data.parquet")
+    test_data:str = os.path.join("artifacts", "test_data.parquet")
     test_covariates:str = os.path.join("artifacts", "test_covariates.joblib")
     timeseries_data:str = os.path.join("artifacts", "timeseries_data.joblib")
     testseries_data:str = os.path.join("artifacts", "testseries_data.joblib")
-    covariates:str = os.path.join("artifacts", "covariates.joblib")
+    covariates:str = os.path.join("artifacts", "covariates")
+    hampel_window_size:int = 7
+    hampel_n_sigma:float = 3.0
+    n_workers:int = os.cpu_count() or 1
+    shards_per_worker:int = 4
+    # "partitioned" integrates the raw data one date range at a time into a partitioned dataset
+    integration_mode:str = os.getenv("INTEGRATION_MODE", "full")
+    partition_frequency:str = "M"
+
+
+def fill_oil(oil, dates):
+
+  """
+  Function responsible for adding the dates missing from the oil prices and interpolating their prices
+  """
+
+  missing_dates = pd.DataFrame(dates[~dates.isin(oil.date)].unique())
+  missing_dates.rename(columns={0:"date"}, inplace=True)
+  oil = pd.concat([oil, missing_dates], axis=0).reset_index(drop=True).sort_values(by="date")
+  oil["dcoilwtico"] = oil["dcoilwtico"].interpolate().bfill()
+  return oil
+
+
+def integrate_records(data, oil, stores, holidays):
+
+  """
+  Function responsible for joining the oil prices, store details and holiday flags onto sales records and sorting them by date
+  """
+
+  processed_data = pd.merge(left=data, right=oil, on="date", how="left")
+  processed_data = pd.merge(left = processed_data, right = stores, on = "store_nbr", how = "left")
+  processed_data.rename(columns={"type":"store_type"}, inplace=True)
+
+  processed_data["is_holiday"] = mark_holidays(processed_data, holidays)
+
+  processed_data.sort_values(by = ["date"], inplace = True)
+  return processed_data
+
+
+def mark_holidays(data, holidays):
+
+  """
+  Function responsible for flagging the records falling on a national holiday, or on a regional or local holiday of
+  the store's state or city. Regional and local holidays are matched with keyed merges on (date, state) and (date, city).
+  """
+
+  holidays = holidays[holidays["transferred"] != True]
+  holidays = holidays[holidays["type"] != "Work Day"]
+
+  national_dates = holidays.loc[holidays["locale"] == "National", "date"].drop_duplicates()
+  not_national = ~holidays["date"].isin(national_dates)
+  regional_holidays = holidays.loc[(holidays["locale"] == "Regional") & not_national, ["date", "locale_name"]]
+  local_holidays = holidays.loc[(holidays["locale"] == "Local") & not_national, ["date", "locale_name"]]
+  regional_holidays = regional_holidays.rename(columns = {"locale_name":"state"}).drop_duplicates()
+  local_holidays = local_holidays.rename(columns = {"locale_name":"city"}).drop_duplicates()
+  regional_holidays["regional_holiday"] = True
+  local_holidays["local_holiday"] = True
+
+  flags = data[["date", "state", "city"]].merge(regional_holidays, on = ["date", "state"], how = "left")
+  flags = flags.merge(local_holidays, on = ["date", "city"], how = "left")
+
+  is_holiday = data["date"].isin(national_dates).to_numpy() \
+    | flags["regional_holiday"].notna().to_numpy() \
+    | flags["local_holiday"].notna().to_numpy()
+
+  return is_holiday.astype(int)
+
+
+def transform_covariate_shard(shard, full_dates, missing_dates):
+
+  """
+  Function responsible for reindexing a shard of covariate frames to the full date range in one operation and
+  converting them into Darts TimeSeries objects. Dates absent from every series take the last record of the
+  series, as the covariates the current models were trained on did.
+  """
+
+  transformed = []
+  for key, covariate in shard:
+    covariate = covariate.ffill()
+    filled = covariate.reindex(full_dates).astype("float64")
+    filled.loc[missing_dates] = covariate.iloc[-1].to_numpy()
+    filled = filled.ffill()
+    filled.index.name = "date"
+    transformed.append((key, TimeSeries.from_dataframe(filled)))
+  return transformed
 
 
 class DataTransformation:
   def __init__(self):
     self.datatransformationconfig = DataTransformationConfig()
+    self.artifactstore = ArtifactStore()
     logging.info(">>> DATA TRANSFORMATION STARTED <<<")
 
+  def map_shards(self, function, items, **kwargs):
+
+    """
+    Function responsible for running a per-series function over contiguous shards of items, on a process pool
+    when more than one worker is configured. Results come back in the order of the items.
+    """
+
+    n_workers = self.datatransformationconfig.n_workers
+    n_shards = max(1, n_workers * self.datatransformationconfig.shards_per_worker)
+    shard_size = max(1, -(-len(items) // n_shards))
+    shards = [items[start:start + shard_size] for start in range(0, len(items), shard_size)]
+
+    if n_workers <= 1 or len(shards) <= 1:
+      results = [function(shard, **kwargs) for shard in shards]
+    else:
+      # spawned rather than forked, LightGBM's OpenMP threads in this process do not survive a fork
+      with ProcessPoolExecutor(max_workers = n_workers, mp_context = multiprocessing.get_context("spawn")) as executor:
+        results = list(executor.map(partial(function, **kwargs), shards))
+
+    return [item for result in results for item in result]
+
+  @instrument()
   def integrate_data(self):
 
     """
@@ -40,55 +155,23 @@ class DataTransformation:
     """
 
     logging.info("executing integrate_data function")
+    if self.datatransformationconfig.integration_mode == "partitioned":
+      return self.integrate_partitioned()
     try:
       logging.info("handling missing values")
 
-      oil = pd.read_csv(self.datatransformationconfig.oil)
-      data = pd.read_csv(self.datatransformationconfig.data)
-      stores = pd.read_csv(self.datatransformationconfig.stores)
-      holidays = pd.read_csv(self.datatransformationconfig.holidays)
+      oil = self.artifactstore.load(self.datatransformationconfig.oil)
+      data = self.artifactstore.load(self.datatransformationconfig.data)
+      stores = self.artifactstore.load(self.datatransformationconfig.stores)
+      holidays = self.artifactstore.load(self.datatransformationconfig.holidays)
 
-      all_dates = data["date"]
-      missing_dates = pd.DataFrame(all_dates[~all_dates.isin(oil.date)].unique())
-      missing_dates.rename(columns={0:"date"}, inplace=True)
-      oil = pd.concat([oil, missing_dates], axis=0).reset_index(drop=True).sort_values(by="date")
-      oil["dcoilwtico"] = oil["dcoilwtico"].interpolate().bfill()
+      oil = fill_oil(oil, data["date"])
 
       logging.info("missing values handled successfully")
       logging.info("initialising data integration")
 
-      processed_data = pd.merge(left=data, right=oil, on="date", how="left")
-      processed_data = pd.merge(left = processed_data, right = stores, on = "store_nbr", how = "left")
-      processed_data.rename(columns={"type":"store_type"}, inplace=True)
-
-      holidays = holidays[holidays["transferred"] != True]
-      holidays.drop(["transferred", "description"], axis = 1, inplace = True)
-      holidays = holidays[holidays["type"] != "Work Day"]
-      holidays.drop("type", axis = 1, inplace = True)
-
-      logging.info("removing data inconsistencies")
-
-      national_holidays = holidays[holidays["locale"] == "National"][["date"]]
-      regional_holidays = holidays[((holidays["locale"] == "Regional") & (~holidays["date"].isin(national_holidays["date"])))]
-      local_holidays = holidays[((holidays["locale"] == "Local") & (~holidays["date"].isin(national_holidays["date"])))]
-      regional_holidays = regional_holidays[["date", "locale_name"]].rename(columns={"locale_name":"state"})
-      local_holidays = local_holidays[["date", "locale_name"]].rename(columns={"locale_name":"city"})
-      national_holidays = national_holidays[~national_holidays.duplicated(keep='first')]
-      regional_holidays = regional_holidays[~regional_holidays.duplicated(keep="first")]
-      local_holidays = local_holidays[~local_holidays.duplicated(keep="first")]
-      processed_data["is_holiday"] = np.zeros(shape=(len(processed_data), )).astype(int)
-
-      national_indices = processed_data[processed_data["date"].isin(national_holidays["date"])].index
-      processed_data["is_holiday"][national_indices] = 1
-      for date, state in zip(regional_holidays["date"], regional_holidays["state"]):
-          indices = processed_data[((processed_data["date"] == date) & (processed_data["state"] == state))].index
-          processed_data["is_holiday"][indices] = 1
-      for date, city in zip(local_holidays["date"], local_holidays["city"]):
-          indices = processed_data[((processed_data["date"] == date) & (processed_data["city"] == city))].index
-          processed_data["is_holiday"][indices] = 1
-
-      processed_data.sort_values(by = ["date"], inplace = True)
-      processed_data.to_csv(self.datatransformationconfig.processed_data, index = False)
+      processed_data = integrate_records(data, oil, stores, holidays)
+      self.artifactstore.save(processed_data, self.datatransformationconfig.processed_data)
 
       logging.info("data integration complete")
 
@@ -96,6 +179,51 @@ class DataTransformation:
       logging.info(CustomException(e))
       print(CustomException(e))
 
+  def integrate_partitioned(self):
+
+    """
+    Function responsible for integrating the datasets one date range at a time, for sales histories larger than memory.
+    The raw records are streamed once and spilled to files per date range, then every range is joined with the oil prices,
+    store details and holidays on its own and written as one partition of the processed dataset.
+    """
+
+    logging.info(f"integrating data in partitions of frequency {self.datatransformationconfig.partition_frequency}")
+    try:
+      oil = self.artifactstore.load(self.datatransformationconfig.oil)
+      stores = self.artifactstore.load(self.datatransformationconfig.stores)
+      holidays = self.artifactstore.load(self.datatransformationconfig.holidays)
+
+      processed_path = self.datatransformationconfig.processed_data
+      spill_dir = os.path.splitext(processed_path)[0] + ".spill"
+      shutil.rmtree(spill_dir, ignore_errors = True)
+
+      logging.info("spilling the raw records to files per date range")
+
+      dates = []
+      for number, batch in enumerate(self.artifactstore.load_batches(self.datatransformationconfig.data)):
+        periods = batch["date"].dt.to_period(self.datatransformationconfig.partition_frequency)
+        for period, records in batch.groupby(periods):
+          self.artifactstore.save(records, os.path.join(spill_dir, f"{period}.parquet", f"{number:06d}.parquet"))
+        dates.append(batch["date"].drop_duplicates())
+
+      oil = fill_oil(oil, pd.concat(dates, ignore_index = True).drop_duplicates())
+
+      logging.info("missing values handled successfully")
+
+      dataset = PartitionedDataset.create(processed_path, self.artifactstore)
+      for period_dir in sorted(os.listdir(spill_dir)):
+        data = self.artifactstore.load(os.path.join(spill_dir, period_dir))
+        dataset.write(f"part-{os.path.splitext(period_dir)[0]}", integrate_records(data, oil, stores, holidays))
+      dataset.commit()
+      shutil.rmtree(spill_dir)
+
+      logging.info("data integration complete")
+
+    except Exception as e:
+      logging.info(CustomException(e))
+      print(CustomException(e))
+
+  @instrument()
   def split_data(self, number_of_test_days = 15):
 
     """
@@ -103,24 +231,25 @@ class DataTransformation:
     """
 
     logging.info("executing split_data function")
+    if os.path.isdir(self.datatransformationconfig.processed_data):
+      return self.split_partitioned(number_of_test_days = number_of_test_days)
     try:
       logging.info("performing data split for cross-validation")
 
-      processed_data = pd.read_csv(self.datatransformationconfig.processed_data)
+      processed_data = self.artifactstore.load(self.datatransformationconfig.processed_data)
       processed_data.reset_index(drop=True, inplace=True)
 
       last_date = processed_data["date"].iloc[- 1]
 
       logging.info(f"setting number of kept records for model testing as {number_of_test_days}")
 
-      last_date = datetime.strptime(last_date, "%Y-%m-%d") - timedelta(days = number_of_test_days)
-      last_date = last_date.strftime("%Y-%m-%d")
-      split_index = processed_data[processed_data["date"] == last_date].sort_values(by = "date").index[-1]
+      last_date = last_date - timedelta(days = number_of_test_days)
+      split_index = processed_data[processed_data["date"] == last_date].index[-1]
       train_data = processed_data.iloc[:split_index + 1, :]
       test_data = processed_data.iloc[split_index + 1:, :]
 
-      train_data.to_csv(self.datatransformationconfig.train_data, index = False)
-      test_data.to_csv(self.datatransformationconfig.test_data, index = False)
+      self.artifactstore.save(train_data, self.datatransformationconfig.train_data)
+      self.artifactstore.save(test_data, self.datatransformationconfig.test_data)
 
       logging.info("data split complete")
 
@@ -128,6 +257,76 @@ class DataTransformation:
       logging.info(CustomException(e))
       print(CustomException(e))
 
+  def split_partitioned(self, number_of_test_days = 15):
+
+    """
+    Function responsible for splitting a partitioned dataset into train and test sets by selecting partitions. Partitions
+    wholly before or after the split date are linked into the train or test set unchanged, and only the partitions
+    holding dates on both sides of it are read and divided.
+    """
+
+    try:
+      processed_path = self.datatransformationconfig.processed_data
+      processed = PartitionedDataset(processed_path, self.artifactstore)
+      partitions = processed.partitions()
+
+      last_date = max(pd.Timestamp(partition["end"]) for partition in partitions)
+      split_date = last_date - timedelta(days = number_of_test_days)
+
+      logging.info(f"selecting partitions up to {split_date.date()} for training out of {len(partitions)}")
+
+      train = PartitionedDataset.create(self.datatransformationconfig.train_data, self.artifactstore)
+      test = PartitionedDataset.create(self.datatransformationconfig.test_data, self.artifactstore)
+      for partition in partitions:
+        if pd.Timestamp(partition["end"]) <= split_date:
+          train.link(partition, processed_path)
+        elif pd.Timestamp(partition["start"]) > split_date:
+          test.link(partition, processed_path)
+        else:
+          data = processed.load_partition(partition)
+          name = os.path.splitext(partition["file"])[0]
+          train.write(name, data[data["date"] <= split_date])
+          test.write(name, data[data["date"] > split_date])
+      train.commit()
+      test.commit()
+
+      logging.info("data split complete")
+
+    except Exception as e:
+      logging.info(CustomException(e))
+      print(CustomException(e))
+
+  def build_test_series(self, test_data, features_to_keep):
+
+    """
+    Function responsible for converting the test data into Darts TimeSeries of the kept sales series and their covariates
+    """
+
+    logging.info("applying same processing on test data performed on train data")
+
+    test_sales = {}
+    test_covariates = {}
+    for (store_nbr, family), data_slice in test_data.groupby(by = ["store_nbr", "family"], observed = True):
+      group = (int(store_nbr), str(family))
+      data_slice = data_slice.set_index("date", drop = True)
+      test_covariate = data_slice[["onpromotion", "dcoilwtico", "is_holiday"]]
+      test_sales_series = data_slice["sales"]
+      test_sales[group] = test_sales_series
+      test_covariates[str(group)] = test_covariate
+
+    test_dataset = pd.DataFrame(data = test_sales)
+    test_dataset = test_dataset[features_to_keep]
+    test_dataset.set_index(pd.to_datetime(test_dataset.index), inplace = True)
+    testseries_data = TimeSeries.from_dataframe(test_dataset)
+
+    for cov_key in test_covariates:
+      temp_cov = test_covariates[cov_key]
+      temp_cov.set_index(pd.to_datetime(temp_cov.index), inplace = True)
+      test_covariates[cov_key] = TimeSeries.from_dataframe(temp_cov)
+
+    return testseries_data, test_covariates
+
+  @instrument()
   def transform_data(self):
 
     """
@@ -137,8 +336,8 @@ class DataTransformation:
 
     logging.info("executing transform_data function")
     try:
-      train_data = pd.read_csv(self.datatransformationconfig.train_data)
-      test_data = pd.read_csv(self.datatransformationconfig.test_data)
+      train_data = self.artifactstore.load(self.datatransformationconfig.train_data)
+      test_data = self.artifactstore.load(self.datatransformationconfig.test_data)
 
       logging.info("dropping unnecessary features for modelling")
 
@@ -149,7 +348,8 @@ class DataTransformation:
 
       sales = {}
       covariates = {}
-      for group, data_slice in train_data.groupby(by = ["store_nbr", "family"]):
+      for (store_nbr, family), data_slice in train_data.groupby(by = ["store_nbr", "family"], observed = True):
+          group = (int(store_nbr), str(family))
           data_slice.set_index("date", drop = True, inplace = True)
           sales_series = data_slice["sales"]
           covariate = data_slice[["onpromotion", "dcoilwtico", "is_holiday"]]
@@ -160,33 +360,27 @@ class DataTransformation:
 
       series_dataset = pd.DataFrame(data = sales)
 
-      all_dates = set(pd.date_range(start = series_dataset.index[0], end = series_dataset.index[-1]).strftime("%Y-%m-%d"))
-      all_missing_dates = all_dates.difference(set(series_dataset.index))
-      missing_data = pd.DataFrame(data = {column:[np.NaN] * len(all_missing_dates) for column in series_dataset.columns},\
-                                  index = list(all_missing_dates), columns = series_dataset.columns)
-      series_dataset = pd.concat([series_dataset, missing_data], axis = 0).sort_index().interpolate()
-      for cov in covariates:
-          for date in all_missing_dates:
-              covariates[cov].loc[date, :] = [np.NaN] * covariates[cov].shape[1]
-          covariates[cov] = covariates[cov].ffill()
-
-      logging.info("applying same processing on test data performed above")
-
-      test_sales = {}
-      test_covariates = {}
-      for group, data_slice in test_data.groupby(by = ["store_nbr", "family"]):
-        data_slice.set_index("date", drop = True, inplace = True)
-        test_covariate = data_slice[["onpromotion", "dcoilwtico", "is_holiday"]]
-        test_sales_series = data_slice["sales"]
-        test_sales[group] = test_sales_series
-        test_covariates[str(group)] = test_covariate
-
-      test_dataset = pd.DataFrame(data = test_sales)
+      full_dates = pd.date_range(start = series_dataset.index[0], end = series_dataset.index[-1])
+      all_missing_dates = full_dates.difference(series_dataset.index)
+      series_dataset = series_dataset.reindex(full_dates).interpolate()
+
+      logging.info(f"converting covariates of {len(covariates)} series on {self.datatransformationconfig.n_workers} workers")
+
+      covariates = dict(self.map_shards(
+        transform_covariate_shard,
+        list(covariates.items()),
+        full_dates = full_dates,
+        missing_dates = all_missing_dates
+      ))
 
       logging.info("detecting and removing outliers from different series")
 
-      temp = series_dataset.apply(lambda x : hampel(x, window_size = 7, n_sigma = 3.0).filtered_data)
-      series_dataset = temp.set_index(series_dataset.index)
+      filtered_sales = hampel_filter(
+        series_dataset.to_numpy(),
+        window_size = self.datatransformationconfig.hampel_window_size,
+        n_sigma = self.datatransformationconfig.hampel_n_sigma
+      )
+      series_dataset = pd.DataFrame(data = filtered_sales, index = series_dataset.index, columns = series_dataset.columns)
 
       logging.info("dropping features with zero variances from train and test data")
 
@@ -201,36 +395,104 @@ class DataTransformation:
           constant_features.append(feature)
       features_to_keep = sorted(set(series_dataset.columns).difference(set(constant_features)))
       series_dataset = series_dataset[features_to_keep]
-      test_dataset = test_dataset[features_to_keep]
 
       logging.info("converting sales series and covariates into Darts TimeSeries objects for train and test data")
 
       series_dataset.set_index(pd.to_datetime(series_dataset.index), inplace = True)
-      test_dataset.set_index(pd.to_datetime(test_dataset.index), inplace = True)
-
       timeseries_data = TimeSeries.from_dataframe(series_dataset)
-      testseries_data = TimeSeries.from_dataframe(test_dataset)
+      testseries_data, test_covariates = self.build_test_series(test_data, features_to_keep)
 
-      for cov_key in covariates:
-        temp_cov = covariates[cov_key]
-        temp_cov.set_index(pd.to_datetime(temp_cov.index), inplace = True)
-        covariates[cov_key] = TimeSeries.from_dataframe(temp_cov)
+      logging.info("saving the processed datasets of all target series and their covariates to artifacts")
 
-      for cov_key in test_covariates:
-        temp_cov = test_covariates[cov_key]
-        temp_cov.set_index(pd.to_datetime(temp_cov.index), inplace = True)
-        test_covariates[cov_key] = TimeSeries.from_dataframe(temp_cov)
+      joblib.dump(timeseries_data, self.datatransformationconfig.timeseries_data)
+      CovariateStore.from_timeseries(covariates).save(self.datatransformationconfig.covariates)
+      joblib.dump(testseries_data, self.datatransformationconfig.testseries_data)
+      joblib.dump(test_covariates, self.datatransformationconfig.test_covariates)
 
-      logging.info("saving the processed datasets of all target series and their covariates via joblib to artifacts")
+      logging.info("saved timeseries_data, test_data and their covariates to artifacts")
+      logging.info(">>> DATA TRANSFORMATION COMPLETE <<<")
+
+    except Exception as e:
+      logging.info(CustomException(e))
+      print(CustomException(e))
+
+  @instrument()
+  def extend_data(self):
+
+    """
+    Function responsible for extending the saved training series and their covariates with only the dates of the train
+    data that follow their last date, instead of rebuilding them from the whole history. New sales are interpolated and
+    Hampel filtered with the last window of already filtered days as context, new covariates are carried forward from
+    the last stored day of each series, and the test series are rebuilt from the current test data.
+    """
+
+    logging.info("executing extend_data function")
+    if not os.path.exists(self.datatransformationconfig.timeseries_data) or not os.path.exists(CovariateStore.index_path(self.datatransformationconfig.covariates)):
+      logging.info("no saved series to extend, transforming the whole train data")
+      return self.transform_data()
+
+    try:
+      timeseries_data = joblib.load(self.datatransformationconfig.timeseries_data)
+      covariates = CovariateStore.load(self.datatransformationconfig.covariates, mmap_mode = None)
+      train_data = self.artifactstore.load(self.datatransformationconfig.train_data)
+      test_data = self.artifactstore.load(self.datatransformationconfig.test_data)
+
+      last_date = timeseries_data.end_time()
+      new_data = train_data[train_data["date"] > last_date].copy()
+      components = list(timeseries_data.components)
+
+      if new_data.empty:
+        logging.info(f"no train data after {last_date}, training series are up to date")
+      else:
+        new_dates = pd.date_range(start = last_date + timedelta(days = 1), end = new_data["date"].max())
+        new_data["series"] = [str((int(store_nbr), str(family))) for store_nbr, family in zip(new_data["store_nbr"], new_data["family"])]
+        logging.info(f"extending {len(components)} series with {len(new_dates)} new dates after {last_date}")
+
+        logging.info("filling missing dates and removing outliers from the new sales")
+
+        window_size = self.datatransformationconfig.hampel_window_size
+        history = timeseries_data[-window_size:].pd_dataframe()
+        new_sales = new_data.pivot(index = "date", columns = "series", values = "sales").reindex(index = new_dates, columns = components)
+        context = pd.concat([history, new_sales]).interpolate()
+        filtered_sales = hampel_filter(
+          context.to_numpy(),
+          window_size = window_size,
+          n_sigma = self.datatransformationconfig.hampel_n_sigma
+        )[len(history):]
+        timeseries_data = timeseries_data.append_values(filtered_sales.astype(timeseries_data.dtype))
+
+        logging.info("carrying the covariates of every series forward over the new dates")
+
+        keys = list(covariates.keys_index)
+        series_values = []
+        for feature in covariates.series_features:
+          values = new_data.pivot(index = "date", columns = "series", values = feature).reindex(index = new_dates, columns = keys)
+          seeded = pd.concat([pd.DataFrame([covariates.series_values[:, -1, covariates.series_features.index(feature)]], columns = keys), values])
+          series_values.append(seeded.ffill().to_numpy()[1:].T)
+
+        global_values = []
+        for feature in covariates.global_features:
+          values = new_data.groupby("date")[feature].first().reindex(new_dates)
+          seeded = pd.concat([pd.Series([covariates.global_values[-1, covariates.global_features.index(feature)]]), values])
+          global_values.append(seeded.ffill().to_numpy()[1:])
+
+        covariates = covariates.append(
+          dates = new_dates,
+          series_values = np.stack(series_values, axis = 2),
+          global_values = np.stack(global_values, axis = 1).reshape(len(new_dates), len(covariates.global_features))
+        )
+
+      testseries_data, test_covariates = self.build_test_series(test_data, [ast.literal_eval(component) for component in components])
+
+      logging.info("saving the extended series and their covariates to artifacts")
 
       joblib.dump(timeseries_data, self.datatransformationconfig.timeseries_data)
-      joblib.dump(covariates, self.datatransformationconfig.covariates)
+      covariates.save(self.datatransformationconfig.covariates)
       joblib.dump(testseries_data, self.datatransformationconfig.testseries_data)
       joblib.dump(test_covariates, self.datatransformationconfig.test_covariates)
 
-      logging.info("saved timeseries_data, test_data and their covariates to artifacts")
       logging.info(">>> DATA TRANSFORMATION COMPLETE <<<")
 
     except Exception as e:
       logging.info(CustomException(e))
-      print(CustomException(e))
\ No newline at end of file
+      print(CustomException(e))
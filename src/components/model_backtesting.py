@@ -0,0 +1,257 @@
+from src.utils.exception import CustomException
+from src.utils.logger import logging
+from src.utils.instrumentation import instrument
+from src.utils.artifact_store import ArtifactStore
+from src.utils.covariate_store import CovariateStore
+from src.utils.fast_inference import FastForecaster
+from src.utils.metrics import METRICS, error_sums, metrics_from_sums
+from src.components.model_trainer import ModelTrainer
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from sklearn.base import clone
+import multiprocessing
+import joblib
+import json
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import os
+
+@dataclass
+class ModelBacktestingConfig:
+    timeseries_data:str = os.path.join("artifacts", "timeseries_data.joblib")
+    covariates:str = os.path.join("artifacts", "covariates")
+    backtest_metrics:str = os.path.join("artifacts", "backtest_metrics.parquet")
+    backtest_summary:str = os.path.join("artifacts", "backtest_summary.json")
+    design_matrix_dir:str = os.path.join("artifacts", "backtesting")
+    n_folds:int = 8
+    fold_step_days:int = 7
+    horizons:tuple = (1, 7, 15, 30)
+    n_workers:int = os.cpu_count() or 1
+    design_matrix_dtype:str = "float64"
+
+
+def lag_window(target_lags, past_lags) -> int:
+    # the first date with every target and past covariate lag available, where the samples of Darts start
+    return max(-min(target_lags), -min(past_lags))
+
+
+def build_design_matrix(targets, covariates, target_lags, past_lags, dtype = np.float64):
+
+    """
+    This function is responsible for building the lagged features of every series at every date once, in the feature
+    order of the Darts regression models. Rows are ordered date by date, so the samples available before any forecast
+    origin form a prefix of the matrix. float64 reproduces the samples Darts trains on, float32 halves the memory.
+    """
+
+    n_dates, n_series = targets.shape
+    window = lag_window(target_lags, past_lags)
+    n_features = len(target_lags) + len(past_lags) * covariates.shape[2]
+    features = np.empty(((n_dates - window) * n_series, n_features), dtype = dtype)
+
+    column = 0
+    for lag in target_lags:
+        features[:, column] = targets[window + lag:n_dates + lag].reshape(-1)
+        column += 1
+    # covariates are held as (series, date, component), the rows need them date by date
+    by_date = covariates.transpose(1, 0, 2)
+    for lag in past_lags:
+        for component in range(covariates.shape[2]):
+            features[:, column] = by_date[window + lag:n_dates + lag, :, component].reshape(-1)
+            column += 1
+
+    return features, targets[window:].reshape(-1).astype(dtype)
+
+
+def arrange_series(timeseries_data, covariates, series_keys):
+
+    """
+    This function is responsible for arranging the training series as a (date, series) array and their past
+    covariates as a (series, date, component) array, the layout build_design_matrix reads them in
+    """
+
+    if timeseries_data.start_time() != covariates.dates[0] or len(covariates.dates) < len(timeseries_data):
+        raise ValueError("the past covariates must start with the training series and cover all of their dates")
+
+    targets = np.array(timeseries_data.values(copy = False), dtype = np.float64)
+    positions = [covariates.keys_index[key] for key in series_keys]
+    covariate_values = np.empty((len(series_keys), len(covariates.dates), len(covariates.components)), dtype = np.float64)
+    for column, component in enumerate(covariates.components):
+        if component in covariates.global_features:
+            covariate_values[:, :, column] = covariates.global_values[:, covariates.global_features.index(component)]
+        else:
+            covariate_values[:, :, column] = covariates.series_values[positions, :, covariates.series_features.index(component)]
+    return targets, covariate_values
+
+
+def run_fold(fold, design_matrix_dir, estimator, target_lags, past_lags, components, series_keys, horizons, n_jobs):
+
+    """
+    This function is responsible for training a fold's model on the samples before its origin and forecasting the
+    series from that origin recursively, returning the errors of every series for each horizon
+    """
+
+    start = time.perf_counter()
+    features = np.load(os.path.join(design_matrix_dir, "features.npy"), mmap_mode = "r")
+    labels = np.load(os.path.join(design_matrix_dir, "labels.npy"), mmap_mode = "r")
+    targets = np.load(os.path.join(design_matrix_dir, "targets.npy"), mmap_mode = "r")
+    covariates = np.load(os.path.join(design_matrix_dir, "covariates.npy"), mmap_mode = "r")
+
+    origin = fold["origin_index"]
+    target_window = -min(target_lags)
+    covariate_window = -min(past_lags)
+    horizon = max(horizons)
+    n_rows = (origin - lag_window(target_lags, past_lags)) * len(series_keys)
+
+    model = clone(estimator).set_params(n_jobs = n_jobs)
+    model.fit(features[:n_rows], labels[:n_rows])
+
+    forecaster = FastForecaster(
+        booster = model.booster_,
+        target_lags = target_lags,
+        past_lags = past_lags,
+        components = components,
+        series_keys = series_keys,
+        target_history = np.array(targets[origin - target_window:origin].T),
+        covariate_history = np.array(covariates[:, origin - covariate_window:origin]),
+        last_date = fold["origin"]
+    )
+    forecasts = forecaster.predict(series_keys, np.array(covariates[:, origin:origin + horizon]))
+    actuals = np.array(targets[origin:origin + horizon].T)
+    scale = np.array(targets[:origin].max(axis = 0) - targets[:origin].min(axis = 0))
+
+    rows = []
+    for steps in horizons:
+        metrics = metrics_from_sums(error_sums(actuals[:, :steps].T, forecasts[:, :steps].T, scale = scale))
+        rows.append(pd.DataFrame({
+            "fold": fold["fold"],
+            "origin": fold["origin"],
+            "horizon": steps,
+            "series": series_keys,
+            **metrics,
+            "train_samples": n_rows,
+            "fold_seconds": round(time.perf_counter() - start, 3)
+        }))
+
+    return pd.concat(rows, ignore_index = True)
+
+
+class ModelBacktesting:
+    def __init__(self):
+        self.modelbacktestingconfig = ModelBacktestingConfig()
+        self.artifactstore = ArtifactStore()
+        logging.info(">>> MODEL BACKTESTING STARTED <<<")
+
+    def plan_folds(self, dates):
+
+        """
+        This function is responsible for placing the forecast origins, the last one leaving room for the longest horizon
+        and the others fold_step_days apart before it
+        """
+
+        horizon = max(self.modelbacktestingconfig.horizons)
+        last_origin = len(dates) - horizon
+        folds = []
+        for fold in range(self.modelbacktestingconfig.n_folds):
+            origin_index = last_origin - (self.modelbacktestingconfig.n_folds - 1 - fold) * self.modelbacktestingconfig.fold_step_days
+            folds.append({"fold": fold, "origin_index": origin_index, "origin": dates[origin_index]})
+        return folds
+
+    @instrument()
+    def run_backtest(self):
+
+        """
+        This function is responsible for rolling-origin backtesting of the sales model. The lag design matrix of all the
+        series is built once and shared by every fold through memory-mapped files, and the folds are trained and
+        forecasted in parallel processes. Per-series metrics of every fold and horizon are written to a Parquet file
+        and their means per horizon to a JSON summary.
+        """
+
+        logging.info("executing run_backtest function")
+        try:
+            start = time.perf_counter()
+            timeseries_data = joblib.load(self.modelbacktestingconfig.timeseries_data)
+            covariates = CovariateStore.load(self.modelbacktestingconfig.covariates)
+
+            model = ModelTrainer().create_sales_model()
+            target_lags = model.lags["target"]
+            past_lags = model.lags["past"]
+            series_keys = [str(component) for component in timeseries_data.components]
+
+            logging.info("arranging the targets and covariates of all series as dense arrays")
+            targets, covariate_values = arrange_series(timeseries_data, covariates, series_keys)
+
+            folds = self.plan_folds(timeseries_data.time_index)
+            if folds[0]["origin_index"] - lag_window(target_lags, past_lags) <= 0:
+                raise ValueError(f"{self.modelbacktestingconfig.n_folds} folds do not fit in {len(timeseries_data)} dates of history")
+
+            logging.info(f"building the lag design matrix of {len(series_keys)} series once for {len(folds)} folds")
+
+            design_matrix_dir = self.modelbacktestingconfig.design_matrix_dir
+            os.makedirs(design_matrix_dir, exist_ok = True)
+            features, labels = build_design_matrix(
+                targets,
+                covariate_values,
+                target_lags,
+                past_lags,
+                dtype = np.dtype(self.modelbacktestingconfig.design_matrix_dtype)
+            )
+            np.save(os.path.join(design_matrix_dir, "features.npy"), features)
+            np.save(os.path.join(design_matrix_dir, "labels.npy"), labels)
+            np.save(os.path.join(design_matrix_dir, "targets.npy"), targets)
+            np.save(os.path.join(design_matrix_dir, "covariates.npy"), covariate_values)
+            del features, labels
+
+            n_workers = max(1, min(self.modelbacktestingconfig.n_workers, len(folds)))
+            fold_function = partial(
+                run_fold,
+                design_matrix_dir = design_matrix_dir,
+                estimator = model.model,
+                target_lags = target_lags,
+                past_lags = past_lags,
+                components = covariates.components,
+                series_keys = series_keys,
+                horizons = self.modelbacktestingconfig.horizons,
+                # the cores are split between the folds running at the same time
+                n_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+            )
+
+            logging.info(f"running {len(folds)} folds on {n_workers} workers")
+
+            try:
+                if n_workers == 1:
+                    results = [fold_function(fold) for fold in folds]
+                else:
+                    # spawned rather than forked, LightGBM's OpenMP threads in this process do not survive a fork
+                    with ProcessPoolExecutor(max_workers = n_workers, mp_context = multiprocessing.get_context("spawn")) as executor:
+                        results = list(executor.map(fold_function, folds))
+            finally:
+                shutil.rmtree(design_matrix_dir, ignore_errors = True)
+
+            metrics = pd.concat(results, ignore_index = True)
+            self.artifactstore.save(metrics, self.modelbacktestingconfig.backtest_metrics)
+
+            summary = {
+                "folds": len(folds),
+                "origins": [str(fold["origin"].date()) for fold in folds],
+                "series": len(series_keys),
+                "seconds": round(time.perf_counter() - start, 2),
+                "horizons": {
+                    str(horizon): {
+                        metric: float(group[metric].mean())
+                        for metric in METRICS + ("mse_normalised", "mae_normalised")
+                    }
+                    for horizon, group in metrics.groupby("horizon")
+                }
+            }
+            with open(self.modelbacktestingconfig.backtest_summary, "w") as jsonfile:
+                json.dump(summary, jsonfile, indent = 3)
+
+            logging.info(f"backtest of {len(folds)} folds complete in {summary['seconds']}s")
+            logging.info(">>> MODEL BACKTESTING COMPLETED <<<")
+
+        except Exception as e:
+            logging.info(CustomException(e))
+            print(CustomException(e))
@@ -1,8 +1,12 @@
 from src.utils.exception import CustomException
 from src.utils.logger import logging
+from src.utils.instrumentation import instrument
+from src.utils.artifact_store import ArtifactStore
+from src.utils.covariate_store import CovariateStore
+from src.utils.metrics import metrics_table
 from src.utils import generate_covariates
+from src.utils.oil_forecast_cache import OilForecastCache, OilForecastCacheConfig
 from dataclasses import dataclass
-from sklearn.metrics import mean_squared_error, mean_absolute_error
 from sklearn.preprocessing import MinMaxScaler
 import os
 import json
@@ -14,17 +18,21 @@ import joblib
 class ModelEvaluationConfig:
     trained_model:str = os.path.join("artifacts", "trained_model.joblib")
     oil_model:str = os.path.join("artifacts", "oil_model.joblib")
-    covariates:str = os.path.join("artifacts", "covariates.joblib")
+    oil_forecasts:str = os.path.join("artifacts", "oil_forecasts.joblib")
+    covariates:str = os.path.join("artifacts", "covariates")
     testseries_data:str = os.path.join("artifacts", "testseries_data.joblib")
     timeseries_data:str = os.path.join("artifacts", "timeseries_data.joblib")
     test_covariates:str = os.path.join("artifacts", "test_covariates.joblib")
     results_json:str = os.path.join("artifacts", "results.json")
+    metrics_table:str = os.path.join("artifacts", "evaluation_metrics.parquet")
 
 class ModelEvaluation:
   def __init__(self):
     logging.info(">>> MODEL EVALUATION STARTED <<< ")
     self.modelevaluationconfig = ModelEvaluationConfig()
+    self.artifactstore = ArtifactStore()
 
+  @instrument()
   def generate_predictions(self):
 
     """
@@ -34,15 +42,18 @@ class ModelEvaluation:
     logging.info("executing the generate_predictions function")
     try:
       trained_model = joblib.load(self.modelevaluationconfig.trained_model)
-      oil_model = joblib.load(self.modelevaluationconfig.oil_model)
-      covariates = joblib.load(self.modelevaluationconfig.covariates)
+      covariates = CovariateStore.load(self.modelevaluationconfig.covariates)
       testseries_data = joblib.load(self.modelevaluationconfig.testseries_data)
       test_covariates = joblib.load(self.modelevaluationconfig.test_covariates)
       timeseries_data = joblib.load(self.modelevaluationconfig.timeseries_data)
 
       logging.info("generating covariates for the next few days after the end of train data")
 
-      oil_forecasts = oil_model.predict(n = len(testseries_data)).pd_series().to_list()
+      oil_forecast_cache = OilForecastCache(OilForecastCacheConfig(
+          oil_model = self.modelevaluationconfig.oil_model,
+          oil_forecasts = self.modelevaluationconfig.oil_forecasts
+      )).load(horizon = len(testseries_data))
+      oil_forecasts = oil_forecast_cache["forecasts"]
       new_covariates = {}
       for component in testseries_data.components:
         new_covariates[component] = covariates[component].append(
@@ -51,7 +62,7 @@ class ModelEvaluation:
                 onpromotion = test_covariates[component].pd_dataframe()["onpromotion"],
                 oil_forecasts = oil_forecasts,
                 is_holiday = test_covariates[component].pd_dataframe()["is_holiday"],
-                trained_last_date = oil_model.training_series.end_time()
+                trained_last_date = oil_forecast_cache["trained_last_date"]
                 )
         )
 
@@ -74,6 +85,7 @@ class ModelEvaluation:
       logging.info(CustomException(e))
       print(CustomException(e))
 
+  @instrument()
   def evaluate_predictions(self, train_data, targets, predictions):
     
     """
@@ -85,25 +97,31 @@ class ModelEvaluation:
 
       scaler = MinMaxScaler()
       scaler.fit(np.array(train_data))
+      predictions = predictions[list(targets.columns)]
       real_values = scaler.transform(np.array(targets))
       predicted_values = scaler.transform(np.array(predictions))
 
-      real = []
-      pred = []
-      for col in range(real_values.shape[1]):
-          real += list(real_values[:, col])
-          pred += list(predicted_values[:, col])
       logging.info("writing the model performance report to a JSON file")
 
       results = {
-          "Mean Squared Error (on normalised data)" : mean_squared_error(real, pred),
-          "Mean Absolute Error (on normalised data)" : mean_absolute_error(real, pred)
+          "Mean Squared Error (on normalised data)" : float(np.mean(np.square(real_values - predicted_values))),
+          "Mean Absolute Error (on normalised data)" : float(np.mean(np.abs(real_values - predicted_values)))
       }
 
       results_json = json.dumps(results, indent = 3)
       with open(self.modelevaluationconfig.results_json, "w") as jsonfile:
         jsonfile.write(results_json)
 
+      logging.info("evaluating every series, store and family on the original scale of sales")
+
+      metrics = metrics_table(
+          np.array(targets),
+          np.array(predictions),
+          series_keys = [str(column) for column in targets.columns],
+          scale = scaler.data_range_
+      )
+      self.artifactstore.save(metrics, self.modelevaluationconfig.metrics_table)
+
       logging.info("model evaluation report saved successfully to artifacts")
 
     except Exception as e:
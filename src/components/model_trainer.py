@@ -1,59 +1,200 @@
 from src.utils.exception import CustomException
 from src.utils.logger import logging
+from src.utils.instrumentation import instrument
+from src.utils.covariate_store import CovariateStore
+from src.utils.oil_forecast_cache import OilForecastCache, OilForecastCacheConfig
+from src.utils.fast_inference import FastForecaster
+from src.utils.inference_bundle import export_bundle
 from dataclasses import dataclass
 from darts.models.forecasting.lgbm import LightGBMModel
 import joblib
+import json
+import pandas as pd
+import shutil
+import time
 import os
 
 @dataclass
 class ModelTrainerConfig:
     timeseries_data:str = os.path.join("artifacts", "timeseries_data.joblib")
-    covariates:str = os.path.join("artifacts", "covariates.joblib")
+    covariates:str = os.path.join("artifacts", "covariates")
     oil_model:str = os.path.join("artifacts", "oil_model.joblib")
     trained_model:str = os.path.join("artifacts", "trained_model.joblib")
+    oil_forecasts:str = os.path.join("artifacts", "oil_forecasts.joblib")
+    oil_forecast_horizon:int = 30
+    model_manifest:str = os.path.join("artifacts", "model_manifest.json")
+    model_versions_dir:str = os.path.join("artifacts", "models")
+    keep_versions:int = 5
+    training_mode:str = os.getenv("TRAINING_MODE", "full")
+    incremental_strategy:str = os.getenv("INCREMENTAL_STRATEGY", "continue")
+    incremental_estimators:int = 100
+    incremental_oil_estimators:int = 50
+    incremental_min_days:int = 60
+    refit_window_days:int = 365
+    full_retrain_every:int = 7
 
 class ModelTrainer:
     def __init__(self):
         self.modeltrainerconfig = ModelTrainerConfig()
         logging.info(">>> MODEL TRAINER STARTED <<<")
 
-    def train_model(self):
+    def create_oil_model(self, n_estimators = 500):
+        return LightGBMModel(
+            lags = 25,
+            output_chunk_length = 1,
+            n_estimators = n_estimators,
+            verbosity = 0
+        )
+
+    def create_sales_model(self, n_estimators = 1000, **kwargs):
+        # kwargs are LGBMRegressor parameters, such as the best ones found by ModelTuning
+        return LightGBMModel(
+            lags = [-1, -2, -6, -7, -8, -13, -14, -15, -20, -21, -27, -28, -35, -42, -49, -56, -63],
+            lags_past_covariates = [-1, -2, -6, -7, -8, -13, -14, -15, -20, -21, -27, -28, -35],
+            output_chunk_length = 1,
+            n_estimators = n_estimators,
+            verbosity = 0,
+            **kwargs
+        )
+
+    def read_manifest(self):
+
+        """
+        This function is responsible for reading the manifest of trained model versions, empty when none were recorded
+        """
+
+        if not os.path.exists(self.modeltrainerconfig.model_manifest):
+            return {"current": None, "versions": []}
+        with open(self.modeltrainerconfig.model_manifest) as file:
+            return json.load(file)
+
+    def resolve_mode(self, manifest, trained_last_date, mode = None):
 
         """
-        This function is responsible for training a model on oil prices for oil forecasts and also for training the final model to forecast sales
+        This function is responsible for deciding between a full and an incremental retrain. Incremental updates need the
+        previous models and their last training date, and the policy forces a full retrain every full_retrain_every updates.
+        """
+
+        mode = mode if mode is not None else self.modeltrainerconfig.training_mode
+        if mode == "full":
+            return "full", "requested"
+
+        current = next((version for version in manifest["versions"] if version["version"] == manifest["current"]), None)
+        if current is None or not os.path.exists(self.modeltrainerconfig.trained_model) or not os.path.exists(self.modeltrainerconfig.oil_model):
+            return "full", "no previous models recorded in the manifest"
+        if current["updates_since_full"] + 1 > self.modeltrainerconfig.full_retrain_every:
+            return "full", f"policy forces a full retrain after {self.modeltrainerconfig.full_retrain_every} incremental updates"
+        if trained_last_date < pd.Timestamp(current["trained_last_date"]):
+            return "full", "training data ends before the previous models"
+        return "incremental", f"{self.modeltrainerconfig.incremental_strategy} from version {current['version']}"
+
+    def record_version(self, manifest, entry):
+
+        """
+        This function is responsible for keeping a copy of the trained models per version and recording the version in the manifest
+        """
+
+        version_dir = os.path.join(self.modeltrainerconfig.model_versions_dir, entry["version"])
+        os.makedirs(version_dir, exist_ok = True)
+        for path in (self.modeltrainerconfig.oil_model, self.modeltrainerconfig.trained_model):
+            shutil.copy2(path, os.path.join(version_dir, os.path.basename(path)))
+
+        manifest["versions"].append(entry)
+        manifest["current"] = entry["version"]
+        for stale in manifest["versions"][:-self.modeltrainerconfig.keep_versions]:
+            shutil.rmtree(os.path.join(self.modeltrainerconfig.model_versions_dir, stale["version"]), ignore_errors = True)
+        manifest["versions"] = manifest["versions"][-self.modeltrainerconfig.keep_versions:]
+
+        with open(self.modeltrainerconfig.model_manifest, "w") as file:
+            json.dump(manifest, file, indent = 2)
+
+    @instrument()
+    def train_model(self, mode = None):
+
+        """
+        This function is responsible for training a model on oil prices for oil forecasts and also for training the final model to forecast sales.
+        In incremental mode the previous models are updated on the dates added since they were trained, either by boosting more trees on
+        top of the saved boosters ("continue") or by refitting on a recent window of refit_window_days ("window").
         """
 
         logging.info("executing train_model function")
         try:
+            start = time.perf_counter()
             timeseries_data = joblib.load(self.modeltrainerconfig.timeseries_data)
-            covariates = joblib.load(self.modeltrainerconfig.covariates)
-
-            logging.info("training LightGBM Model for producing oil forecasts")
-            series = covariates[str((1, "AUTOMOTIVE"))]["dcoilwtico"]
-            oil_model = LightGBMModel(
-                lags = 25,
-                output_chunk_length = 1,
-                n_estimators = 500,
-                verbosity = 0
-            )
-            oil_model.fit(series = series)
-
-            logging.info("creating the final LightGBM Model and training it to forecast sales")
-
-            model = LightGBMModel(
-                lags = [-1, -2, -6, -7, -8, -13, -14, -15, -20, -21, -27, -28, -35, -42, -49, -56, -63],
-                lags_past_covariates = [-1, -2, -6, -7, -8, -13, -14, -15, -20, -21, -27, -28, -35],
-                output_chunk_length = 1,
-                n_estimators = 1000,
-                verbosity = 0
-            )
-
-            logging.info("fitting the LightGBM Model for forecasting sales")
-
-            model.fit(
-                series = [timeseries_data[component] for component in timeseries_data.components],
-                past_covariates = [covariates[cov] for cov in timeseries_data.components]
-            )
+            covariates = CovariateStore.load(self.modeltrainerconfig.covariates)
+            trained_last_date = timeseries_data.end_time()
+
+            manifest = self.read_manifest()
+            mode, reason = self.resolve_mode(manifest, trained_last_date, mode = mode)
+            strategy = self.modeltrainerconfig.incremental_strategy if mode == "incremental" else None
+            logging.info(f"training mode {mode}: {reason}")
+
+            previous = next((version for version in manifest["versions"] if version["version"] == manifest["current"]), None)
+            if mode == "full":
+                new_days = len(timeseries_data)
+            else:
+                new_days = (trained_last_date - pd.Timestamp(previous["trained_last_date"])).days
+            if mode == "incremental" and new_days <= 0:
+                logging.info(f"no new dates since {previous['trained_last_date']}, keeping model version {previous['version']}")
+                # oil forecasts missing or stale, e.g. deleted or from before the cache existed, are rebuilt from the kept oil model
+                OilForecastCache(OilForecastCacheConfig(
+                    oil_model = self.modeltrainerconfig.oil_model,
+                    oil_forecasts = self.modeltrainerconfig.oil_forecasts,
+                    horizon = self.modeltrainerconfig.oil_forecast_horizon
+                )).refresh()
+                # the kept outputs are this run's outputs, touched so the stage runner sees them as written by it
+                for path in (self.modeltrainerconfig.oil_model, self.modeltrainerconfig.trained_model, self.modeltrainerconfig.oil_forecasts):
+                    os.utime(path)
+                return
+
+            oil_series = covariates[str((1, "AUTOMOTIVE"))]["dcoilwtico"]
+            sales_series = [timeseries_data[component] for component in timeseries_data.components]
+            past_covariates = [covariates[cov] for cov in timeseries_data.components]
+
+            if mode == "full":
+                logging.info("training LightGBM Model for producing oil forecasts")
+                oil_model = self.create_oil_model()
+                oil_model.fit(series = oil_series)
+
+                logging.info("creating the final LightGBM Model and training it to forecast sales")
+                model = self.create_sales_model()
+
+                logging.info("fitting the LightGBM Model for forecasting sales")
+                model.fit(series = sales_series, past_covariates = past_covariates)
+
+            elif strategy == "continue":
+                logging.info(f"boosting the previous models on the {new_days} new dates")
+                previous_oil_model = joblib.load(self.modeltrainerconfig.oil_model)
+                previous_model = joblib.load(self.modeltrainerconfig.trained_model)
+
+                # the new dates, padded to enough samples for the trees to split on, are the targets and the
+                # points before them just provide their lags
+                target_days = max(new_days, self.modeltrainerconfig.incremental_min_days)
+                oil_model = self.create_oil_model(n_estimators = self.modeltrainerconfig.incremental_oil_estimators)
+                oil_model.fit(
+                    series = oil_series[-(target_days + 25):],
+                    init_model = previous_oil_model.model.booster_
+                )
+
+                model = self.create_sales_model(n_estimators = self.modeltrainerconfig.incremental_estimators)
+                model.fit(
+                    series = [series[-(target_days + 63):] for series in sales_series],
+                    past_covariates = past_covariates,
+                    init_model = previous_model.model.booster_
+                )
+
+            elif strategy == "window":
+                window = self.modeltrainerconfig.refit_window_days
+                logging.info(f"refitting the models on the last {window} days")
+
+                oil_model = self.create_oil_model()
+                oil_model.fit(series = oil_series[-(window + 25):])
+
+                model = self.create_sales_model()
+                model.fit(series = [series[-(window + 63):] for series in sales_series], past_covariates = past_covariates)
+
+            else:
+                raise ValueError(f"unknown incremental strategy {strategy}, expected continue or window")
 
             logging.info("saving the trained models to artifacts")
 
@@ -61,8 +202,42 @@ class ModelTrainer:
             joblib.dump(model, self.modeltrainerconfig.trained_model)
 
             logging.info("models saved successfully")
+            logging.info("caching the oil forecasts of the trained oil model")
+
+            oil_forecast_cache = OilForecastCache(OilForecastCacheConfig(
+                oil_model = self.modeltrainerconfig.oil_model,
+                oil_forecasts = self.modeltrainerconfig.oil_forecasts,
+                horizon = self.modeltrainerconfig.oil_forecast_horizon
+            )).build(oil_model = oil_model)
+
+            logging.info("exporting the inference bundle for slim serving")
+            try:
+                export_bundle(
+                    FastForecaster.from_artifacts(trained_model = model, timeseries_data = timeseries_data, covariates = covariates),
+                    oil_forecasts = oil_forecast_cache["forecasts"],
+                    trained_last_date = oil_forecast_cache["trained_last_date"]
+                )
+            except ValueError as e:
+                # models the fast engine cannot reproduce are only served through the full artifacts
+                logging.info(f"inference bundle not exported: {e}")
+
+            self.record_version(manifest, {
+                "version": time.strftime("%Y%m%dT%H%M%S") + f"-{mode}",
+                "mode": mode,
+                "strategy": strategy,
+                "reason": reason,
+                "parent": previous["version"] if previous is not None and mode == "incremental" else None,
+                "updates_since_full": previous["updates_since_full"] + 1 if mode == "incremental" else 0,
+                "trained_last_date": str(trained_last_date.date()),
+                "new_days": new_days,
+                "trees": model.model.booster_.num_trees(),
+                "oil_trees": oil_model.model.booster_.num_trees(),
+                "seconds": round(time.perf_counter() - start, 2),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+            })
+
             logging.info(">>> MODEL TRAINER COMPLETED <<<")
 
         except Exception as e:
             logging.info(CustomException(e))
-            print(CustomException(e))
\ No newline at end of file
+            print(CustomException(e))
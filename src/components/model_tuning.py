@@ -0,0 +1,343 @@
+from src.utils.exception import CustomException
+from src.utils.logger import logging
+from src.utils.instrumentation import instrument
+from src.utils.covariate_store import CovariateStore
+from src.utils.oil_forecast_cache import file_hash
+from src.utils.metrics import METRICS, error_sums, metrics_from_sums
+from src.components.model_backtesting import arrange_series, build_design_matrix, lag_window
+from src.components.model_trainer import ModelTrainer
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, Tuple
+import multiprocessing
+import lightgbm as lgb
+import hashlib
+import joblib
+import json
+import shutil
+import time
+import numpy as np
+import os
+
+@dataclass
+class ModelTuningConfig:
+    timeseries_data:str = os.path.join("artifacts", "timeseries_data.joblib")
+    covariates:str = os.path.join("artifacts", "covariates")
+    cache_dir:str = os.path.join("artifacts", "tuning")
+    tuning_trials:str = os.path.join("artifacts", "tuning_trials.jsonl")
+    tuning_summary:str = os.path.join("artifacts", "tuning_summary.json")
+    n_trials:int = int(os.getenv("TUNING_TRIALS", 20))
+    n_workers:int = os.cpu_count() or 1
+    validation_days:int = 30
+    # days before the validation days that early stopping picks the number of trees on, kept apart from the
+    # validation days that rank the trials
+    stopping_days:int = 30
+    metric:str = "rmsle"
+    seed:int = 42
+    early_stopping_rounds:int = 50
+    # the trials only see binned values, so float32 halves the memory of the matrix at no cost to the scores
+    design_matrix_dtype:str = "float32"
+    max_bin:int = 255
+    keep_cached_matrices:int = 2
+    # LGBMRegressor parameters, sampled uniformly ("int", "float") or log-uniformly ("log") between the bounds
+    search_space:Dict[str, Tuple[str, float, float]] = field(default_factory = lambda: {
+        "learning_rate": ("log", 0.01, 0.3),
+        "num_leaves": ("int", 15, 255),
+        "min_child_samples": ("int", 5, 200),
+        "subsample": ("float", 0.5, 1.0),
+        "colsample_bytree": ("float", 0.5, 1.0),
+        "reg_lambda": ("log", 1e-3, 10.0)
+    })
+
+train_file = "train.bin"
+stopping_file = "stopping.bin"
+valid_features_file = "valid_features.npy"
+valid_labels_file = "valid_labels.npy"
+spec_file = "spec.json"
+
+# pre-filtering would fix min_child_samples at its first value for every trial sharing a Dataset
+dataset_params = {"feature_pre_filter": False, "verbose": -1}
+
+# datasets of the cached matrix, loaded once in every trial process
+_datasets = {}
+
+
+def load_datasets(cache_path:str):
+
+    """
+    This function is responsible for loading the cached training and early stopping Datasets and the validation
+    arrays of a trial process, keeping them for every trial the process runs
+    """
+
+    if _datasets.get("path") != cache_path:
+        train = lgb.Dataset(os.path.join(cache_path, train_file), params = dataset_params)
+        _datasets.update(
+            path = cache_path,
+            train = train,
+            stopping = lgb.Dataset(os.path.join(cache_path, stopping_file), reference = train, params = dataset_params),
+            valid_features = np.load(os.path.join(cache_path, valid_features_file), mmap_mode = "r"),
+            valid_labels = np.load(os.path.join(cache_path, valid_labels_file), mmap_mode = "r")
+        )
+    return _datasets
+
+
+def run_trial(trial, cache_path, n_series, metric, early_stopping_rounds, n_jobs):
+
+    """
+    This function is responsible for training one trial's model on the cached matrix, stopping once the error on the
+    early stopping days stops improving, and scoring its one-step forecasts of the validation days that follow them,
+    which the number of trees was not picked on
+    """
+
+    start = time.perf_counter()
+    datasets = load_datasets(cache_path)
+    params = dict(trial["params"])
+    num_boost_round = params.pop("n_estimators")
+
+    booster = lgb.train(
+        {**params, "objective": "regression", "n_jobs": n_jobs, "verbosity": -1},
+        datasets["train"],
+        num_boost_round = num_boost_round,
+        valid_sets = [datasets["stopping"]],
+        callbacks = [lgb.early_stopping(early_stopping_rounds, verbose = False)]
+    )
+    best_iteration = booster.best_iteration or num_boost_round
+    predictions = booster.predict(np.asarray(datasets["valid_features"]), num_iteration = best_iteration)
+
+    # the validation rows are ordered date by date, the metrics are pooled over every series and date
+    sums = error_sums(np.asarray(datasets["valid_labels"]).reshape(-1, n_series), predictions.reshape(-1, n_series))
+    scores = metrics_from_sums({name: np.sum(value) for name, value in sums.items()})
+
+    return {
+        "trial": trial["trial"],
+        "params": {**trial["params"], "n_estimators": int(best_iteration)},
+        "max_estimators": int(num_boost_round),
+        "score": float(scores[metric]),
+        **{name: float(scores[name]) for name in METRICS},
+        "seconds": round(time.perf_counter() - start, 3),
+        "pid": os.getpid()
+    }
+
+
+class ModelTuning:
+    def __init__(self):
+        self.modeltuningconfig = ModelTuningConfig()
+        logging.info(">>> MODEL TUNING STARTED <<<")
+
+    def matrix_key(self, target_lags, past_lags) -> Tuple[str, Dict[str, Any]]:
+
+        """
+        This function is responsible for keying the cached matrix on the lag spec, the validation split, the binning
+        and the md5 of the series and covariates it is built from, so any change to them builds a new one
+        """
+
+        covariate_files = sorted(entry.name for entry in os.scandir(self.modeltuningconfig.covariates) if entry.is_file())
+        spec = {
+            "target_lags": [int(lag) for lag in target_lags],
+            "past_lags": [int(lag) for lag in past_lags],
+            "validation_days": self.modeltuningconfig.validation_days,
+            "stopping_days": self.modeltuningconfig.stopping_days,
+            "design_matrix_dtype": self.modeltuningconfig.design_matrix_dtype,
+            "max_bin": self.modeltuningconfig.max_bin,
+            "data": {
+                "timeseries_data": file_hash(self.modeltuningconfig.timeseries_data),
+                **{name: file_hash(os.path.join(self.modeltuningconfig.covariates, name)) for name in covariate_files}
+            }
+        }
+        key = hashlib.md5(json.dumps(spec, sort_keys = True).encode()).hexdigest()[:16]
+        return key, spec
+
+    def build_matrix(self, cache_path, spec, target_lags, past_lags):
+
+        """
+        This function is responsible for building the lag design matrix and splitting it by date into the training
+        rows, the stopping_days rows early stopping is checked on and the last validation_days rows the trials are
+        scored on. The first two are saved as binned LightGBM Datasets and the validation rows kept raw for scoring.
+        Files are written to a temporary directory moved into place once complete.
+        """
+
+        timeseries_data = joblib.load(self.modeltuningconfig.timeseries_data)
+        covariates = CovariateStore.load(self.modeltuningconfig.covariates)
+        series_keys = [str(component) for component in timeseries_data.components]
+        targets, covariate_values = arrange_series(timeseries_data, covariates, series_keys)
+
+        n_dates, n_series = targets.shape
+        held_out_days = self.modeltuningconfig.stopping_days + self.modeltuningconfig.validation_days
+        if n_dates - lag_window(target_lags, past_lags) <= held_out_days:
+            raise ValueError(f"{held_out_days} stopping and validation days do not fit in {n_dates} dates of history")
+
+        features, labels = build_design_matrix(
+            targets,
+            covariate_values,
+            target_lags,
+            past_lags,
+            dtype = np.dtype(self.modeltuningconfig.design_matrix_dtype)
+        )
+        del covariate_values
+        n_valid = self.modeltuningconfig.validation_days * n_series
+        n_train = len(labels) - n_valid - self.modeltuningconfig.stopping_days * n_series
+        n_fit = len(labels) - n_valid
+
+        partial_path = cache_path + ".partial"
+        shutil.rmtree(partial_path, ignore_errors = True)
+        os.makedirs(partial_path)
+
+        params = {**dataset_params, "max_bin": self.modeltuningconfig.max_bin}
+        train = lgb.Dataset(features[:n_train], label = labels[:n_train], params = params, free_raw_data = True)
+        train.save_binary(os.path.join(partial_path, train_file))
+        stopping = lgb.Dataset(features[n_train:n_fit], label = labels[n_train:n_fit], reference = train, params = params)
+        stopping.save_binary(os.path.join(partial_path, stopping_file))
+        np.save(os.path.join(partial_path, valid_features_file), features[n_fit:])
+        np.save(os.path.join(partial_path, valid_labels_file), labels[n_fit:])
+
+        spec = {
+            **spec,
+            "series": n_series,
+            "train_rows": int(n_train),
+            "stopping_rows": int(n_fit - n_train),
+            "valid_rows": int(n_valid)
+        }
+        with open(os.path.join(partial_path, spec_file), "w") as file:
+            json.dump(spec, file)
+
+        shutil.rmtree(cache_path, ignore_errors = True)
+        os.replace(partial_path, cache_path)
+        return spec
+
+    def prune_cache(self, cache_path):
+
+        """
+        This function is responsible for removing all but the keep_cached_matrices most recently used matrices
+        """
+
+        entries = sorted(
+            (entry for entry in os.scandir(self.modeltuningconfig.cache_dir) if entry.is_dir() and entry.path != cache_path),
+            key = lambda entry: entry.stat().st_mtime,
+            reverse = True
+        )
+        for entry in entries[max(0, self.modeltuningconfig.keep_cached_matrices - 1):]:
+            shutil.rmtree(entry.path, ignore_errors = True)
+
+    def sample_trials(self, baseline):
+
+        """
+        This function is responsible for drawing the trial parameters from the search space, the first trial being the
+        configuration the sales model is trained with
+        """
+
+        rng = np.random.default_rng(self.modeltuningconfig.seed)
+        trials = [{"trial": 0, "params": baseline}]
+        for trial in range(1, self.modeltuningconfig.n_trials):
+            params = {"n_estimators": baseline["n_estimators"]}
+            for name, (kind, low, high) in self.modeltuningconfig.search_space.items():
+                if kind == "int":
+                    params[name] = int(rng.integers(low, high + 1))
+                elif kind == "log":
+                    params[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                else:
+                    params[name] = float(rng.uniform(low, high))
+            # row subsampling only takes effect when bagging is switched on
+            if params.get("subsample", 1.0) < 1.0:
+                params["subsample_freq"] = 1
+            trials.append({"trial": trial, "params": params})
+        return trials
+
+    @instrument()
+    def tune_model(self):
+
+        """
+        This function is responsible for the hyperparameter search of the sales model. The lag design matrix and its
+        binned LightGBM Datasets are built once per lag spec and data and cached on disk, and the trials run in parallel
+        processes that all load the same cached Datasets. Every trial is logged with its time and validation scores to a
+        JSON lines file as it finishes, and the best one to a JSON summary.
+        """
+
+        logging.info("executing tune_model function")
+        try:
+            start = time.perf_counter()
+            model = ModelTrainer().create_sales_model()
+            target_lags = model.lags["target"]
+            past_lags = model.lags["past"]
+
+            key, spec = self.matrix_key(target_lags, past_lags)
+            cache_path = os.path.join(self.modeltuningconfig.cache_dir, key)
+            if os.path.exists(os.path.join(cache_path, spec_file)):
+                with open(os.path.join(cache_path, spec_file)) as file:
+                    spec = json.load(file)
+                # keeps the matrix in use ahead of the others when pruning
+                os.utime(cache_path)
+                cache_hit = True
+                logging.info(f"reusing the cached design matrix {key}")
+            else:
+                logging.info(f"building the lag design matrix {key} of the training series")
+                os.makedirs(self.modeltuningconfig.cache_dir, exist_ok = True)
+                spec = self.build_matrix(cache_path, spec, target_lags, past_lags)
+                cache_hit = False
+            matrix_seconds = round(time.perf_counter() - start, 2)
+            self.prune_cache(cache_path)
+
+            estimator_params = model.model.get_params()
+            baseline = {name: estimator_params[name] for name in ("n_estimators", *self.modeltuningconfig.search_space)}
+            trials = self.sample_trials(baseline)
+
+            n_workers = max(1, min(self.modeltuningconfig.n_workers, len(trials)))
+            trial_kwargs = {
+                "cache_path": cache_path,
+                "n_series": spec["series"],
+                "metric": self.modeltuningconfig.metric,
+                "early_stopping_rounds": self.modeltuningconfig.early_stopping_rounds,
+                # the cores are split between the trials running at the same time
+                "n_jobs": max(1, (os.cpu_count() or 1) // n_workers)
+            }
+
+            logging.info(f"running {len(trials)} trials on {n_workers} workers against {spec['train_rows']} training rows")
+
+            results = []
+            with open(self.modeltuningconfig.tuning_trials, "w") as trials_log:
+                def record(result):
+                    results.append(result)
+                    trials_log.write(json.dumps(result) + "\n")
+                    trials_log.flush()
+                    logging.info(
+                        f"trial {result['trial']} scored {self.modeltuningconfig.metric} {result['score']:.5f} "
+                        f"in {result['seconds']}s with {result['params']}"
+                    )
+
+                if n_workers == 1:
+                    for trial in trials:
+                        record(run_trial(trial, **trial_kwargs))
+                else:
+                    # spawned rather than forked, LightGBM's OpenMP threads in this process do not survive a fork
+                    with ProcessPoolExecutor(max_workers = n_workers, mp_context = multiprocessing.get_context("spawn")) as executor:
+                        futures = [executor.submit(run_trial, trial, **trial_kwargs) for trial in trials]
+                        for future in as_completed(futures):
+                            record(future.result())
+
+            results.sort(key = lambda result: result["trial"])
+            best = min(results, key = lambda result: result["score"])
+            summary = {
+                "matrix": key,
+                "cache_hit": cache_hit,
+                "matrix_seconds": matrix_seconds,
+                "train_rows": spec["train_rows"],
+                "stopping_rows": spec["stopping_rows"],
+                "valid_rows": spec["valid_rows"],
+                "metric": self.modeltuningconfig.metric,
+                "trials": len(results),
+                "seconds": round(time.perf_counter() - start, 2),
+                "baseline": results[0],
+                # the parameters are keyword arguments of create_sales_model
+                "best": best
+            }
+            with open(self.modeltuningconfig.tuning_summary, "w") as jsonfile:
+                json.dump(summary, jsonfile, indent = 3)
+
+            logging.info(
+                f"tuning of {len(results)} trials complete in {summary['seconds']}s, best trial {best['trial']} scored "
+                f"{best['score']:.5f} against {results[0]['score']:.5f} for the current configuration"
+            )
+            logging.info(">>> MODEL TUNING COMPLETED <<<")
+
+        except Exception as e:
+            logging.info(CustomException(e))
+            print(CustomException(e))
@@ -0,0 +1,317 @@
+from src.pipelines.prediction_pipeline import PredictionPipeline
+from src.utils import validate_covariates
+from src.utils.artifact_store import ArtifactStore
+from src.utils.exception import CustomException
+from src.utils.instrumentation import instrument
+from src.utils.logger import logging
+from src.utils.model_registry import ModelRegistry, ModelRegistryConfig
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from typing import Optional
+import multiprocessing
+import argparse
+import ast
+import json
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import os
+
+
+@dataclass
+class BatchForecastConfig:
+    output_dir:str = os.path.join("artifacts", "batch_forecasts")
+    horizons:tuple = (1, 7, 15, 30)
+    shard_size:int = 64
+    n_workers:int = os.cpu_count() or 1
+    # optional table of store_nbr, family, date, onpromotion and is_holiday for the forecast dates, zeros when missing
+    future_covariates:Optional[str] = None
+
+job_file = "_job.json"
+summary_file = "_summary.json"
+shards_dir = "_shards"
+
+# registry and covariates of the job in the running process, set up by init_worker in the shard processes
+_job = {}
+
+
+def init_worker(registry_config, version, series_keys, onpromotion, is_holiday):
+
+    """
+    This function is responsible for setting up a shard process with its own registry over the artifacts of the job.
+    Processes are spawned rather than forked from a parent that already loaded LightGBM, whose OpenMP threads do not
+    survive a fork, so each one loads the artifacts on its first shard, sharing the memory-mapped series.
+    """
+
+    _job.update(
+        registry = ModelRegistry(registry_config),
+        version = version,
+        series_keys = series_keys,
+        onpromotion = onpromotion,
+        is_holiday = is_holiday
+    )
+
+
+def read_future_covariates(path, series_keys, dates):
+
+    """
+    This function is responsible for arranging the promotions and holidays of every series over the forecast dates
+    as (series, date) arrays, leaving zeros for the series and dates the table does not cover
+    """
+
+    onpromotion = np.zeros((len(series_keys), len(dates)), dtype = np.int64)
+    is_holiday = np.zeros((len(series_keys), len(dates)), dtype = np.int64)
+    if path is None:
+        return onpromotion, is_holiday
+
+    frame = ArtifactStore().load(path, columns = ["store_nbr", "family", "date", "onpromotion", "is_holiday"])
+    positions = {key: position for position, key in enumerate(series_keys)}
+    rows = pd.Series([str((int(store_nbr), family)) for store_nbr, family in zip(frame["store_nbr"], frame["family"])]).map(positions).to_numpy()
+    columns = pd.Series(np.arange(len(dates)), index = dates).reindex(pd.to_datetime(frame["date"])).to_numpy()
+    known = ~np.isnan(rows) & ~np.isnan(columns)
+
+    rows = rows[known].astype(np.int64)
+    columns = columns[known].astype(np.int64)
+    onpromotion[rows, columns] = frame["onpromotion"].to_numpy()[known]
+    is_holiday[rows, columns] = frame["is_holiday"].to_numpy()[known]
+    return onpromotion, is_holiday
+
+
+def forecast_shard(shard, output_dir, horizons):
+
+    """
+    This function is responsible for forecasting the series of one shard at the longest horizon and writing the
+    forecasts of every horizon to its own Parquet file. The recursive forecasts of shorter horizons are prefixes of
+    the longest one. Files are written under temporary names and the shard's marker last, so a shard is either
+    complete or redone on resume.
+    """
+
+    start = time.perf_counter()
+    artifacts = _job["registry"].get()
+    if artifacts.version != _job["version"]:
+        raise ValueError(f"artifacts changed to version {artifacts.version} during the job of version {_job['version']}")
+    horizon = max(horizons)
+    positions = range(shard["start"], shard["stop"])
+    series_names = [_job["series_keys"][position] for position in positions]
+    requests = []
+    for position, series_name in zip(positions, series_names):
+        store_nbr, family = ast.literal_eval(series_name)
+        requests.append({
+            "store_nbr": store_nbr,
+            "family": family,
+            "horizon": horizon,
+            "onpromotion": _job["onpromotion"][position].tolist(),
+            "is_holiday": _job["is_holiday"][position].tolist()
+        })
+
+    predictions = PredictionPipeline(registry = _job["registry"])._predict_group(artifacts, horizon, series_names, requests)
+    dates = pd.date_range(artifacts.trained_last_date + pd.Timedelta(days = 1), periods = horizon)
+
+    artifactstore = ArtifactStore()
+    rows = 0
+    for steps in horizons:
+        frame = pd.DataFrame({
+            "store_nbr": np.repeat([request["store_nbr"] for request in requests], steps),
+            "family": np.repeat([request["family"] for request in requests], steps),
+            "date": np.tile(dates[:steps], len(requests)),
+            "step": np.tile(np.arange(1, steps + 1), len(requests)),
+            "forecast": np.concatenate([prediction[:steps] for prediction in predictions])
+        })
+        directory = os.path.join(output_dir, f"horizon={steps}")
+        os.makedirs(directory, exist_ok = True)
+        # names starting with an underscore are skipped by Parquet readers until they are moved into place
+        partial_path = os.path.join(directory, f"_{shard['name']}.parquet")
+        artifactstore.save(frame, partial_path)
+        os.replace(partial_path, os.path.join(directory, f"{shard['name']}.parquet"))
+        rows += len(frame)
+
+    result = {
+        "shard": shard["name"],
+        "series": len(series_names),
+        "rows": rows,
+        "seconds": round(time.perf_counter() - start, 3),
+        "pid": os.getpid()
+    }
+    with open(os.path.join(output_dir, shards_dir, f"{shard['name']}.json"), "w") as file:
+        json.dump(result, file)
+    return result
+
+
+class BatchForecastPipeline:
+    """
+    Offline forecasts of every trained series at several horizons, written to a Parquet dataset partitioned by
+    horizon, one file per shard of series. The shards are forecasted in spawned processes that each load the
+    artifacts once, the training series memory-mapped and shared through the page cache, and write their own files
+    as they finish, so no forecasts accumulate in memory. A rerun against the same artifacts and settings resumes
+    with the shards not yet written.
+    """
+
+    def __init__(self, config:Optional[BatchForecastConfig] = None, registry:Optional[ModelRegistry] = None):
+        self.batchforecastconfig = config if config is not None else BatchForecastConfig()
+        self.registry = registry if registry is not None else ModelRegistry(ModelRegistryConfig(track_memory = False, reload_check_interval = -1, memory_map = True))
+
+    def prepare_output(self, job, restart = False):
+
+        """
+        This function is responsible for keeping the output of an interrupted run of the same job for resuming, and
+        clearing it otherwise. It returns the names of the shards already written.
+        """
+
+        output_dir = self.batchforecastconfig.output_dir
+        job_path = os.path.join(output_dir, job_file)
+        previous = None
+        if os.path.exists(job_path):
+            with open(job_path) as file:
+                previous = json.load(file)
+
+        if restart or previous != job:
+            if previous is not None:
+                logging.info(f"clearing the batch forecasts in {output_dir}, they were produced by another job")
+            shutil.rmtree(output_dir, ignore_errors = True)
+            os.makedirs(os.path.join(output_dir, shards_dir))
+            with open(job_path, "w") as file:
+                json.dump(job, file, indent = 1)
+            return set()
+
+        return {os.path.splitext(entry.name)[0] for entry in os.scandir(os.path.join(output_dir, shards_dir)) if entry.name.endswith(".json")}
+
+    @instrument()
+    def run(self, restart = False):
+
+        """
+        This function is responsible for forecasting every series of the trained model in shards and reporting the
+        throughput of the run in series per second
+        """
+
+        logging.info(">>> BATCH FORECAST STARTED <<<")
+        try:
+            start = time.perf_counter()
+            horizons = tuple(sorted(set(self.batchforecastconfig.horizons)))
+            artifacts = self.registry.load()
+            error = validate_covariates(horizon = max(horizons), onpromotion = [0] * len(artifacts.oil_forecasts), is_holiday = [0] * len(artifacts.oil_forecasts))
+            if error is not None or min(horizons) <= 0:
+                raise ValueError(f"horizons {horizons} cannot be forecasted: {error or 'Forecast horizon must be positive'}")
+
+            series_keys = [str(component) for component in artifacts.timeseries_data.components]
+            dates = pd.date_range(artifacts.trained_last_date + pd.Timedelta(days = 1), periods = max(horizons))
+            onpromotion, is_holiday = read_future_covariates(self.batchforecastconfig.future_covariates, series_keys, dates)
+
+            shard_size = self.batchforecastconfig.shard_size
+            shards = [
+                {"name": f"shard-{number:05d}", "start": start_position, "stop": min(start_position + shard_size, len(series_keys))}
+                for number, start_position in enumerate(range(0, len(series_keys), shard_size))
+            ]
+            job = {
+                "artifacts_version": artifacts.version,
+                "horizons": list(horizons),
+                "shard_size": shard_size,
+                "series": len(series_keys),
+                "future_covariates": None if self.batchforecastconfig.future_covariates is None else {
+                    "path": self.batchforecastconfig.future_covariates,
+                    "mtime_ns": os.stat(self.batchforecastconfig.future_covariates).st_mtime_ns
+                }
+            }
+            completed = self.prepare_output(job, restart = restart)
+            pending = [shard for shard in shards if shard["name"] not in completed]
+            logging.info(f"forecasting {len(series_keys)} series in {len(shards)} shards, {len(shards) - len(pending)} already written")
+
+            n_workers = max(1, min(self.batchforecastconfig.n_workers, len(pending)))
+            forecast_start = time.perf_counter()
+            done_series = 0
+            failed = []
+
+            def record(result):
+                nonlocal done_series
+                done_series += result["series"]
+                elapsed = time.perf_counter() - forecast_start
+                logging.info(
+                    f"{result['shard']} wrote {result['series']} series in {result['seconds']}s, "
+                    f"{done_series} series at {done_series / elapsed:.1f} series/s"
+                )
+
+            if n_workers == 1:
+                _job.update(
+                    registry = self.registry,
+                    version = artifacts.version,
+                    series_keys = series_keys,
+                    onpromotion = onpromotion,
+                    is_holiday = is_holiday
+                )
+                for shard in pending:
+                    try:
+                        record(forecast_shard(shard, self.batchforecastconfig.output_dir, horizons))
+                    except Exception as e:
+                        logging.info(f"{shard['name']} failed: {e}")
+                        failed.append(shard["name"])
+            else:
+                registry_config = replace(self.registry.modelregistryconfig, track_memory = False, reload_check_interval = -1)
+                with ProcessPoolExecutor(
+                    max_workers = n_workers,
+                    mp_context = multiprocessing.get_context("spawn"),
+                    initializer = init_worker,
+                    initargs = (registry_config, artifacts.version, series_keys, onpromotion, is_holiday)
+                ) as executor:
+                    futures = {executor.submit(forecast_shard, shard, self.batchforecastconfig.output_dir, horizons): shard for shard in pending}
+                    for future in as_completed(futures):
+                        try:
+                            record(future.result())
+                        except Exception as e:
+                            logging.info(f"{futures[future]['name']} failed: {e}")
+                            failed.append(futures[future]["name"])
+            _job.clear()
+
+            forecast_seconds = time.perf_counter() - forecast_start
+            summary = {
+                **job,
+                "shards": len(shards),
+                "resumed_shards": len(shards) - len(pending),
+                "failed_shards": sorted(failed),
+                "forecasted_series": done_series,
+                "workers": n_workers,
+                "forecast_seconds": round(forecast_seconds, 3),
+                "seconds": round(time.perf_counter() - start, 3),
+                "series_per_second": round(done_series / forecast_seconds, 2) if forecast_seconds > 0 else None
+            }
+            with open(os.path.join(self.batchforecastconfig.output_dir, summary_file), "w") as file:
+                json.dump(summary, file, indent = 1)
+
+            if failed:
+                logging.info(f"{len(failed)} shards failed, rerun to resume them")
+            logging.info(
+                f"batch forecast of {done_series} series complete in {summary['seconds']}s "
+                f"at {summary['series_per_second']} series/s"
+            )
+            logging.info(">>> BATCH FORECAST COMPLETED <<<")
+            return summary
+
+        except Exception as e:
+            logging.info(CustomException(e))
+            print(CustomException(e))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Forecasts every trained series at several horizons to a Parquet dataset partitioned by horizon")
+    parser.add_argument("--output-dir", default = BatchForecastConfig.output_dir)
+    parser.add_argument("--horizons", nargs = "+", type = int, default = list(BatchForecastConfig.horizons))
+    parser.add_argument("--shard-size", type = int, default = BatchForecastConfig.shard_size)
+    parser.add_argument("--workers", type = int, default = BatchForecastConfig.n_workers)
+    parser.add_argument("--future-covariates", help = "table of store_nbr, family, date, onpromotion and is_holiday over the forecast dates")
+    parser.add_argument("--restart", action = "store_true", help = "discard the shards written by an interrupted run instead of resuming it")
+    args = parser.parse_args()
+
+    summary = BatchForecastPipeline(BatchForecastConfig(
+        output_dir = args.output_dir,
+        horizons = tuple(args.horizons),
+        shard_size = args.shard_size,
+        n_workers = args.workers,
+        future_covariates = args.future_covariates
+    )).run(restart = args.restart)
+
+    if summary is not None:
+        print(
+            f"{summary['forecasted_series']} series forecasted in {summary['forecast_seconds']}s "
+            f"({summary['series_per_second']} series/s), {summary['resumed_shards']} of {summary['shards']} shards resumed, "
+            f"{len(summary['failed_shards'])} failed"
+        )
@@ -0,0 +1,183 @@
+from src.pipelines.prediction_pipeline import PredictionPipeline
+from src.utils.exception import CustomException
+from src.utils.forecast_cache import MISS
+from src.utils.logger import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import asyncio
+import functools
+import os
+import time
+
+
+@dataclass
+class ForecastSchedulerConfig:
+    max_batch_size:int = int(os.getenv("FORECAST_MAX_BATCH_SIZE", 64))
+    max_wait_ms:float = float(os.getenv("FORECAST_MAX_WAIT_MS", 5.0))
+    max_queue_depth:int = int(os.getenv("FORECAST_MAX_QUEUE_DEPTH", 1024))
+    n_workers:int = int(os.getenv("FORECAST_WORKERS", 1))
+
+
+class ForecastScheduler:
+    """
+    Runs forecasting off the event loop on a pool of worker threads. Single-series requests arriving within
+    max_wait_ms of each other are coalesced, up to max_batch_size, into one call to produce_batch_forecasts,
+    and every caller is handed its own slice of the batched result.
+    """
+
+    batch_size_buckets = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+    def __init__(self, pipeline:PredictionPipeline, config:ForecastSchedulerConfig = None):
+        self.pipeline = pipeline
+        self.forecastschedulerconfig = config if config is not None else ForecastSchedulerConfig()
+        self._queue = None
+        self._executor = None
+        self._batcher = None
+        self._slots = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self.dispatched = 0
+        self.in_flight = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_seen_ms = 0.0
+        self.batch_size_counts = {bucket: 0 for bucket in self.batch_size_buckets + (float("inf"),)}
+
+    async def start(self):
+
+        """
+        This function is responsible for starting the worker pool and the task that assembles batches
+        """
+
+        if self._batcher is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(
+            max_workers = self.forecastschedulerconfig.n_workers,
+            thread_name_prefix = "forecast-worker"
+        )
+        self._slots = asyncio.Semaphore(self.forecastschedulerconfig.n_workers)
+        self._batcher = asyncio.create_task(self._assemble_batches())
+        logging.info(f"forecast scheduler started with {self.forecastschedulerconfig}")
+
+    async def stop(self):
+
+        """
+        This function is responsible for stopping the batching task and shutting the worker pool down
+        """
+
+        if self._batcher is None:
+            return
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+        self._batcher = None
+        self._executor.shutdown(wait = True)
+        logging.info("forecast scheduler stopped")
+
+    async def submit(self, request:dict):
+
+        """
+        This function is responsible for queueing a single-series request and waiting for its forecasts
+        """
+
+        # checked against the served version only, loading and reloading artifacts is left to the worker threads
+        cached = self.pipeline.lookup_cached(request)
+        if cached is not MISS:
+            return cached
+
+        if self._queue.qsize() >= self.forecastschedulerconfig.max_queue_depth:
+            self.rejected += 1
+            raise asyncio.QueueFull(f"forecast queue is full ({self._queue.qsize()} requests waiting)")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((request, future, time.perf_counter()))
+        self.requests += 1
+        return await future
+
+    async def _assemble_batches(self):
+        loop = asyncio.get_running_loop()
+        max_wait = self.forecastschedulerconfig.max_wait_ms / 1000
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + max_wait
+            while len(batch) < self.forecastschedulerconfig.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout = remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._slots.acquire()
+            asyncio.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        dispatched_at = time.perf_counter()
+        self.in_flight += 1
+        self.batches += 1
+        self.dispatched += len(batch)
+        for bucket in self.batch_size_counts:
+            if len(batch) <= bucket:
+                self.batch_size_counts[bucket] += 1
+                break
+        for _, _, enqueued_at in batch:
+            wait_ms = (dispatched_at - enqueued_at) * 1000
+            self.total_wait_ms += wait_ms
+            self.max_wait_seen_ms = max(self.max_wait_seen_ms, wait_ms)
+
+        try:
+            # every queued request missed the cache in submit, so it is not looked up a second time
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                functools.partial(self.pipeline.produce_batch_forecasts, [request for request, _, _ in batch], cache_checked = True)
+            )
+            for position, (_, future, _) in enumerate(batch):
+                if future.done():
+                    continue
+                if results["forecasts"][position] is not None:
+                    future.set_result(results["forecasts"][position])
+                else:
+                    future.set_result(results["errors"][position])
+        except Exception as e:
+            logging.info(CustomException(e))
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+
+        """
+        This function is responsible for reporting the queue depth, batch sizes and queueing delays of the scheduler
+        """
+
+        return {
+            "config": {
+                "max_batch_size": self.forecastschedulerconfig.max_batch_size,
+                "max_wait_ms": self.forecastschedulerconfig.max_wait_ms,
+                "max_queue_depth": self.forecastschedulerconfig.max_queue_depth,
+                "n_workers": self.forecastschedulerconfig.n_workers
+            },
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight_batches": self.in_flight,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "mean_batch_size": round(self.dispatched / self.batches, 2) if self.batches else 0.0,
+            "batch_size_histogram": {
+                ("+Inf" if bucket == float("inf") else str(bucket)): count
+                for bucket, count in self.batch_size_counts.items()
+            },
+            "mean_wait_ms": round(self.total_wait_ms / self.dispatched, 3) if self.batches else 0.0,
+            "max_wait_ms": round(self.max_wait_seen_ms, 3)
+        }
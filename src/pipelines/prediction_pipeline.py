@@ -1,21 +1,114 @@
-from src.utils import generate_covariates
+from src.utils import generate_covariates, validate_covariates
 from src.utils.exception import CustomException
-import joblib
-import os
+from src.utils.forecast_cache import ForecastCache, MISS
+from src.utils.instrumentation import instrument
+from src.utils.logger import logging
 from typing import List
-from dataclasses import dataclass
-
-@dataclass
-class PredictionPipelineConfig:
-    oil_model_path:str = os.path.join("artifacts", "oil_model.joblib")
-    trained_model_path:str = os.path.join("artifacts", "trained_model.joblib")
-    covariates_path:str = os.path.join("artifacts", "covariates.joblib")
-    timeseries_data_path:str = os.path.join("artifacts", "timeseries_data.joblib")
+import numpy as np
 
 class PredictionPipeline:
-    def __init__(self):
-        self.predictionpipelineconfig = PredictionPipelineConfig()
+    def __init__(self, registry = None, cache:ForecastCache = None, drift_monitor = None):
+        if registry is None:
+            from src.utils.model_registry import model_registry
+            registry = model_registry
+        self.registry = registry
+        self.cache = cache
+        self.drift_monitor = drift_monitor
+
+    def _validate(self, artifacts, request:dict):
+
+        """
+        This function is responsible for checking a request, returning the reason it cannot be forecasted and its series name
+        """
+
+        error = validate_covariates(
+            horizon = request["horizon"],
+            onpromotion = request["onpromotion"],
+            is_holiday = request["is_holiday"]
+        )
+        if error is not None:
+            return error, None
+
+        series_name = str((request["store_nbr"], request["family"]))
+        if series_name not in artifacts.covariates:
+            return "Invalid combination of store_nbr and family supplied", None
+        else:
+            pass
+
+        # every request is counted once, when it is validated for forecasting or when it is answered from the cache
+        if self.drift_monitor is not None:
+            self.drift_monitor.observe_requests([request])
+
+        return None, series_name
+
+    def _predict_group(self, artifacts, horizon:int, series_names:List[str], requests:List[dict]):
+
+        """
+        This function is responsible for forecasting a group of validated requests sharing one horizon in a single pass
+        """
+
+        fast_forecaster = artifacts.fast_forecaster
+        if fast_forecaster is not None and all(series_name in fast_forecaster for series_name in series_names):
+            # recursive forecast straight on the LightGBM booster over numpy buffers
+            new_covariates = np.stack([
+                fast_forecaster.covariate_rows({
+                    "onpromotion": request["onpromotion"],
+                    "dcoilwtico": artifacts.oil_forecasts,
+                    "is_holiday": request["is_holiday"]
+                }, n = horizon)
+                for request in requests
+            ])
+            predictions = fast_forecaster.predict(series_names, new_covariates)
+            return [[round(x, 2) for x in prediction.tolist()] for prediction in predictions]
+
+        # generating new past covariates for final model
+        past_covariates = []
+        for series_name, request in zip(series_names, requests):
+            covariate = generate_covariates(
+                horizon = horizon,
+                onpromotion = request["onpromotion"],
+                oil_forecasts = list(artifacts.oil_forecasts),
+                is_holiday = request["is_holiday"],
+                trained_last_date = artifacts.trained_last_date
+            )
+            past_covariates.append(artifacts.covariates[series_name].append(covariate))
+
+        predictions = artifacts.trained_model.predict(
+            n = horizon,
+            series = [artifacts.timeseries_data[series_name] for series_name in series_names],
+            past_covariates = past_covariates
+        )
+        return [[round(x, 2) for x in prediction.pd_series().to_list()] for prediction in predictions]
+
+    @staticmethod
+    def _cache_key(request:dict) -> tuple:
+        return ForecastCache.make_key(
+            request["store_nbr"],
+            request["family"],
+            request["horizon"],
+            request["onpromotion"],
+            request["is_holiday"]
+        )
+
+    def lookup_cached(self, request:dict, artifacts = None):
 
+        """
+        This function is responsible for returning the cached forecast of a request, or MISS when it is not cached.
+        Without artifacts, the request is checked against the version being served, never loading or reloading
+        artifacts, so it can be called from the event loop.
+        """
+
+        if self.cache is None:
+            return MISS
+        artifacts = artifacts if artifacts is not None else self.registry.current()
+        if artifacts is None:
+            return MISS
+        cached = self.cache.get(self._cache_key(request), artifacts.version)
+        if cached is not MISS and self.drift_monitor is not None:
+            self.drift_monitor.observe_requests([request])
+        return cached
+
+    @instrument(sample_memory = False)
     def produce_forecasts(
         self,
         store_nbr:int,
@@ -25,43 +118,111 @@ class PredictionPipeline:
         is_holiday:List[int],
     ):
         try:
-            # Loading models and previous covariates
-            oil_model = joblib.load(self.predictionpipelineconfig.oil_model_path)
-            trained_model = joblib.load(self.predictionpipelineconfig.trained_model_path)
-            covariates = joblib.load(self.predictionpipelineconfig.covariates_path)
-            timeseries_data = joblib.load(self.predictionpipelineconfig.timeseries_data_path)
+            # fetching the models, cached oil forecasts and previous covariates loaded once per process
+            artifacts = self.registry.get()
 
-            # generating oil forecasts for 30 days
-            oil_forecasts = oil_model.predict(n = 30).pd_series().to_list()
+            # identical requests against the same artifacts version are answered from the cache
+            request = {
+                "store_nbr": store_nbr,
+                "family": family,
+                "horizon": horizon,
+                "onpromotion": onpromotion,
+                "is_holiday": is_holiday
+            }
+            cached = self.lookup_cached(request, artifacts = artifacts)
+            if cached is not MISS:
+                return cached
 
-            # generating new past covariates for final model
-            covariate = generate_covariates(
-                horizon = horizon,
-                onpromotion = onpromotion,
-                oil_forecasts = oil_forecasts,
-                is_holiday = is_holiday,
-                trained_last_date = oil_model.training_series.end_time()
-            )
-
-            if type(covariate) == str:
-                return covariate
-            else:
-                pass
-
-            series_name = str((store_nbr, family))
-            if series_name not in covariates.keys():
-                return "Invalid combination of store_nbr and family supplied"
+            error, series_name = self._validate(artifacts, request)
+            if error is not None:
+                return error
             else:
                 pass
-            new_covariates = covariates[series_name].append(covariate)
 
             # generating sales predictions for the supplied forecast horizon
-            predictions = trained_model.predict(
-                n = horizon,
-                series = timeseries_data[series_name],
-                past_covariates = new_covariates
+            forecasts = self._predict_group(artifacts, horizon, [series_name], [request])[0]
+            if self.cache is not None:
+                self.cache.put(self._cache_key(request), artifacts.version, forecasts)
+
+            return forecasts
+        except Exception as e:
+            print(CustomException(e))
+
+    def _forecast_group(self, artifacts, horizon:int, group:List[tuple], requests:List[dict], forecasts:list, errors:list):
+
+        """
+        This function is responsible for forecasting the requests of a horizon group into forecasts, and when the group
+        fails, forecasting its requests one by one so a request that cannot be forecasted only fails itself
+        """
+
+        try:
+            predictions = self._predict_group(
+                artifacts,
+                horizon,
+                [series_name for _, series_name in group],
+                [requests[index] for index, _ in group]
             )
+        except Exception as e:
+            if len(group) == 1:
+                logging.info(CustomException(e))
+                errors[group[0][0]] = f"Forecasting failed: {e}"
+                return
+            logging.info(f"forecasting {len(group)} requests of horizon {horizon} failed, forecasting them one by one: {e}")
+            for request_group in group:
+                self._forecast_group(artifacts, horizon, [request_group], requests, forecasts, errors)
+            return
 
-            return [round(x, 2) for x in predictions.pd_series().to_list()]
+        for (index, _), prediction in zip(group, predictions):
+            forecasts[index] = prediction
+            if self.cache is not None:
+                self.cache.put(self._cache_key(requests[index]), artifacts.version, forecasts[index])
+
+    @instrument(sample_memory = False)
+    def produce_batch_forecasts(self, requests:List[dict], cache_checked:bool = False):
+
+        """
+        This function is responsible for forecasting many series at once. Requests sharing a forecast horizon are
+        predicted together in a single call to the trained model, and the results are returned column-wise with
+        one entry per request in the order they were supplied. A request that cannot be forecasted gets its error
+        without failing the others. cache_checked skips the cache lookup for requests the caller already looked up
+        and missed.
+        """
+
+        forecasts = [None] * len(requests)
+        errors = [None] * len(requests)
+        try:
+            artifacts = self.registry.get()
         except Exception as e:
-            print(CustomException(e))
\ No newline at end of file
+            logging.info(CustomException(e))
+            artifacts = None
+            errors = [f"Artifacts could not be loaded: {e}"] * len(requests)
+
+        horizon_groups = {}
+        for index, request in enumerate(requests if artifacts is not None else []):
+            try:
+                cached = MISS if cache_checked else self.lookup_cached(request, artifacts = artifacts)
+                if cached is not MISS:
+                    forecasts[index] = cached
+                    continue
+
+                error, series_name = self._validate(artifacts, request)
+            except Exception as e:
+                logging.info(CustomException(e))
+                error = f"Invalid request: {e}"
+
+            if error is not None:
+                errors[index] = error
+            else:
+                horizon_groups.setdefault(request["horizon"], []).append((index, series_name))
+
+        # generating sales predictions for every series of a horizon in one call
+        for horizon, group in horizon_groups.items():
+            self._forecast_group(artifacts, horizon, group, requests, forecasts, errors)
+
+        return {
+            "store_nbr": [request["store_nbr"] for request in requests],
+            "family": [request["family"] for request in requests],
+            "horizon": [request["horizon"] for request in requests],
+            "forecasts": forecasts,
+            "errors": errors
+        }
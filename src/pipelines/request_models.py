@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from typing import List
+
+# creating the class inheriting the BaseModel class for custom data types
+class Covariate_params(BaseModel):
+    store_nbr: int
+    family: str
+    horizon: int
+    onpromotion: List[int]
+    is_holiday: List[int]
+
+class Batch_params(BaseModel):
+    requests: List[Covariate_params]
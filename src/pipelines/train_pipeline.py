@@ -1,21 +1,218 @@
-from src.components.data_ingestion import DataIngestion
-from src.components.data_transformation import DataTransformation
-from src.components.model_trainer import ModelTrainer
-from src.components.model_evaluation import ModelEvaluation
+from src.components.data_ingestion import DataIngestion, DataIngestionConfig
+from src.components.data_transformation import DataTransformation, DataTransformationConfig
+from src.components.model_trainer import ModelTrainer, ModelTrainerConfig
+from src.components.model_evaluation import ModelEvaluation, ModelEvaluationConfig
+from src.components.model_backtesting import ModelBacktesting, ModelBacktestingConfig
+from src.components.model_tuning import ModelTuning, ModelTuningConfig
+from src.utils.drift_monitor import DriftMonitorConfig, update_drift_profile
+from src.utils.logger import logging
+from src.utils.instrumentation import instrumentationconfig
+from src.utils.stage_runner import Stage, StageRunner
+import src.components.data_ingestion
+import src.components.data_transformation
+import src.components.model_trainer
+import src.components.model_evaluation
+import src.components.model_backtesting
+import src.components.model_tuning
+import src.utils
+import src.utils.artifact_store
+import src.utils.covariate_store
+import src.utils.drift_monitor
+import src.utils.fast_inference
+import src.utils.inference_bundle
+import src.utils.oil_forecast_cache
+import src.utils.outlier_filter
+import argparse
 
-if __name__ == "__main__":
-    
-    dataingestion = DataIngestion()
-    dataingestion.load_dataset()
-
-    datatransformation = DataTransformation()
-    datatransformation.integrate_data()
-    datatransformation.split_data(number_of_test_days = 15)
-    datatransformation.transform_data()
-
-    modeltrainer = ModelTrainer()
-    modeltrainer.train_model()
 
+def evaluate_model():
     modelevaluation = ModelEvaluation()
     train, targets, predictions = modelevaluation.generate_predictions()
     modelevaluation.evaluate_predictions(train, targets, predictions)
+
+
+def build_stages(number_of_test_days = 15, incremental = False, backtest = False, tune = False):
+
+    """
+    This function is responsible for declaring the stages of the training pipeline with their inputs, outputs, parameters and code
+    """
+
+    ingestion = DataIngestionConfig()
+    transformation = DataTransformationConfig()
+    trainer = ModelTrainerConfig()
+    evaluation = ModelEvaluationConfig()
+    backtesting = ModelBacktestingConfig()
+    tuning = ModelTuningConfig()
+    drift = DriftMonitorConfig()
+
+    # incremental runs pull only the new documents, extend the saved series and update the previous models instead of rebuilding them
+    training_mode = "incremental" if incremental else "full"
+    ingestion_mode = "incremental" if incremental else ingestion.ingestion_mode
+
+    stages = [
+        # the database is not hashed, so fresh data is pulled by forcing this stage
+        Stage(
+            name = "data_ingestion",
+            run = lambda: DataIngestion().load_dataset(mode = ingestion_mode),
+            outputs = (ingestion.raw_data, ingestion.oil, ingestion.stores, ingestion.holidays),
+            params = {"database": ingestion.database, "ingestion_mode": ingestion_mode},
+            code = (src.components.data_ingestion, src.utils.artifact_store)
+        ),
+        Stage(
+            name = "integrate_data",
+            run = lambda: DataTransformation().integrate_data(),
+            inputs = (transformation.data, transformation.oil, transformation.stores, transformation.holidays),
+            outputs = (transformation.processed_data,),
+            params = {
+                "integration_mode": transformation.integration_mode,
+                "partition_frequency": transformation.partition_frequency
+            },
+            code = (src.components.data_transformation, src.utils.artifact_store)
+        ),
+        Stage(
+            name = "split_data",
+            run = lambda: DataTransformation().split_data(number_of_test_days = number_of_test_days),
+            inputs = (transformation.processed_data,),
+            outputs = (transformation.train_data, transformation.test_data),
+            params = {"number_of_test_days": number_of_test_days},
+            code = (src.components.data_transformation, src.utils.artifact_store)
+        ),
+        Stage(
+            name = "transform_data",
+            run = lambda: DataTransformation().extend_data() if incremental else DataTransformation().transform_data(),
+            inputs = (transformation.train_data, transformation.test_data),
+            outputs = (
+                transformation.timeseries_data,
+                transformation.covariates,
+                transformation.testseries_data,
+                transformation.test_covariates
+            ),
+            params = {
+                "hampel_window_size": transformation.hampel_window_size,
+                "hampel_n_sigma": transformation.hampel_n_sigma,
+                "training_mode": training_mode
+            },
+            code = (
+                src.components.data_transformation,
+                src.utils.artifact_store,
+                src.utils.covariate_store,
+                src.utils.outlier_filter
+            )
+        ),
+        Stage(
+            name = "train_model",
+            run = lambda: ModelTrainer().train_model(mode = training_mode),
+            inputs = (trainer.timeseries_data, trainer.covariates),
+            outputs = (trainer.oil_model, trainer.trained_model, trainer.oil_forecasts),
+            params = {
+                "oil_forecast_horizon": trainer.oil_forecast_horizon,
+                "training_mode": training_mode,
+                "incremental_strategy": trainer.incremental_strategy,
+                "full_retrain_every": trainer.full_retrain_every
+            },
+            code = (
+                src.components.model_trainer,
+                src.utils.covariate_store,
+                src.utils.oil_forecast_cache,
+                src.utils.fast_inference,
+                src.utils.inference_bundle
+            )
+        ),
+        Stage(
+            name = "evaluate_model",
+            run = evaluate_model,
+            inputs = (
+                evaluation.trained_model,
+                evaluation.oil_model,
+                evaluation.oil_forecasts,
+                evaluation.covariates,
+                evaluation.timeseries_data,
+                evaluation.testseries_data,
+                evaluation.test_covariates
+            ),
+            outputs = (evaluation.results_json,),
+            code = (src.components.model_evaluation, src.utils, src.utils.covariate_store, src.utils.oil_forecast_cache)
+        ),
+        # counts the dates added to the training series into the drift profile, building its reference on the first run,
+        # last so a failure cannot hold back the models
+        Stage(
+            name = "monitor_drift",
+            run = lambda: update_drift_profile(),
+            inputs = (drift.timeseries_data, drift.covariates),
+            outputs = (drift.drift_profile,),
+            params = {
+                "features": drift.features,
+                "n_bins": drift.n_bins,
+                "reference_days": drift.reference_days,
+                "rebaseline": drift.rebaseline
+            },
+            code = (src.utils.drift_monitor, src.utils.covariate_store)
+        )
+    ]
+
+    if backtest:
+        stages.append(Stage(
+            name = "backtest_model",
+            run = lambda: ModelBacktesting().run_backtest(),
+            inputs = (backtesting.timeseries_data, backtesting.covariates),
+            outputs = (backtesting.backtest_metrics, backtesting.backtest_summary),
+            params = {
+                "n_folds": backtesting.n_folds,
+                "fold_step_days": backtesting.fold_step_days,
+                "horizons": backtesting.horizons,
+                "design_matrix_dtype": backtesting.design_matrix_dtype
+            },
+            code = (
+                src.components.model_backtesting,
+                src.components.model_trainer,
+                src.utils.covariate_store,
+                src.utils.fast_inference
+            )
+        ))
+
+    if tune:
+        stages.append(Stage(
+            name = "tune_model",
+            run = lambda: ModelTuning().tune_model(),
+            inputs = (tuning.timeseries_data, tuning.covariates),
+            outputs = (tuning.tuning_trials, tuning.tuning_summary),
+            params = {
+                "n_trials": tuning.n_trials,
+                "validation_days": tuning.validation_days,
+                "metric": tuning.metric,
+                "seed": tuning.seed,
+                "early_stopping_rounds": tuning.early_stopping_rounds,
+                "design_matrix_dtype": tuning.design_matrix_dtype,
+                "max_bin": tuning.max_bin,
+                "search_space": tuning.search_space
+            },
+            code = (
+                src.components.model_tuning,
+                src.components.model_backtesting,
+                src.components.model_trainer,
+                src.utils.covariate_store
+            )
+        ))
+
+    return stages
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Runs the training pipeline, skipping the stages whose outputs are up to date")
+    parser.add_argument("--force", nargs = "+", default = [], metavar = "STAGE", help = "stages to rerun regardless of their cache, or all")
+    parser.add_argument("--number-of-test-days", type = int, default = 15)
+    parser.add_argument("--incremental", action = "store_true", help = "extend the saved series and update the previous models with the new dates only")
+    parser.add_argument("--backtest", action = "store_true", help = "also run the rolling-origin backtest of the sales model")
+    parser.add_argument("--tune", action = "store_true", help = "also run the hyperparameter search of the sales model")
+    parser.add_argument("--profile", choices = ["cprofile", "tracemalloc", "cprofile,tracemalloc"], help = "dump a profile of every stage that runs to logs/profiles")
+    args = parser.parse_args()
+    if args.profile:
+        instrumentationconfig.profile = args.profile
+
+    runner = StageRunner(build_stages(number_of_test_days = args.number_of_test_days, incremental = args.incremental, backtest = args.backtest, tune = args.tune))
+    results = runner.run(force = args.force)
+
+    summary = StageRunner.summary(results)
+    logging.info(f"training pipeline summary\n{summary}")
+    print(summary)
@@ -1,27 +1,44 @@
-from pandas import Timestamp
 from datetime import timedelta
-from darts import TimeSeries
-import pandas as pd
-from typing import List
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    from pandas import Timestamp
+
+def validate_covariates(horizon:int, onpromotion:List[int], is_holiday:List[int]):
+
+    """
+    This function is responsible for checking a forecast horizon against the supplied covariates, returning the reason
+    they are invalid or None
+    """
+
+    if horizon > 30:
+        return "Forecast horizon cannot be greater than 30"
+    elif horizon <= 0:
+        return "Forecast horizon must be positive"
+    elif (horizon > len(onpromotion)) | (horizon > len(is_holiday)):
+        return "Length mismatch"
+    else:
+        return None
 
 def generate_covariates(
         horizon:int,
         onpromotion:List[int],
         oil_forecasts:List[float],
         is_holiday:List[int],
-        trained_last_date:Timestamp
+        trained_last_date:"Timestamp"
     ):
 
     """
     This function is responsible for generating past covariates for forecasting of sales
     """
 
-    if horizon > 30:
-        return "Forecast horizon cannot be greater than 30"
-    elif horizon <= 0:
-        return "Forecast horizon must be positive"
-    elif (horizon > len(onpromotion)) | (horizon > len(is_holiday)):
-        return "Length mismatch"
+    # pandas and darts are imported on first use, so the serving path can validate requests without loading them
+    from darts import TimeSeries
+    import pandas as pd
+
+    error = validate_covariates(horizon = horizon, onpromotion = onpromotion, is_holiday = is_holiday)
+    if error is not None:
+        return error
     else:
         new_covariates = pd.DataFrame(data = {
             "onpromotion":onpromotion[:horizon],
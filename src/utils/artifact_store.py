@@ -0,0 +1,313 @@
+from src.utils.logger import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import itertools
+import json
+import shutil
+import pandas as pd
+import os
+
+
+@dataclass
+class ArtifactStoreConfig:
+    categorical_columns:Tuple[str, ...] = ("family", "city", "state")
+    datetime_columns:Tuple[str, ...] = ("date",)
+    integer_dtypes:Dict[str, str] = field(default_factory = lambda: {
+        "id": "int32",
+        "store_nbr": "int16",
+        "cluster": "int16",
+        "onpromotion": "int32",
+        "is_holiday": "int8"
+    })
+    memory_map:bool = True
+    batch_size:int = 100000
+
+
+class ParquetFormat:
+    def write(self, frame:pd.DataFrame, path:str):
+        frame.to_parquet(path, index = False)
+
+    def read(self, path:str, columns:Optional[List[str]], memory_map:bool) -> pd.DataFrame:
+        return pd.read_parquet(path, columns = columns, memory_map = memory_map)
+
+    @staticmethod
+    def _schema(tables):
+        import pyarrow as pa
+
+        fields = []
+        for column in tables[0].schema:
+            # a column with only nulls so far takes its type from the first batch holding values
+            column = next((table.schema.field(column.name) for table in tables if not pa.types.is_null(table.schema.field(column.name).type)), column)
+            # categorical codes may need wider indices in later batches than in the first one
+            if pa.types.is_dictionary(column.type):
+                column = pa.field(column.name, pa.dictionary(pa.int32(), column.type.value_type))
+            fields.append(column)
+        return pa.schema(fields, metadata = tables[-1].schema.metadata)
+
+    def write_batches(self, frames:Iterable[pd.DataFrame], path:str) -> int:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        pending = []
+        records = 0
+        try:
+            for frame in frames:
+                table = pa.Table.from_pandas(frame, preserve_index = False)
+                records += len(frame)
+                if writer is not None:
+                    writer.write_table(table.select(writer.schema.names).cast(writer.schema))
+                    continue
+
+                # the file schema is fixed once every column has a type, batches of only nulls are held until then
+                pending.append(table)
+                schema = self._schema(pending)
+                if any(pa.types.is_null(column.type) for column in schema):
+                    continue
+                writer = pq.ParquetWriter(path, schema)
+                for table in pending:
+                    writer.write_table(table.select(schema.names).cast(schema))
+                pending = []
+
+            if pending:
+                schema = self._schema(pending)
+                writer = pq.ParquetWriter(path, schema)
+                for table in pending:
+                    writer.write_table(table.select(schema.names).cast(schema))
+        finally:
+            if writer is not None:
+                writer.close()
+        return records
+
+    def read_batches(self, path:str, batch_size:int, memory_map:bool) -> Iterator[pd.DataFrame]:
+        import pyarrow.parquet as pq
+
+        # a partitioned artifact is read file by file in the order of the partition names
+        paths = PartitionedDataset(path).files() if os.path.isdir(path) else [path]
+        for path in paths:
+            for batch in pq.ParquetFile(path, memory_map = memory_map).iter_batches(batch_size = batch_size):
+                yield batch.to_pandas()
+
+
+class CsvFormat:
+    def write(self, frame:pd.DataFrame, path:str):
+        frame.to_csv(path, index = False)
+
+    def read(self, path:str, columns:Optional[List[str]], memory_map:bool) -> pd.DataFrame:
+        return pd.read_csv(path, usecols = columns, memory_map = memory_map)
+
+    def write_batches(self, frames:Iterable[pd.DataFrame], path:str) -> int:
+        records = 0
+        for frame in frames:
+            frame.to_csv(path, index = False, mode = "w" if records == 0 else "a", header = records == 0)
+            records += len(frame)
+        return records
+
+    def read_batches(self, path:str, batch_size:int, memory_map:bool) -> Iterator[pd.DataFrame]:
+        yield from pd.read_csv(path, chunksize = batch_size, memory_map = memory_map)
+
+
+class ArtifactStore:
+    """
+    Reads and writes the tabular artifacts passed between pipeline stages. The file format is chosen from the
+    extension of the artifact path, so a stage can be switched between formats from its config alone, and every
+    frame goes through the same column typing on its way in and out.
+    """
+
+    formats = {
+        ".parquet": ParquetFormat(),
+        ".csv": CsvFormat()
+    }
+
+    def __init__(self, config:Optional[ArtifactStoreConfig] = None):
+        self.artifactstoreconfig = config if config is not None else ArtifactStoreConfig()
+
+    @classmethod
+    def register_format(cls, extension:str, artifact_format):
+        cls.formats[extension] = artifact_format
+
+    def _format(self, path:str):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in self.formats:
+            raise ValueError(f"No artifact format registered for '{extension}' files")
+        return self.formats[extension]
+
+    def apply_schema(self, frame:pd.DataFrame) -> pd.DataFrame:
+
+        """
+        This function is responsible for casting the known columns of a frame to their compact types
+        """
+
+        for column in self.artifactstoreconfig.datetime_columns:
+            if column in frame.columns and not pd.api.types.is_datetime64_any_dtype(frame[column]):
+                frame[column] = pd.to_datetime(frame[column])
+
+        for column, dtype in self.artifactstoreconfig.integer_dtypes.items():
+            if column in frame.columns and frame[column].dtype != dtype and not frame[column].isna().any():
+                frame[column] = frame[column].astype(dtype)
+
+        for column in self.artifactstoreconfig.categorical_columns:
+            if column in frame.columns and not isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame[column] = frame[column].astype("category")
+
+        return frame
+
+    def save(self, frame:pd.DataFrame, path:str):
+
+        """
+        This function is responsible for typing a frame and writing it to the artifact path
+        """
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        # a partitioned artifact of an earlier run is replaced by the single file
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        self._format(path).write(self.apply_schema(frame.copy(deep = False)), path)
+        logging.info(f"saved {len(frame)} records to {path}")
+
+    def load(self, path:str, columns:Optional[List[str]] = None) -> pd.DataFrame:
+
+        """
+        This function is responsible for reading a typed frame back from the artifact path
+        """
+
+        frame = self._format(path).read(path, columns, self.artifactstoreconfig.memory_map)
+        return self.apply_schema(frame)
+
+    def save_batches(self, frames:Iterable[pd.DataFrame], path:str, append:bool = False) -> int:
+
+        """
+        This function is responsible for writing a stream of frames to one artifact without holding them all in memory.
+        With append set, the records already in the artifact are streamed in ahead of the new ones. The artifact is
+        written next to its destination and moved into place once complete.
+        """
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        frames = (self.apply_schema(frame) for frame in frames)
+        if append and os.path.exists(path):
+            frames = itertools.chain(self.load_batches(path), frames)
+
+        stem, extension = os.path.splitext(path)
+        partial_path = f"{stem}.partial{extension}"
+        records = self._format(path).write_batches(frames, partial_path)
+        if records == 0:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            logging.info(f"no records to save to {path}")
+            return 0
+
+        os.replace(partial_path, path)
+        logging.info(f"saved {records} records to {path}")
+        return records
+
+    def load_batches(self, path:str, batch_size:Optional[int] = None) -> Iterator[pd.DataFrame]:
+
+        """
+        This function is responsible for reading a typed artifact back one batch of records at a time
+        """
+
+        batch_size = batch_size if batch_size is not None else self.artifactstoreconfig.batch_size
+        for frame in self._format(path).read_batches(path, batch_size, self.artifactstoreconfig.memory_map):
+            yield self.apply_schema(frame)
+
+
+class PartitionedDataset:
+    """
+    An artifact stored as a directory of Parquet files, each holding one contiguous date range of its records, with a
+    manifest of the first date, last date and record count of every partition. ArtifactStore.load reads the directory
+    back as one frame in the order of the partitions, while the manifest lets a stage pick partitions by date without
+    opening any of them. The manifest name starts with an underscore so Parquet readers skip it.
+    """
+
+    manifest_file = "_partitions.json"
+
+    def __init__(self, path:str, artifactstore:Optional[ArtifactStore] = None):
+        self.path = path
+        self.artifactstore = artifactstore if artifactstore is not None else ArtifactStore()
+        self._written = []
+
+    @classmethod
+    def create(cls, path:str, artifactstore:Optional[ArtifactStore] = None):
+
+        """
+        This function is responsible for starting an empty dataset at the path, removing any file or dataset already there
+        """
+
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        os.makedirs(path)
+        return cls(path, artifactstore)
+
+    def partitions(self) -> List[dict]:
+        with open(os.path.join(self.path, self.manifest_file)) as file:
+            return json.load(file)["partitions"]
+
+    def files(self) -> List[str]:
+        return sorted(
+            entry.path for entry in os.scandir(self.path)
+            if entry.is_file() and entry.name.endswith(".parquet") and not entry.name.startswith(("_", "."))
+        )
+
+    def select(self, start:Optional[pd.Timestamp] = None, end:Optional[pd.Timestamp] = None) -> List[dict]:
+
+        """
+        This function is responsible for the partitions holding any date between start and end, both included
+        """
+
+        return [
+            partition for partition in self.partitions()
+            if (start is None or pd.Timestamp(partition["end"]) >= start) and (end is None or pd.Timestamp(partition["start"]) <= end)
+        ]
+
+    def load_partition(self, partition:dict, source:Optional[str] = None) -> pd.DataFrame:
+        return self.artifactstore.load(os.path.join(source or self.path, partition["file"]))
+
+    def write(self, name:str, frame:pd.DataFrame, date_column:str = "date"):
+
+        """
+        This function is responsible for writing one partition and recording its date range
+        """
+
+        if frame.empty:
+            return
+        file = f"{name}.parquet"
+        self.artifactstore.save(frame, os.path.join(self.path, file))
+        self._written.append({
+            "file": file,
+            "start": str(frame[date_column].min().date()),
+            "end": str(frame[date_column].max().date()),
+            "records": len(frame)
+        })
+
+    def link(self, partition:dict, source:str):
+
+        """
+        This function is responsible for adding a partition of another dataset unchanged, as a hard link where the
+        filesystem allows it so the records are neither read nor copied
+        """
+
+        source_path = os.path.join(source, partition["file"])
+        destination = os.path.join(self.path, partition["file"])
+        try:
+            os.link(source_path, destination)
+        except OSError:
+            shutil.copy2(source_path, destination)
+        self._written.append(dict(partition))
+
+    def commit(self):
+
+        """
+        This function is responsible for writing the manifest, which marks the dataset complete
+        """
+
+        partitions = sorted(self._written, key = lambda partition: partition["start"])
+        with open(os.path.join(self.path, self.manifest_file), "w") as file:
+            json.dump({"partitions": partitions}, file, indent = 1)
+        logging.info(f"saved {sum(partition['records'] for partition in partitions)} records in {len(partitions)} partitions to {self.path}")
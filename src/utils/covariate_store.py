@@ -0,0 +1,218 @@
+from src.utils.logger import logging
+from collections.abc import Mapping
+from typing import Dict, Optional, Sequence
+import json
+import uuid
+import numpy as np
+import pandas as pd
+import os
+
+
+class CovariateStore(Mapping):
+    """
+    Past covariates of every series kept as one dense array of shape (series, time, feature) for the features
+    that differ between series, and one array of shape (time, feature) for the features shared by all series,
+    such as dcoilwtico. All series share a single date index. Indexing the store by series key returns a Darts
+    TimeSeries assembled on demand, while series_array() returns views into the arrays without copying them.
+    """
+
+    series_values_file = "series_values.npy"
+    global_values_file = "global_values.npy"
+    index_file = "index.json"
+
+    def __init__(
+        self,
+        keys:Sequence[str],
+        dates:pd.DatetimeIndex,
+        components:Sequence[str],
+        series_features:Sequence[str],
+        series_values:np.ndarray,
+        global_features:Sequence[str],
+        global_values:np.ndarray,
+        time_dim:str = "date"
+    ):
+        self.keys_index = {key: position for position, key in enumerate(keys)}
+        self.dates = pd.DatetimeIndex(dates, freq = "infer")
+        self.components = list(components)
+        self.series_features = list(series_features)
+        self.series_values = series_values
+        self.global_features = list(global_features)
+        self.global_values = global_values
+        self.time_dim = time_dim
+
+        # column of every component in the per-series array, or in the shared array when it is a global feature
+        self._layout = [
+            (component in self.global_features,
+             self.global_features.index(component) if component in self.global_features else self.series_features.index(component))
+            for component in self.components
+        ]
+
+    @classmethod
+    def from_timeseries(cls, covariates:Dict, global_features:Sequence[str] = ("dcoilwtico",)):
+
+        """
+        This function is responsible for packing a dict of covariate TimeSeries sharing one time index into a store.
+        A candidate global feature is only shared when its values are identical across every series.
+        """
+
+        keys = list(covariates.keys())
+        first = covariates[keys[0]]
+        components = list(first.components)
+        time_dim = first.time_dim
+        values = np.stack([covariates[key].values(copy = False) for key in keys])
+
+        shared = [
+            feature for feature in global_features
+            if feature in components and (values[:, :, components.index(feature)] == values[:1, :, components.index(feature)]).all()
+        ]
+        series_features = [component for component in components if component not in shared]
+
+        series_values = values[:, :, [components.index(feature) for feature in series_features]]
+        if np.array_equal(series_values.astype(np.float32), series_values):
+            series_values = series_values.astype(np.float32)
+        global_values = values[0][:, [components.index(feature) for feature in shared]]
+
+        return cls(
+            keys = keys,
+            dates = first.time_index,
+            components = components,
+            series_features = series_features,
+            series_values = np.ascontiguousarray(series_values),
+            global_features = shared,
+            global_values = np.ascontiguousarray(global_values),
+            time_dim = time_dim
+        )
+
+    def __getitem__(self, key:str):
+        from darts import TimeSeries
+        import xarray as xr
+
+        values = self.series_array(key)
+        columns = [
+            self.global_values[:, column] if is_global else values[:, column]
+            for is_global, column in self._layout
+        ]
+        stacked = np.stack(columns, axis = 1).astype(np.result_type(self.series_values, self.global_values), copy = False)
+
+        return TimeSeries(xr.DataArray(
+            stacked[:, :, np.newaxis],
+            dims = (self.time_dim, "component", "sample"),
+            coords = {self.time_dim: self.dates, "component": self.components}
+        ))
+
+    def __contains__(self, key) -> bool:
+        return key in self.keys_index
+
+    def __iter__(self):
+        return iter(self.keys_index)
+
+    def __len__(self) -> int:
+        return len(self.keys_index)
+
+    def series_array(self, key:str) -> np.ndarray:
+
+        """
+        This function is responsible for returning the per-series features of a series as a (time, feature) view
+        """
+
+        return self.series_values[self.keys_index[key]]
+
+    def append(self, dates:pd.DatetimeIndex, series_values:np.ndarray, global_values:np.ndarray):
+
+        """
+        This function is responsible for returning a new store extended with the covariates of dates following the
+        last date of this store, given as (series, new dates, series features) and (new dates, global features) arrays
+        """
+
+        dates = pd.DatetimeIndex(dates)
+        if len(dates) and dates[0] != self.dates[-1] + self.dates.freq:
+            raise ValueError(f"appended dates must start on {self.dates[-1] + self.dates.freq}, got {dates[0]}")
+
+        return CovariateStore(
+            keys = list(self.keys_index),
+            dates = self.dates.append(dates),
+            components = self.components,
+            series_features = self.series_features,
+            series_values = np.concatenate([self.series_values, series_values.astype(self.series_values.dtype)], axis = 1),
+            global_features = self.global_features,
+            global_values = np.concatenate([self.global_values, global_values.astype(self.global_values.dtype)], axis = 0),
+            time_dim = self.time_dim
+        )
+
+    def save(self, directory:str):
+
+        """
+        This function is responsible for saving the store as memory-mappable .npy arrays and a JSON index. Every
+        file is written under a temporary name and moved into place, the index last, so processes mapping the
+        previous arrays keep reading them intact and a new index marks a complete store.
+        """
+
+        os.makedirs(directory, exist_ok = True)
+        suffix = f".{uuid.uuid4().hex}.tmp"
+
+        for name, values in ((self.series_values_file, self.series_values), (self.global_values_file, self.global_values)):
+            with open(os.path.join(directory, name + suffix), "wb") as file:
+                np.save(file, values)
+            os.replace(os.path.join(directory, name + suffix), os.path.join(directory, name))
+
+        index = {
+            "keys": list(self.keys_index),
+            "dates": [date.isoformat() for date in self.dates],
+            "components": self.components,
+            "series_features": self.series_features,
+            "global_features": self.global_features,
+            "time_dim": self.time_dim
+        }
+        with open(os.path.join(directory, self.index_file + suffix), "w") as file:
+            json.dump(index, file)
+        os.replace(os.path.join(directory, self.index_file + suffix), os.path.join(directory, self.index_file))
+
+        logging.info(f"saved covariates of {len(self)} series with shape {self.series_values.shape} to {directory}")
+
+    @classmethod
+    def load(cls, directory:str, mmap_mode:Optional[str] = "r"):
+
+        """
+        This function is responsible for loading a saved store, memory-mapping its arrays by default. Until the store
+        is first saved, the covariates.joblib dict of TimeSeries written before the store existed is packed in memory,
+        and the next transformation run saves it as a store.
+        """
+
+        if not os.path.exists(os.path.join(directory, cls.index_file)) and os.path.exists(cls.legacy_path(directory)):
+            import joblib
+
+            logging.info(f"no covariate store in {directory}, packing the legacy covariates of {cls.legacy_path(directory)}")
+            return cls.from_timeseries(joblib.load(cls.legacy_path(directory)))
+
+        with open(os.path.join(directory, cls.index_file)) as file:
+            index = json.load(file)
+
+        return cls(
+            keys = index["keys"],
+            dates = pd.DatetimeIndex(index["dates"]),
+            components = index["components"],
+            series_features = index["series_features"],
+            series_values = np.load(os.path.join(directory, cls.series_values_file), mmap_mode = mmap_mode),
+            global_features = index["global_features"],
+            global_values = np.load(os.path.join(directory, cls.global_values_file), mmap_mode = mmap_mode),
+            time_dim = index["time_dim"]
+        )
+
+    @staticmethod
+    def legacy_path(directory:str) -> str:
+        # covariates.joblib next to the store directory, as the transformation stage wrote them before the store
+        return os.path.normpath(directory) + ".joblib"
+
+    @classmethod
+    def index_path(cls, directory:str) -> str:
+        # the file marking a complete store, or the legacy covariates it is loaded from until the store is saved
+        index_path = os.path.join(directory, cls.index_file)
+        if not os.path.exists(index_path) and os.path.exists(cls.legacy_path(directory)):
+            return cls.legacy_path(directory)
+        return index_path
+
+    @classmethod
+    def size_on_disk(cls, directory:str) -> int:
+        if not os.path.isdir(directory) and os.path.exists(cls.legacy_path(directory)):
+            return os.path.getsize(cls.legacy_path(directory))
+        return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
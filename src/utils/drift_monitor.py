@@ -0,0 +1,449 @@
+"""
+Streaming drift statistics of the sales and past covariates of every series. A reference profile is built once from
+the training artifacts, then windows of newer observations are updated incrementally from the dates appended to the
+training series and from the covariates of forecast requests. Drift scores are read from the running counts, so
+monitoring never rescans the history.
+
+    python -m src.utils.drift_monitor
+"""
+from src.utils.logger import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import json
+import threading
+import uuid
+import numpy as np
+import os
+
+
+@dataclass
+class DriftMonitorConfig:
+    drift_profile:str = os.path.join("artifacts", "drift_profile.npz")
+    timeseries_data:str = os.path.join("artifacts", "timeseries_data.joblib")
+    covariates:str = os.path.join("artifacts", "covariates")
+    features:tuple = ("sales", "onpromotion", "dcoilwtico", "is_holiday")
+    n_bins:int = 10
+    reference_days:int = 365
+    # population stability index above which a series is reported as drifting
+    psi_warning:float = 0.1
+    psi_alert:float = 0.25
+    # series with fewer observations in a window are not scored
+    min_count:int = 14
+    top_n:int = 10
+    # set to 1 to rebuild the reference profile from the current training artifacts
+    rebaseline:bool = os.getenv("DRIFT_REBASELINE", "0") == "1"
+
+WINDOWS = ("data", "requests")
+
+
+class StreamingStats:
+    """
+    Running statistics of one feature for a set of rows, one row per series or a single row for a feature shared by
+    all series. Each row holds its count, mean and sum of squared deviations, updated with Welford's method, and a
+    histogram over fixed bin edges. Two instances with the same edges merge by adding their histograms and pooling
+    their moments, so statistics gathered by separate processes or over separate periods can be combined.
+    """
+
+    def __init__(self, edges:np.ndarray):
+        # interior edges of shape (rows, n_bins - 1), the outer bins are open ended and rows with fewer distinct
+        # edges are padded with inf, leaving their top bins unused
+        self.edges = np.asarray(edges, dtype = np.float64)
+        rows, n_bins = self.edges.shape[0], self.edges.shape[1] + 1
+        self.histogram = np.zeros((rows, n_bins), dtype = np.int64)
+        self.count = np.zeros(rows, dtype = np.int64)
+        self.mean = np.zeros(rows, dtype = np.float64)
+        self.m2 = np.zeros(rows, dtype = np.float64)
+
+    @classmethod
+    def from_values(cls, values:np.ndarray, n_bins:int):
+
+        """
+        This function is responsible for placing the bin edges of every row at the distinct quantiles of its
+        (rows, time) values and counting the values in them. Rows with fewer distinct values than edges, such as
+        binary or mostly zero features, get an edge at every value instead, so each value has its own bin and
+        values above the largest one fall in the next.
+        """
+
+        values = np.asarray(values, dtype = np.float64)
+        quantiles = np.linspace(0, 1, n_bins + 1)[1:-1]
+        edges = np.full((len(values), n_bins - 1), np.inf)
+        for row, row_values in enumerate(values):
+            row_values = row_values[~np.isnan(row_values)]
+            if not len(row_values):
+                continue
+            row_edges = np.unique(row_values)
+            if len(row_edges) > n_bins - 1:
+                row_edges = np.unique(np.quantile(row_values, quantiles))
+            edges[row, :len(row_edges)] = row_edges
+        stats = cls(edges)
+        stats.update(np.repeat(np.arange(len(values)), values.shape[1]), values.reshape(-1))
+        return stats
+
+    def empty_like(self):
+        return StreamingStats(self.edges)
+
+    def _combine(self, count, mean, m2):
+        # pooled moments of two sets of observations (Chan et al.), reduces to Welford's update for a single value
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            weight = np.where(total > 0, count / total, 0.0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * weight
+        self.count = total
+
+    def update(self, rows:np.ndarray, values:np.ndarray):
+
+        """
+        This function is responsible for adding observations given as parallel arrays of row positions and values,
+        skipping missing values
+        """
+
+        rows = np.asarray(rows, dtype = np.int64)
+        values = np.asarray(values, dtype = np.float64)
+        known = ~np.isnan(values)
+        rows, values = rows[known], values[known]
+        if not len(values):
+            return
+
+        n_rows = len(self.count)
+        count = np.bincount(rows, minlength = n_rows)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            mean = np.where(count > 0, np.bincount(rows, weights = values, minlength = n_rows) / count, 0.0)
+        m2 = np.bincount(rows, weights = (values - mean[rows]) ** 2, minlength = n_rows)
+        self._combine(count, mean, m2)
+
+        # bins are closed on the right, the bin of a value is np.searchsorted(edges, value, side = "left") of its row
+        bins = (self.edges[rows] < values[:, None]).sum(axis = 1)
+        np.add.at(self.histogram, (rows, bins), 1)
+
+    def merge(self, other:"StreamingStats"):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("only statistics over the same bin edges can be merged")
+        self.histogram += other.histogram
+        self._combine(other.count, other.mean, other.m2)
+
+    @property
+    def std(self) -> np.ndarray:
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return np.sqrt(np.where(self.count > 1, self.m2 / (self.count - 1), np.nan))
+
+    def psi(self, reference:"StreamingStats", smoothing:float = 0.5) -> np.ndarray:
+
+        """
+        This function is responsible for the population stability index of every row against the reference, with
+        additive smoothing so empty bins do not make it infinite. The unused bins of rows with padded edges are left out.
+        """
+
+        used = np.concatenate([np.ones((len(reference.edges), 1), dtype = bool), np.isfinite(reference.edges)], axis = 1)
+        n_used = used.sum(axis = 1, keepdims = True)
+        expected = np.where(used, (reference.histogram + smoothing) / (reference.histogram.sum(axis = 1, keepdims = True) + smoothing * n_used), 1.0)
+        actual = np.where(used, (self.histogram + smoothing) / (self.histogram.sum(axis = 1, keepdims = True) + smoothing * n_used), 1.0)
+        return ((actual - expected) * np.log(actual / expected)).sum(axis = 1)
+
+    def mean_shift(self, reference:"StreamingStats") -> np.ndarray:
+
+        """
+        This function is responsible for the shift of every row's mean from the reference mean, in reference standard deviations
+        """
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return np.where(reference.std > 0, (self.mean - reference.mean) / reference.std, np.nan)
+
+    def arrays(self, prefix:str) -> Dict[str, np.ndarray]:
+        return {f"{prefix}.{name}": getattr(self, name) for name in ("edges", "histogram", "count", "mean", "m2")}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix:str):
+        stats = cls(arrays[f"{prefix}.edges"])
+        for name in ("histogram", "count", "mean", "m2"):
+            setattr(stats, name, np.array(arrays[f"{prefix}.{name}"]))
+        return stats
+
+
+class DriftMonitor:
+    """
+    Reference statistics of every monitored feature with one window of newer observations per source: "data" for the
+    dates appended to the training series, saved with the profile, and "requests" for the covariates of forecast
+    requests, kept in memory by the serving process. sales, onpromotion and is_holiday are tracked per series and
+    dcoilwtico, shared by all series, in a single row.
+    """
+
+    def __init__(self, config:Optional[DriftMonitorConfig] = None):
+        self.driftmonitorconfig = config if config is not None else DriftMonitorConfig()
+        self.series_keys = []
+        self.keys_index = {}
+        self.meta = {}
+        self.reference = {}
+        self.windows = {window: {} for window in WINDOWS}
+        self._signature = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.reference)
+
+    @staticmethod
+    def feature_values(timeseries_data, covariates, series_keys:List[str], start, end) -> Dict[str, np.ndarray]:
+
+        """
+        This function is responsible for the values of every feature between the start and end positions of the
+        training series dates, as (rows, time) arrays
+        """
+
+        dates = timeseries_data.time_index[start:end]
+        values = {"sales": np.asarray(timeseries_data.values(copy = False)[start:end], dtype = np.float64).T}
+        positions = [covariates.keys_index[key] for key in series_keys]
+        columns = covariates.dates.get_indexer(dates)
+        columns = columns[columns >= 0]
+        for feature in ("onpromotion", "is_holiday"):
+            values[feature] = np.asarray(covariates.series_values[positions][:, columns, covariates.series_features.index(feature)], dtype = np.float64)
+        values["dcoilwtico"] = np.asarray(covariates.global_values[columns, covariates.global_features.index("dcoilwtico")], dtype = np.float64)[None, :]
+        return values
+
+    def build_reference(self, timeseries_data, covariates):
+
+        """
+        This function is responsible for building the reference statistics from the last reference_days dates of the
+        training series, and starting empty windows after them
+        """
+
+        series_keys = [str(component) for component in timeseries_data.components]
+        start = max(0, len(timeseries_data) - self.driftmonitorconfig.reference_days)
+        values = self.feature_values(timeseries_data, covariates, series_keys, start, len(timeseries_data))
+
+        with self._lock:
+            self.series_keys = series_keys
+            self.keys_index = {key: position for position, key in enumerate(series_keys)}
+            self.reference = {
+                feature: StreamingStats.from_values(values[feature], self.driftmonitorconfig.n_bins)
+                for feature in self.driftmonitorconfig.features
+            }
+            self.windows = {window: {feature: stats.empty_like() for feature, stats in self.reference.items()} for window in WINDOWS}
+            self.meta = {
+                "reference_start": str(timeseries_data.time_index[start].date()),
+                "reference_end": str(timeseries_data.end_time().date()),
+                "observed_until": str(timeseries_data.end_time().date())
+            }
+        logging.info(f"built the drift reference of {len(series_keys)} series from {self.meta['reference_start']} to {self.meta['reference_end']}")
+
+    def update_from_data(self, timeseries_data, covariates) -> int:
+
+        """
+        This function is responsible for adding the dates of the training series after the last observed one to the
+        data window, returning the number of new dates
+        """
+
+        import pandas as pd
+
+        start = int(timeseries_data.time_index.searchsorted(pd.Timestamp(self.meta["observed_until"]), side = "right"))
+        if start >= len(timeseries_data):
+            return 0
+        values = self.feature_values(timeseries_data, covariates, self.series_keys, start, len(timeseries_data))
+
+        with self._lock:
+            for feature, stats in self.windows["data"].items():
+                rows = np.repeat(np.arange(values[feature].shape[0]), values[feature].shape[1])
+                stats.update(rows, values[feature].reshape(-1))
+            self.meta["observed_until"] = str(timeseries_data.end_time().date())
+        logging.info(f"added {len(timeseries_data) - start} new dates up to {self.meta['observed_until']} to the drift data window")
+        return len(timeseries_data) - start
+
+    def observe_requests(self, requests:List[dict]):
+
+        """
+        This function is responsible for adding the promotions and holidays of forecast requests to the requests
+        window, ignoring unknown series and the values past each request's horizon
+        """
+
+        if not self.ready:
+            return
+        rows, onpromotion, is_holiday = [], [], []
+        for request in requests:
+            position = self.keys_index.get(str((request["store_nbr"], request["family"])))
+            horizon = request["horizon"]
+            if position is None or not isinstance(horizon, int) or horizon <= 0:
+                continue
+            values = request["onpromotion"][:horizon], request["is_holiday"][:horizon]
+            if len(values[0]) != horizon or len(values[1]) != horizon:
+                continue
+            rows.extend([position] * horizon)
+            onpromotion.extend(values[0])
+            is_holiday.extend(values[1])
+        if not rows:
+            return
+
+        with self._lock:
+            window = self.windows["requests"]
+            if "onpromotion" in window:
+                window["onpromotion"].update(rows, onpromotion)
+            if "is_holiday" in window:
+                window["is_holiday"].update(rows, is_holiday)
+
+    def merge(self, other:"DriftMonitor", window:str = "requests"):
+
+        """
+        This function is responsible for adding the window statistics of another monitor over the same reference,
+        such as the one of another serving worker
+        """
+
+        if other.series_keys != self.series_keys:
+            raise ValueError("only monitors of the same series can be merged")
+        with self._lock:
+            for feature, stats in other.windows[window].items():
+                self.windows[window][feature].merge(stats)
+
+    def scores(self, window:str = "data") -> dict:
+
+        """
+        This function is responsible for scoring the drift of every feature in a window against the reference, as the
+        population stability index and mean shift of every row with at least min_count observations, summarised
+        per feature along with the most drifted series
+        """
+
+        config = self.driftmonitorconfig
+        report = {"window": window, **self.meta, "features": {}, "top": []}
+        if not self.ready:
+            return report
+
+        candidates = []
+        with self._lock:
+            for feature, stats in self.windows[window].items():
+                reference = self.reference[feature]
+                scored = stats.count >= config.min_count
+                psi = stats.psi(reference)
+                shift = stats.mean_shift(reference)
+                report["features"][feature] = {
+                    "observations": int(stats.count.sum()),
+                    "rows_scored": int(scored.sum()),
+                    "psi_mean": float(psi[scored].mean()) if scored.any() else None,
+                    "psi_max": float(psi[scored].max()) if scored.any() else None,
+                    "rows_warning": int((psi[scored] >= config.psi_warning).sum()),
+                    "rows_alert": int((psi[scored] >= config.psi_alert).sum()),
+                    "mean_shift_mean": float(np.nanmean(np.abs(shift[scored]))) if scored.any() and not np.isnan(shift[scored]).all() else None
+                }
+                for row in np.flatnonzero(scored):
+                    candidates.append({
+                        "series": self.series_keys[row] if len(stats.count) == len(self.series_keys) else "all",
+                        "feature": feature,
+                        "psi": float(psi[row]),
+                        "mean_shift": None if np.isnan(shift[row]) else float(shift[row]),
+                        "observations": int(stats.count[row])
+                    })
+        report["top"] = sorted(candidates, key = lambda candidate: candidate["psi"], reverse = True)[:config.top_n]
+        return report
+
+    def save(self, path:Optional[str] = None):
+
+        """
+        This function is responsible for saving the reference and the data window to one .npz file, written under a
+        temporary name and moved into place
+        """
+
+        path = path or self.driftmonitorconfig.drift_profile
+        arrays = {}
+        with self._lock:
+            for feature, stats in self.reference.items():
+                arrays.update(stats.arrays(f"reference.{feature}"))
+            for feature, stats in self.windows["data"].items():
+                arrays.update(stats.arrays(f"data.{feature}"))
+            meta = {**self.meta, "series_keys": self.series_keys, "features": list(self.reference)}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+        partial_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(partial_path, "wb") as file:
+            np.savez(file, meta = np.array(json.dumps(meta)), **arrays)
+        os.replace(partial_path, path)
+
+    @staticmethod
+    def _file_signature(path:str):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def load(self, path:Optional[str] = None) -> bool:
+
+        """
+        This function is responsible for loading a saved profile, returning False when there is none. The requests
+        window is kept when the reference of the profile is unchanged and started empty otherwise.
+        """
+
+        path = path or self.driftmonitorconfig.drift_profile
+        signature = self._file_signature(path)
+        if signature is None:
+            return False
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays["meta"]))
+            reference = {feature: StreamingStats.from_arrays(arrays, f"reference.{feature}") for feature in meta.pop("features")}
+            data = {feature: StreamingStats.from_arrays(arrays, f"data.{feature}") for feature in reference}
+        series_keys = meta.pop("series_keys")
+
+        with self._lock:
+            requests = self.windows["requests"]
+            same_reference = series_keys == self.series_keys and reference.keys() == requests.keys() and all(
+                np.array_equal(stats.edges, requests[feature].edges) for feature, stats in reference.items()
+            )
+            if not same_reference:
+                requests = {feature: stats.empty_like() for feature, stats in reference.items()}
+            self.series_keys = series_keys
+            self.keys_index = {key: position for position, key in enumerate(series_keys)}
+            self.meta = meta
+            self.reference = reference
+            self.windows = {"data": data, "requests": requests}
+            self._signature = signature
+        return True
+
+    def reload_if_changed(self) -> bool:
+
+        """
+        This function is responsible for loading the profile again once the training pipeline has saved a new one
+        """
+
+        path = self.driftmonitorconfig.drift_profile
+        signature = self._file_signature(path)
+        if signature is None or signature == self._signature:
+            return False
+        return self.load(path)
+
+
+def update_drift_profile(config:Optional[DriftMonitorConfig] = None) -> dict:
+
+    """
+    This function is responsible for bringing the saved drift profile up to date with the training artifacts: the
+    reference is built when there is no profile, when the series changed or on rebaseline, and otherwise only the
+    dates added since the last update are counted into the data window
+    """
+
+    from src.utils.covariate_store import CovariateStore
+    from src.utils.exception import CustomException
+    import joblib
+
+    logging.info("executing update_drift_profile function")
+    try:
+        monitor = DriftMonitor(config)
+        config = monitor.driftmonitorconfig
+        timeseries_data = joblib.load(config.timeseries_data)
+        covariates = CovariateStore.load(config.covariates)
+
+        if config.rebaseline or not monitor.load() or monitor.series_keys != [str(component) for component in timeseries_data.components]:
+            monitor.build_reference(timeseries_data, covariates)
+        else:
+            monitor.update_from_data(timeseries_data, covariates)
+        monitor.save()
+
+        scores = monitor.scores("data")
+        for feature, summary in scores["features"].items():
+            logging.info(f"drift of {feature}: {summary}")
+        return scores
+
+    except Exception as e:
+        logging.info(CustomException(e))
+        print(CustomException(e))
+
+
+if __name__ == "__main__":
+    scores = update_drift_profile()
+    if scores is not None:
+        print(json.dumps(scores, indent = 3))
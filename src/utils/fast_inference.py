@@ -0,0 +1,144 @@
+from src.utils.logger import logging
+from typing import TYPE_CHECKING, Dict, List, Sequence
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class FastForecaster:
+    """
+    Recursive multi-step forecasting straight on the LightGBM booster of a trained Darts LightGBMModel.
+    The lags of the model are read once and the last values of every series, together with the last past
+    covariates they are lagged against, are kept as dense arrays. A forecast fills one preallocated feature
+    matrix per step for all the requested series and feeds each step's predictions back as target lags,
+    reproducing LightGBMModel.predict without building any TimeSeries.
+    """
+
+    def __init__(
+        self,
+        booster,
+        target_lags:Sequence[int],
+        past_lags:Sequence[int],
+        components:Sequence[str],
+        series_keys:Sequence[str],
+        target_history:np.ndarray,
+        covariate_history:np.ndarray,
+        last_date:"pd.Timestamp"
+    ):
+        self.booster = booster
+        self.target_lags = np.asarray(target_lags, dtype = np.intp)
+        self.past_lags = np.asarray(past_lags, dtype = np.intp)
+        self.components = list(components)
+        self.keys_index = {key: position for position, key in enumerate(series_keys)}
+        self.target_history = target_history
+        self.covariate_history = covariate_history
+        self.last_date = last_date
+
+        self.target_window = int(-self.target_lags.min())
+        self.covariate_window = int(-self.past_lags.min())
+        self.n_features = len(self.target_lags) + len(self.past_lags) * len(self.components)
+
+        if booster.num_feature() != self.n_features:
+            raise ValueError(f"booster expects {booster.num_feature()} features but the lags describe {self.n_features}")
+
+    @classmethod
+    def from_artifacts(cls, trained_model, timeseries_data, covariates):
+
+        """
+        This function is responsible for extracting the booster and lags of a trained LightGBMModel, along with the
+        history it needs from the training series and the covariate store. Models this engine cannot reproduce
+        exactly raise a ValueError.
+        """
+
+        lags = trained_model.lags
+        if set(lags) != {"target", "past"}:
+            raise ValueError(f"only target and past covariate lags are supported, got {sorted(lags)}")
+        if trained_model.output_chunk_length != 1:
+            raise ValueError("only models with an output_chunk_length of 1 are supported")
+        if trained_model.likelihood is not None:
+            raise ValueError("probabilistic models are not supported")
+        if trained_model.uses_static_covariates and timeseries_data.static_covariates is not None:
+            raise ValueError("models using static covariates are not supported")
+
+        target_window = -min(lags["target"])
+        covariate_window = -min(lags["past"])
+        if timeseries_data.end_time() != covariates.dates[-1]:
+            raise ValueError("the training series and the past covariates must end on the same date")
+        if timeseries_data.n_timesteps < target_window or len(covariates.dates) < covariate_window:
+            raise ValueError("the training series are shorter than the lags of the model")
+
+        series_keys = [str(component) for component in timeseries_data.components]
+        target_history = np.array(timeseries_data.values(copy = False)[-target_window:].T, dtype = np.float64)
+
+        # per-series and shared features laid out in the component order the model was trained on
+        positions = [covariates.keys_index[key] for key in series_keys]
+        covariate_history = np.empty((len(series_keys), covariate_window, len(covariates.components)), dtype = np.float64)
+        for column, component in enumerate(covariates.components):
+            if component in covariates.global_features:
+                covariate_history[:, :, column] = covariates.global_values[-covariate_window:, covariates.global_features.index(component)]
+            else:
+                covariate_history[:, :, column] = covariates.series_values[positions, -covariate_window:, covariates.series_features.index(component)]
+
+        forecaster = cls(
+            booster = trained_model.model.booster_,
+            target_lags = lags["target"],
+            past_lags = lags["past"],
+            components = covariates.components,
+            series_keys = series_keys,
+            target_history = target_history,
+            covariate_history = covariate_history,
+            last_date = timeseries_data.end_time()
+        )
+        logging.info(f"fast forecaster ready for {len(series_keys)} series with {forecaster.n_features} features")
+        return forecaster
+
+    def __contains__(self, key) -> bool:
+        return key in self.keys_index
+
+    def predict_arrays(self, target_history:np.ndarray, covariate_window:np.ndarray, n:int) -> np.ndarray:
+
+        """
+        This function is responsible for the recursive forecast of n steps for a batch of series. target_history
+        holds the last target values of shape (series, target window) and covariate_window the past covariates of
+        shape (series, covariate window + n - 1, components) ending one step before the last forecasted step.
+        """
+
+        batch = target_history.shape[0]
+        n_target_lags = len(self.target_lags)
+
+        # the target buffer grows by one predicted column per step, the feature matrix is refilled in place
+        targets = np.empty((batch, self.target_window + n), dtype = np.float64)
+        targets[:, :self.target_window] = target_history
+        features = np.empty((batch, self.n_features), dtype = np.float64)
+        target_positions = self.target_window + self.target_lags
+        covariate_positions = self.covariate_window + self.past_lags
+
+        for step in range(n):
+            features[:, :n_target_lags] = targets[:, target_positions + step]
+            features[:, n_target_lags:] = covariate_window[:, covariate_positions + step].reshape(batch, -1)
+            targets[:, self.target_window + step] = self.booster.predict(features)
+
+        return targets[:, self.target_window:]
+
+    def predict(self, series_keys:List[str], new_covariates:np.ndarray) -> np.ndarray:
+
+        """
+        This function is responsible for forecasting the given series for as many steps as new_covariates has rows.
+        new_covariates holds the covariates following the last training date, shaped (series, steps, components)
+        in the order of self.components.
+        """
+
+        n = new_covariates.shape[1]
+        positions = [self.keys_index[key] for key in series_keys]
+        covariate_window = np.concatenate([self.covariate_history[positions], new_covariates[:, :n - 1]], axis = 1)
+
+        return self.predict_arrays(self.target_history[positions], covariate_window, n)
+
+    def covariate_rows(self, columns:Dict[str, Sequence[float]], n:int) -> np.ndarray:
+
+        """
+        This function is responsible for arranging the first n values of each covariate in the component order of the model
+        """
+
+        return np.column_stack([np.asarray(columns[component][:n], dtype = np.float64) for component in self.components])
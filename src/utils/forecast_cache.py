@@ -0,0 +1,115 @@
+from src.utils.logger import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, Optional
+import threading
+import time
+
+
+@dataclass
+class ForecastCacheConfig:
+    max_entries:int = 4096
+    ttl_seconds:float = 300.0
+
+MISS = object()
+
+
+class ForecastCache:
+    """
+    Bounded LRU cache of forecast responses with a time-to-live per entry. Entries belong to the version of the
+    artifacts that produced them, and the whole cache is dropped as soon as a different version is served.
+    """
+
+    def __init__(self, config:Optional[ForecastCacheConfig] = None):
+        self.forecastcacheconfig = config if config is not None else ForecastCacheConfig()
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(store_nbr:int, family:str, horizon:int, onpromotion:List[int], is_holiday:List[int]) -> tuple:
+
+        """
+        This function is responsible for normalising a forecast request into a cache key. Only the first horizon
+        values of the covariates are used for forecasting, so longer lists with the same prefix share a key.
+        """
+
+        return (
+            int(store_nbr),
+            family,
+            int(horizon),
+            tuple(int(value) for value in onpromotion[:max(horizon, 0)]),
+            tuple(int(value) for value in is_holiday[:max(horizon, 0)])
+        )
+
+    def _switch_version(self, version:str):
+        if version != self._version:
+            if self._entries:
+                logging.info(f"artifacts version changed to {version}, dropping {len(self._entries)} cached forecasts")
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            self._version = version
+
+    def get(self, key:tuple, version:str) -> Any:
+
+        """
+        This function is responsible for returning a cached forecast, or MISS when there is no live entry for the key
+        """
+
+        with self._lock:
+            self._switch_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key:tuple, version:str, value:Any):
+
+        """
+        This function is responsible for caching a forecast, evicting the least recently used entries beyond capacity
+        """
+
+        with self._lock:
+            self._switch_version(version)
+            self._entries[key] = (time.monotonic() + self.forecastcacheconfig.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.forecastcacheconfig.max_entries:
+                self._entries.popitem(last = False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self._version,
+                "entries": len(self._entries),
+                "max_entries": self.forecastcacheconfig.max_entries,
+                "ttl_seconds": self.forecastcacheconfig.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
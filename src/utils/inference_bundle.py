@@ -0,0 +1,316 @@
+"""
+Slim serving artifacts for the fast inference engine. The booster of the sales model is saved as a LightGBM text
+model next to the last target values and past covariates of every series and the cached oil forecasts, so a
+server can forecast with numpy and LightGBM alone, without unpickling the Darts models and series.
+
+    python -m src.utils.inference_bundle
+"""
+from src.utils.exception import CustomException
+from src.utils.logger import logging
+from src.utils.fast_inference import FastForecaster
+from dataclasses import dataclass
+from typing import Any, FrozenSet, Optional
+import hashlib
+import json
+import shutil
+import threading
+import time
+import uuid
+import numpy as np
+import os
+
+
+@dataclass
+class InferenceBundleConfig:
+    bundle_dir:str = os.path.join("artifacts", "inference_bundle")
+    oil_model:str = os.path.join("artifacts", "oil_model.joblib")
+    trained_model:str = os.path.join("artifacts", "trained_model.joblib")
+    oil_forecasts:str = os.path.join("artifacts", "oil_forecasts.joblib")
+    timeseries_data:str = os.path.join("artifacts", "timeseries_data.joblib")
+    covariates:str = os.path.join("artifacts", "covariates")
+    reload_check_interval:float = 5.0
+    # exports kept next to the current one, for servers still reading the previous export
+    keep_exports:int = 2
+
+booster_file = "booster.txt"
+history_file = "history.npz"
+manifest_file = "bundle.json"
+# names the export directory being served, replaced in one step when a new export is complete
+pointer_file = "current.json"
+
+
+@dataclass(frozen = True)
+class BundleArtifacts:
+    version:str
+    loaded_at:float
+    fast_forecaster:FastForecaster
+    oil_forecasts:tuple
+    trained_last_date:Any
+    # keys of the served series, their covariates live in the fast forecaster
+    covariates:FrozenSet[str]
+    directory:str
+    sources:Any
+
+
+def source_files(config:InferenceBundleConfig) -> dict:
+
+    """
+    This function is responsible for the modification time and size of every artifact a bundle is exported from
+    """
+
+    files = {}
+    for path in (config.oil_model, config.trained_model, config.oil_forecasts, config.timeseries_data, config.covariates):
+        # a covariate store is complete once its index is written, until then the legacy covariates.joblib is read
+        stat = os.stat(
+            (os.path.join(path, "index.json") if os.path.isdir(path) else os.path.normpath(path) + ".joblib")
+            if path == config.covariates else path
+        )
+        files[path] = [stat.st_mtime_ns, stat.st_size]
+    return files
+
+
+def bundle_path(config:InferenceBundleConfig) -> Optional[str]:
+
+    """
+    This function is responsible for the directory of the bundle being served, the export named by the pointer file,
+    or None when nothing was exported yet
+    """
+
+    try:
+        with open(os.path.join(config.bundle_dir, pointer_file)) as file:
+            return os.path.join(config.bundle_dir, json.load(file)["directory"])
+    except FileNotFoundError:
+        return None
+
+
+def export_bundle(forecaster:FastForecaster, oil_forecasts, trained_last_date, config:Optional[InferenceBundleConfig] = None):
+
+    """
+    This function is responsible for writing a bundle from a fast forecaster built on the current artifacts. Every
+    export is written to its own directory and served once the pointer file is replaced to name it, so readers see
+    either the previous export or the new one, never a missing or partial bundle. Exports past keep_exports are removed.
+    """
+
+    config = config if config is not None else InferenceBundleConfig()
+    sources = source_files(config)
+    version = hashlib.md5(json.dumps(sources, sort_keys = True).encode()).hexdigest()[:12]
+    directory = f"{version}-{uuid.uuid4().hex[:8]}"
+    export_dir = os.path.join(config.bundle_dir, directory)
+    os.makedirs(export_dir)
+
+    forecaster.booster.save_model(os.path.join(export_dir, booster_file))
+    np.savez(
+        os.path.join(export_dir, history_file),
+        target_history = forecaster.target_history,
+        covariate_history = forecaster.covariate_history
+    )
+
+    manifest = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sources": sources,
+        "target_lags": forecaster.target_lags.tolist(),
+        "past_lags": forecaster.past_lags.tolist(),
+        "components": forecaster.components,
+        "series_keys": list(forecaster.keys_index),
+        "last_date": str(forecaster.last_date),
+        "oil_forecasts": [float(value) for value in oil_forecasts],
+        "trained_last_date": str(trained_last_date)
+    }
+    with open(os.path.join(export_dir, manifest_file), "w") as file:
+        json.dump(manifest, file)
+
+    partial_pointer = os.path.join(config.bundle_dir, f"{pointer_file}.{uuid.uuid4().hex}.tmp")
+    with open(partial_pointer, "w") as file:
+        json.dump({"directory": directory, "version": version}, file)
+    os.replace(partial_pointer, os.path.join(config.bundle_dir, pointer_file))
+
+    exports = sorted(
+        (entry for entry in os.scandir(config.bundle_dir) if entry.is_dir() and entry.name != directory),
+        key = lambda entry: entry.stat().st_mtime_ns,
+        reverse = True
+    )
+    for entry in exports[max(0, config.keep_exports - 1):]:
+        shutil.rmtree(entry.path, ignore_errors = True)
+
+    logging.info(f"exported inference bundle {manifest['version']} of {len(manifest['series_keys'])} series to {config.bundle_dir}")
+    return manifest
+
+
+def build_bundle(config:Optional[InferenceBundleConfig] = None):
+
+    """
+    This function is responsible for exporting a bundle from the trained models and series saved in artifacts
+    """
+
+    from src.utils.covariate_store import CovariateStore
+    from src.utils.oil_forecast_cache import OilForecastCache, OilForecastCacheConfig
+    import joblib
+
+    config = config if config is not None else InferenceBundleConfig()
+    oil_forecast_cache = OilForecastCache(OilForecastCacheConfig(
+        oil_model = config.oil_model,
+        oil_forecasts = config.oil_forecasts
+    )).load()
+    forecaster = FastForecaster.from_artifacts(
+        trained_model = joblib.load(config.trained_model),
+        timeseries_data = joblib.load(config.timeseries_data),
+        covariates = CovariateStore.load(config.covariates)
+    )
+    return export_bundle(forecaster, oil_forecast_cache["forecasts"], oil_forecast_cache["trained_last_date"], config)
+
+
+def load_bundle(config:Optional[InferenceBundleConfig] = None) -> Optional[BundleArtifacts]:
+
+    """
+    This function is responsible for loading a bundle, or None when there is none or the artifacts it was exported
+    from have changed since
+    """
+
+    config = config if config is not None else InferenceBundleConfig()
+    directory = bundle_path(config)
+    if directory is None:
+        logging.info(f"no inference bundle in {config.bundle_dir}")
+        return None
+
+    with open(os.path.join(directory, manifest_file)) as file:
+        manifest = json.load(file)
+    try:
+        if source_files(config) != manifest["sources"]:
+            logging.info(f"inference bundle {manifest['version']} is older than the artifacts it was exported from")
+            return None
+    except FileNotFoundError:
+        # the bundle can be shipped without the artifacts it was exported from
+        pass
+
+    import lightgbm
+    import pandas as pd
+
+    history = np.load(os.path.join(directory, history_file))
+    forecaster = FastForecaster(
+        booster = lightgbm.Booster(model_file = os.path.join(directory, booster_file)),
+        target_lags = manifest["target_lags"],
+        past_lags = manifest["past_lags"],
+        components = manifest["components"],
+        series_keys = manifest["series_keys"],
+        target_history = history["target_history"],
+        covariate_history = history["covariate_history"],
+        last_date = pd.Timestamp(manifest["last_date"])
+    )
+    return BundleArtifacts(
+        version = manifest["version"],
+        loaded_at = time.time(),
+        fast_forecaster = forecaster,
+        oil_forecasts = tuple(manifest["oil_forecasts"]),
+        trained_last_date = pd.Timestamp(manifest["trained_last_date"]),
+        covariates = frozenset(manifest["series_keys"]),
+        directory = directory,
+        sources = manifest["sources"]
+    )
+
+
+class BundleRegistry:
+    """
+    Serves the inference bundle in place of the ModelRegistry, with the same get and report methods. When there is
+    no up-to-date bundle, the full ModelRegistry is imported on first use and serves the Darts artifacts instead,
+    until a new bundle is exported. The served bundle is replaced when a new one is exported and dropped for the
+    full artifacts when the artifacts it was exported from change without a new export.
+    """
+
+    def __init__(self, config:Optional[InferenceBundleConfig] = None):
+        self.inferencebundleconfig = config if config is not None else InferenceBundleConfig()
+        self._artifacts = None
+        self._fallback = None
+        self._directory = None
+        self._last_check = 0.0
+        self._load_seconds = None
+        self._lock = threading.Lock()
+
+    def _stale(self) -> bool:
+        if bundle_path(self.inferencebundleconfig) != self._directory:
+            return True
+        if self._fallback is not None:
+            return False
+        try:
+            return source_files(self.inferencebundleconfig) != self._artifacts.sources
+        except FileNotFoundError:
+            return False
+
+    def load(self):
+
+        """
+        This function is responsible for loading the bundle, or the full artifacts when the bundle cannot be served
+        """
+
+        with self._lock:
+            start = time.perf_counter()
+            directory = bundle_path(self.inferencebundleconfig)
+            artifacts = None
+            try:
+                artifacts = load_bundle(self.inferencebundleconfig)
+            except Exception as e:
+                logging.info(CustomException(e))
+
+            if artifacts is None:
+                from src.utils.model_registry import model_registry
+
+                logging.info("serving the full model artifacts in place of the inference bundle")
+                self._fallback = model_registry
+                artifacts = model_registry.load()
+            else:
+                self._fallback = None
+                directory = artifacts.directory
+                logging.info(f"serving inference bundle {artifacts.version}")
+
+            self._artifacts = artifacts
+            self._directory = directory
+            self._last_check = time.monotonic()
+            self._load_seconds = round(time.perf_counter() - start, 4)
+        return artifacts
+
+    def get(self):
+
+        """
+        This function is responsible for handing out the served artifacts, reloading them once a new bundle is exported
+        or the served bundle is older than the artifacts. Reloads run on the calling thread, the event loop only reads
+        the served artifacts through current().
+        """
+
+        if self._artifacts is None:
+            return self.load()
+
+        interval = self.inferencebundleconfig.reload_check_interval
+        if interval >= 0 and time.monotonic() - self._last_check >= interval and not self._lock.locked():
+            self._last_check = time.monotonic()
+            if self._stale():
+                self.load()
+        return self._fallback.get() if self._fallback is not None else self._artifacts
+
+    def current(self):
+
+        """
+        This function is responsible for the artifacts being served, or None before the first load, without checking
+        for a new bundle
+        """
+
+        if self._fallback is not None:
+            return self._fallback.current()
+        return self._artifacts
+
+    def report(self) -> dict:
+        if self._artifacts is None:
+            return {"source": None, "version": None}
+        if self._fallback is not None:
+            return {"source": "full", "load_seconds": self._load_seconds, **self._fallback.report()}
+        return {
+            "source": "bundle",
+            "version": self._artifacts.version,
+            "loaded_at": self._artifacts.loaded_at,
+            "load_seconds": self._load_seconds,
+            "series": len(self._artifacts.covariates)
+        }
+
+
+if __name__ == "__main__":
+    manifest = build_bundle()
+    print(f"exported inference bundle {manifest['version']} of {len(manifest['series_keys'])} series")
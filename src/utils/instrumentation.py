@@ -0,0 +1,264 @@
+from src.utils.logger import LazyFileHandler, log_dir
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import cProfile
+import functools
+import json
+import logging
+import resource
+import threading
+import time
+import tracemalloc
+import os
+
+
+@dataclass
+class InstrumentationConfig:
+    json_log:str = os.path.join(log_dir, "instrumentation.jsonl")
+    profile_dir:str = os.path.join(log_dir, "profiles")
+    # "cprofile", "tracemalloc" or both separated by a comma, profiles every memory-sampled span when set
+    profile:str = os.getenv("PIPELINE_PROFILE", "")
+    memory_sample_interval:float = 0.05
+    latency_buckets:tuple = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+instrumentationconfig = InstrumentationConfig()
+
+
+def _json_logger():
+    logger = logging.getLogger("instrumentation")
+    if not logger.handlers:
+        handler = LazyFileHandler(instrumentationconfig.json_log)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+json_logger = _json_logger()
+
+
+def log_record(event:str, **fields):
+
+    """
+    This function is responsible for writing one structured record as a JSON line to the instrumentation log
+    """
+
+    json_logger.info(json.dumps({"ts": round(time.time(), 6), "event": event, **fields}, default = str))
+
+
+def current_rss() -> int:
+
+    """
+    This function is responsible for the resident memory of the process in bytes, falling back to its peak where /proc is missing
+    """
+
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Histogram:
+    """
+    Cumulative histogram of observations per label set, rendered in the Prometheus text format
+    """
+
+    def __init__(self, name:str, documentation:str, buckets:Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value:float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf' if bound == float('inf') else repr(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(key)} {cumulative}")
+        return lines
+
+
+def format_labels(labels:Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """
+    Holds the histograms of the process together with collectors that report current values, such as cache counters,
+    when the metrics are scraped
+    """
+
+    def __init__(self):
+        self.histograms:Dict[str, Histogram] = {}
+        self.collectors:List[Callable[[], List[Tuple[str, str, str, Dict, float]]]] = []
+
+    def histogram(self, name:str, documentation:str, buckets:Optional[Sequence[float]] = None) -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, documentation, buckets or instrumentationconfig.latency_buckets)
+        return self.histograms[name]
+
+    def register_collector(self, collector:Callable[[], List[Tuple[str, str, str, Dict, float]]]):
+
+        """
+        This function is responsible for adding a callable returning (name, type, documentation, labels, value) samples at scrape time
+        """
+
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+
+        """
+        This function is responsible for rendering every metric in the Prometheus text exposition format
+        """
+
+        lines = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.render())
+
+        described = set()
+        for collector in self.collectors:
+            for name, metric_type, documentation, labels, value in collector():
+                if name not in described:
+                    lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"])
+                    described.add(name)
+                lines.append(f"{name}{format_labels(tuple(sorted(labels.items())))} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+metrics_registry = MetricsRegistry()
+span_seconds = metrics_registry.histogram("span_duration_seconds", "Wall time of instrumented pipeline and serving spans")
+_profiled_span = None
+
+
+class MemorySampler(threading.Thread):
+    """
+    Samples the resident memory of the process in the background to find the peak reached during a span
+    """
+
+    def __init__(self, interval:float):
+        super().__init__(daemon = True)
+        self.interval = interval
+        self.peak = current_rss()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self) -> int:
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak
+
+
+@contextmanager
+def span(name:str, sample_memory:bool = True, profile:Optional[str] = None, **attributes):
+
+    """
+    This function is responsible for timing a block of work, recording its resident memory and, when profiling is
+    enabled, dumping a cProfile and/or tracemalloc report of it. Every span ends with one JSON record and one
+    observation in the span_duration_seconds histogram.
+    """
+
+    global _profiled_span
+
+    profile = instrumentationconfig.profile if profile is None else profile
+    profilers = {mode.strip() for mode in profile.split(",") if mode.strip()} if sample_memory else set()
+    # profilers do not nest, so only the outermost profiled span of the process dumps a profile
+    if _profiled_span is not None:
+        profilers = set()
+    elif profilers:
+        _profiled_span = name
+
+    sampler = MemorySampler(instrumentationconfig.memory_sample_interval) if sample_memory else None
+    if sampler is not None:
+        sampler.start()
+    profiler = cProfile.Profile() if "cprofile" in profilers else None
+    tracing = "tracemalloc" in profilers and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+
+    rss_start = current_rss()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attributes
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        record = {
+            "name": name,
+            "status": status,
+            "seconds": round(seconds, 6),
+            "cpu_seconds": round(cpu_seconds, 6),
+            "rss_start": rss_start,
+            "rss_end": current_rss()
+        }
+
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            record["rss_peak"] = max(sampler.stop(), record["rss_end"])
+        if profilers:
+            os.makedirs(instrumentationconfig.profile_dir, exist_ok = True)
+            prefix = os.path.join(instrumentationconfig.profile_dir, f"{name}-{time.strftime('%Y%m%dT%H%M%S')}")
+            if profiler is not None:
+                profiler.dump_stats(prefix + ".prof")
+                record["cprofile"] = prefix + ".prof"
+            if tracing:
+                snapshot = tracemalloc.take_snapshot()
+                record["traced_peak"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                with open(prefix + ".tracemalloc.txt", "w") as file:
+                    file.write("\n".join(str(stat) for stat in snapshot.statistics("lineno")[:50]))
+                record["tracemalloc"] = prefix + ".tracemalloc.txt"
+            _profiled_span = None
+
+        span_seconds.observe(seconds, span = name)
+        log_record("span", **record, **attributes)
+
+
+def instrument(name:Optional[str] = None, sample_memory:bool = True):
+
+    """
+    This function is responsible for decorating a component method so that every call runs inside a span named after it
+    """
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name, sample_memory = sample_memory):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -2,12 +2,26 @@ import logging
 import os
 
 log_dir = os.path.join(os.getcwd(), "logs")
-os.makedirs(log_dir, exist_ok = True)
 
 LOG_FILE = os.path.join(log_dir, "running_logs.log")
 
+
+class LazyFileHandler(logging.FileHandler):
+    """
+    File handler creating its directory and opening its file on the first record, so importing the logger
+    leaves the filesystem untouched
+    """
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, delay = True, **kwargs)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok = True)
+        return super()._open()
+
+
 logging.basicConfig(
-    filename = LOG_FILE,
+    handlers = [LazyFileHandler(LOG_FILE)],
     level = logging.INFO,
     format = "[%(asctime)s: %(levelname)s: %(module)s: %(message)s]"
-)
\ No newline at end of file
+)
@@ -0,0 +1,111 @@
+from typing import Dict, Optional, Sequence, Tuple
+import ast
+import numpy as np
+import pandas as pd
+
+METRICS = ("mse", "mae", "rmsle", "wape", "bias")
+
+
+def error_sums(actual:np.ndarray, predicted:np.ndarray, scale:Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+
+    """
+    This function is responsible for reducing (time, series) arrays of actuals and predictions to per-series sums of
+    errors in one vectorised pass. Every metric is a ratio of these sums, so they can be added up over any grouping of
+    the series before the metrics are taken. Missing actuals are left out, and errors divided by scale are summed too
+    when a per-series scale is given.
+    """
+
+    actual = np.asarray(actual, dtype = np.float64)
+    predicted = np.asarray(predicted, dtype = np.float64)
+    errors = predicted - actual
+    valid = ~np.isnan(errors)
+    errors = np.where(valid, errors, 0.0)
+    log_errors = np.where(valid, np.log1p(np.clip(predicted, 0, None)) - np.log1p(np.clip(actual, 0, None)), 0.0)
+
+    sums = {
+        "count": valid.sum(axis = 0).astype(np.float64),
+        "error": errors.sum(axis = 0),
+        "absolute_error": np.abs(errors).sum(axis = 0),
+        "squared_error": np.square(errors).sum(axis = 0),
+        "squared_log_error": np.square(log_errors).sum(axis = 0),
+        "absolute_actual": np.abs(np.where(valid, actual, 0.0)).sum(axis = 0)
+    }
+    if scale is not None:
+        scaled_errors = errors / np.where(scale == 0, 1.0, scale)
+        sums["absolute_scaled_error"] = np.abs(scaled_errors).sum(axis = 0)
+        sums["squared_scaled_error"] = np.square(scaled_errors).sum(axis = 0)
+    return sums
+
+
+def metrics_from_sums(sums:Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+
+    """
+    This function is responsible for turning summed errors into MSE, MAE, RMSLE, WAPE and bias, plus the normalised
+    MSE and MAE when scaled errors were summed
+    """
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        count = sums["count"]
+        metrics = {
+            "mse": sums["squared_error"] / count,
+            "mae": sums["absolute_error"] / count,
+            "rmsle": np.sqrt(sums["squared_log_error"] / count),
+            # undefined for series without any sales
+            "wape": np.where(sums["absolute_actual"] > 0, sums["absolute_error"] / sums["absolute_actual"], np.nan),
+            "bias": sums["error"] / count
+        }
+        if "squared_scaled_error" in sums:
+            metrics["mse_normalised"] = sums["squared_scaled_error"] / count
+            metrics["mae_normalised"] = sums["absolute_scaled_error"] / count
+    return metrics
+
+
+def group_sums(sums:Dict[str, np.ndarray], labels:Sequence) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+
+    """
+    This function is responsible for adding up per-series sums within each group label
+    """
+
+    groups, codes = np.unique(np.asarray(labels), return_inverse = True)
+    return groups, {name: np.bincount(codes, weights = values, minlength = len(groups)) for name, values in sums.items()}
+
+
+def series_groups(series_keys:Sequence[str]) -> Dict[str, list]:
+
+    """
+    This function is responsible for reading the store number and family out of series keys like "(1, 'AUTOMOTIVE')"
+    """
+
+    parsed = [ast.literal_eval(key) for key in series_keys]
+    return {
+        "store": [str(store_nbr) for store_nbr, _ in parsed],
+        "family": [family for _, family in parsed]
+    }
+
+
+def metrics_table(
+    actual:np.ndarray,
+    predicted:np.ndarray,
+    series_keys:Sequence[str],
+    scale:Optional[np.ndarray] = None
+) -> pd.DataFrame:
+
+    """
+    This function is responsible for evaluating (time, series) arrays per series, per store, per family and globally.
+    Group metrics pool the errors of all the series in the group rather than averaging their metrics.
+    """
+
+    sums = error_sums(actual, predicted, scale = scale)
+    levels = [("series", np.asarray(series_keys), sums)]
+    for level, labels in series_groups(series_keys).items():
+        levels.append((level, *group_sums(sums, labels)))
+    levels.append(("global", np.array(["all"]), {name: values.sum(keepdims = True) for name, values in sums.items()}))
+
+    tables = []
+    for level, keys, level_sums in levels:
+        table = pd.DataFrame({"level": level, "key": keys, "observations": level_sums["count"].astype(np.int64)})
+        for name, values in metrics_from_sums(level_sums).items():
+            table[name] = values
+        tables.append(table)
+
+    return pd.concat(tables, ignore_index = True)
@@ -0,0 +1,238 @@
+from src.utils.exception import CustomException
+from src.utils.logger import logging
+from src.utils.covariate_store import CovariateStore
+from src.utils.fast_inference import FastForecaster
+from src.utils.oil_forecast_cache import OilForecastCache, OilForecastCacheConfig
+from src.utils.shared_series import shared_series
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+import hashlib
+import threading
+import time
+import tracemalloc
+import joblib
+import os
+
+
+@dataclass
+class ModelRegistryConfig:
+    oil_model_path:str = os.path.join("artifacts", "oil_model.joblib")
+    trained_model_path:str = os.path.join("artifacts", "trained_model.joblib")
+    covariates_path:str = os.path.join("artifacts", "covariates")
+    timeseries_data_path:str = os.path.join("artifacts", "timeseries_data.joblib")
+    oil_forecasts_path:str = os.path.join("artifacts", "oil_forecasts.joblib")
+    oil_forecast_horizon:int = 30
+    reload_check_interval:float = 5.0
+    track_memory:bool = True
+    inference_engine:str = os.getenv("FORECAST_ENGINE", "fast")
+    # serves the training series from memory-mapped files shared by every worker through the page cache
+    memory_map:bool = os.getenv("SERVING_MEMORY_MAP", "0") == "1"
+    serving_dir:str = os.path.join("artifacts", "serving")
+
+@dataclass(frozen = True)
+class ArtifactStats:
+    name:str
+    path:str
+    file_bytes:int
+    memory_bytes:Optional[int]
+    load_seconds:float
+
+@dataclass(frozen = True)
+class ModelArtifacts:
+    version:str
+    loaded_at:float
+    oil_model:Any
+    trained_model:Any
+    covariates:Mapping
+    timeseries_data:Any
+    oil_forecasts:tuple
+    trained_last_date:Any
+    stats:Mapping
+    fast_forecaster:Optional[FastForecaster] = None
+
+
+class ModelRegistry:
+    """
+    Process-wide holder of the serving artifacts. A loaded set of artifacts is published as one
+    immutable ModelArtifacts snapshot, and a new snapshot replaces it in a single reference swap
+    once all the artifacts have been read back from disk.
+    """
+
+    def __init__(self, config:Optional[ModelRegistryConfig] = None):
+        self.modelregistryconfig = config if config is not None else ModelRegistryConfig()
+        self._artifacts = None
+        self._signature = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def _artifact_paths(self):
+        return {
+            "oil_model": self.modelregistryconfig.oil_model_path,
+            "trained_model": self.modelregistryconfig.trained_model_path,
+            "covariates": self.modelregistryconfig.covariates_path,
+            "timeseries_data": self.modelregistryconfig.timeseries_data_path
+        }
+
+    def _artifact_loaders(self):
+        return {
+            "oil_model": joblib.load,
+            "trained_model": joblib.load,
+            "covariates": CovariateStore.load,
+            "timeseries_data": (
+                (lambda path: shared_series(path, self.modelregistryconfig.serving_dir))
+                if self.modelregistryconfig.memory_map else joblib.load
+            )
+        }
+
+    def _disk_signature(self):
+        signature = []
+        for name, path in self._artifact_paths().items():
+            # a covariate store is rewritten array by array and is complete once its index is written
+            stat = os.stat(CovariateStore.index_path(path) if name == "covariates" else path)
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _load_artifact(self, name, path):
+        tracing = self.modelregistryconfig.track_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            artifact = self._artifact_loaders()[name](path)
+            load_seconds = time.perf_counter() - start
+            memory_bytes = tracemalloc.get_traced_memory()[0] if tracing else None
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+        stats = ArtifactStats(
+            name = name,
+            path = path,
+            file_bytes = CovariateStore.size_on_disk(path) if name == "covariates" else os.path.getsize(path),
+            memory_bytes = memory_bytes,
+            load_seconds = round(load_seconds, 4)
+        )
+        logging.info(f"loaded {name} from {path} in {stats.load_seconds}s using {memory_bytes} bytes")
+        return artifact, stats
+
+    def load(self) -> ModelArtifacts:
+
+        """
+        This function is responsible for loading all the serving artifacts and publishing them as the current snapshot
+        """
+
+        with self._reload_lock:
+            signature = self._disk_signature()
+            artifacts = {}
+            stats = {}
+            for name, path in self._artifact_paths().items():
+                artifacts[name], stats[name] = self._load_artifact(name, path)
+
+            oil_forecast_cache = OilForecastCache(OilForecastCacheConfig(
+                oil_model = self.modelregistryconfig.oil_model_path,
+                oil_forecasts = self.modelregistryconfig.oil_forecasts_path,
+                horizon = self.modelregistryconfig.oil_forecast_horizon
+            )).load(oil_model = artifacts["oil_model"])
+
+            fast_forecaster = None
+            if self.modelregistryconfig.inference_engine == "fast":
+                try:
+                    fast_forecaster = FastForecaster.from_artifacts(
+                        trained_model = artifacts["trained_model"],
+                        timeseries_data = artifacts["timeseries_data"],
+                        covariates = artifacts["covariates"]
+                    )
+                except Exception as e:
+                    # models the fast engine cannot reproduce are served through Darts
+                    logging.info(f"serving forecasts through Darts, fast forecaster unavailable: {e}")
+
+            snapshot = ModelArtifacts(
+                version = hashlib.md5(repr(signature).encode()).hexdigest()[:12],
+                loaded_at = time.time(),
+                oil_model = artifacts["oil_model"],
+                trained_model = artifacts["trained_model"],
+                covariates = MappingProxyType(artifacts["covariates"]) if isinstance(artifacts["covariates"], dict) else artifacts["covariates"],
+                timeseries_data = artifacts["timeseries_data"],
+                oil_forecasts = tuple(oil_forecast_cache["forecasts"]),
+                trained_last_date = oil_forecast_cache["trained_last_date"],
+                stats = MappingProxyType(stats),
+                fast_forecaster = fast_forecaster
+            )
+
+            self._artifacts = snapshot
+            self._signature = signature
+            self._last_check = time.monotonic()
+            logging.info(f"model registry serving artifacts version {snapshot.version}")
+
+        return snapshot
+
+    def reload_if_changed(self) -> bool:
+
+        """
+        This function is responsible for swapping in a fresh snapshot when the artifact files have changed on disk
+        """
+
+        self._last_check = time.monotonic()
+        try:
+            if self._disk_signature() == self._signature:
+                return False
+            self.load()
+            return True
+        except Exception as e:
+            # a partially written deployment keeps the previous snapshot in service
+            logging.info(CustomException(e))
+            return False
+
+    def get(self) -> ModelArtifacts:
+
+        """
+        This function is responsible for handing out the current snapshot of the serving artifacts
+        """
+
+        if self._artifacts is None:
+            return self.load()
+
+        interval = self.modelregistryconfig.reload_check_interval
+        if interval >= 0 and time.monotonic() - self._last_check >= interval and not self._reload_lock.locked():
+            self.reload_if_changed()
+
+        return self._artifacts
+
+    def current(self) -> Optional[ModelArtifacts]:
+
+        """
+        This function is responsible for the snapshot being served, or None before the first load, without checking
+        the disk for newer artifacts, so it is safe to call on the event loop
+        """
+
+        return self._artifacts
+
+    def report(self) -> dict:
+
+        """
+        This function is responsible for reporting the version, load time and memory footprint of the served artifacts
+        """
+
+        if self._artifacts is None:
+            return {"version": None, "artifacts": {}}
+
+        return {
+            "version": self._artifacts.version,
+            "loaded_at": self._artifacts.loaded_at,
+            "inference_engine": "fast" if self._artifacts.fast_forecaster is not None else "darts",
+            "memory_map": self.modelregistryconfig.memory_map,
+            "pid": os.getpid(),
+            "artifacts": {
+                name: {
+                    "path": stats.path,
+                    "file_bytes": stats.file_bytes,
+                    "memory_bytes": stats.memory_bytes,
+                    "load_seconds": stats.load_seconds
+                }
+                for name, stats in self._artifacts.stats.items()
+            }
+        }
+
+
+model_registry = ModelRegistry()
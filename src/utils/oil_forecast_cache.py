@@ -0,0 +1,113 @@
+from src.utils.logger import logging
+from dataclasses import dataclass
+from typing import Optional
+import hashlib
+import joblib
+import os
+
+
+@dataclass
+class OilForecastCacheConfig:
+    oil_model:str = os.path.join("artifacts", "oil_model.joblib")
+    oil_forecasts:str = os.path.join("artifacts", "oil_forecasts.joblib")
+    horizon:int = 30
+
+
+def file_hash(path:str, chunk_size:int = 1 << 20) -> str:
+
+    """
+    This function is responsible for computing the md5 digest of a file without reading it into memory at once
+    """
+
+    digest = hashlib.md5()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OilForecastCache:
+    """
+    Stores the oil price trajectory forecasted by the oil model, keyed by the md5 of the oil model artifact,
+    so that forecasting sales never has to run the oil model on the request path.
+    """
+
+    def __init__(self, config:Optional[OilForecastCacheConfig] = None):
+        self.oilforecastcacheconfig = config if config is not None else OilForecastCacheConfig()
+
+    def forecast(self, oil_model = None, horizon:Optional[int] = None) -> dict:
+
+        """
+        This function is responsible for forecasting oil prices with the trained oil model, without saving them
+        """
+
+        horizon = horizon if horizon is not None else self.oilforecastcacheconfig.horizon
+        if oil_model is None:
+            oil_model = joblib.load(self.oilforecastcacheconfig.oil_model)
+
+        logging.info(f"forecasting oil prices for the next {horizon} days")
+
+        return {
+            "model_hash": file_hash(self.oilforecastcacheconfig.oil_model),
+            "horizon": horizon,
+            "trained_last_date": oil_model.training_series.end_time(),
+            "forecasts": oil_model.predict(n = horizon).pd_series().to_list()
+        }
+
+    def build(self, oil_model = None, horizon:Optional[int] = None) -> dict:
+
+        """
+        This function is responsible for forecasting oil prices with the trained oil model and saving them to artifacts
+        """
+
+        cache = self.forecast(oil_model = oil_model, horizon = horizon)
+        joblib.dump(cache, self.oilforecastcacheconfig.oil_forecasts)
+
+        logging.info("oil forecasts saved to artifacts")
+        return cache
+
+    def cached(self, horizon:Optional[int] = None) -> Optional[dict]:
+
+        """
+        This function is responsible for returning the saved oil forecasts, or None when they are missing, were
+        forecasted by another oil model or are shorter than the horizon
+        """
+
+        horizon = horizon if horizon is not None else self.oilforecastcacheconfig.horizon
+        if not os.path.exists(self.oilforecastcacheconfig.oil_forecasts):
+            return None
+
+        cache = joblib.load(self.oilforecastcacheconfig.oil_forecasts)
+        if cache["model_hash"] != file_hash(self.oilforecastcacheconfig.oil_model) or cache["horizon"] < horizon:
+            logging.info("cached oil forecasts are stale")
+            return None
+        return cache
+
+    def load(self, oil_model = None, horizon:Optional[int] = None) -> dict:
+
+        """
+        This function is responsible for returning the cached oil forecasts without writing to artifacts, so serving
+        only reads them. Missing or stale forecasts are forecasted in memory until the trainer stage saves them.
+        """
+
+        horizon = horizon if horizon is not None else self.oilforecastcacheconfig.horizon
+        cache = self.cached(horizon = horizon)
+        if cache is not None:
+            return cache
+
+        logging.info("forecasting oil prices in memory, the trainer stage saves them to artifacts")
+        return self.forecast(oil_model = oil_model, horizon = max(horizon, self.oilforecastcacheconfig.horizon))
+
+    def refresh(self, oil_model = None, horizon:Optional[int] = None) -> dict:
+
+        """
+        This function is responsible for returning the cached oil forecasts, rebuilding and saving them when they are
+        missing, the oil model has changed or a longer horizon is requested than the one cached
+        """
+
+        horizon = horizon if horizon is not None else self.oilforecastcacheconfig.horizon
+        cache = self.cached(horizon = horizon)
+        if cache is not None:
+            return cache
+
+        return self.build(oil_model = oil_model, horizon = max(horizon, self.oilforecastcacheconfig.horizon))
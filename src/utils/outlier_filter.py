@@ -0,0 +1,37 @@
+from numpy.lib.stride_tricks import sliding_window_view
+import numpy as np
+
+
+def hampel_filter(values, window_size:int = 7, n_sigma:float = 3.0, block_size:int = 256) -> np.ndarray:
+
+    """
+    This function is responsible for removing outliers from every column of a 2-D array of series at once.
+    It follows the semantics of the hampel package: a centred window of window_size // 2 records on each side,
+    a value is replaced by the window median when it is further from it than n_sigma * 1.4826 * MAD, records
+    too close to either end are left untouched, and the arithmetic is carried out in float32.
+    Columns are filtered in blocks of block_size to bound the memory taken by the strided windows.
+    """
+
+    values = np.asarray(values, dtype = np.float32)
+    if values.ndim == 1:
+        return hampel_filter(values[:, np.newaxis], window_size, n_sigma, block_size)[:, 0]
+
+    filtered = values.copy()
+    half_window = window_size // 2
+    n_records = values.shape[0]
+    if n_records <= 2 * half_window:
+        return filtered
+
+    threshold_scale = np.float64(np.float32(n_sigma)) * 1.4826
+    for start in range(0, values.shape[1], block_size):
+        block = values[:, start:start + block_size]
+        windows = sliding_window_view(block, 2 * half_window + 1, axis = 0)
+        medians = np.median(windows, axis = -1)
+        deviations = np.median(np.abs(windows - medians[..., np.newaxis]), axis = -1)
+        thresholds = (threshold_scale * deviations.astype(np.float64)).astype(np.float32)
+
+        centre = block[half_window:n_records - half_window]
+        outliers = np.abs(centre - medians) > thresholds
+        filtered[half_window:n_records - half_window, start:start + block_size] = np.where(outliers, medians, centre)
+
+    return filtered
@@ -0,0 +1,90 @@
+from src.utils.logger import logging
+from typing import Optional
+import hashlib
+import json
+import shutil
+import uuid
+import joblib
+import numpy as np
+import pandas as pd
+import os
+
+values_file = "values.npy"
+index_file = "index.json"
+
+
+def source_signature(path:str) -> str:
+    stat = os.stat(path)
+    return hashlib.md5(f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:12]
+
+
+def export_series(series, directory:str):
+
+    """
+    This function is responsible for writing the values of a TimeSeries to a .npy file with a JSON index of its
+    time axis and components. Files are written under temporary names and moved into place, the index last, so
+    processes exporting the same series at once never read a partial export.
+    """
+
+    if series.static_covariates is not None or series.hierarchy is not None:
+        raise ValueError("series with static covariates or a hierarchy cannot be memory-mapped")
+
+    os.makedirs(directory, exist_ok = True)
+    suffix = f".{uuid.uuid4().hex}.tmp"
+
+    with open(os.path.join(directory, values_file + suffix), "wb") as file:
+        np.save(file, series.all_values(copy = False))
+    os.replace(os.path.join(directory, values_file + suffix), os.path.join(directory, values_file))
+
+    index = {
+        "time_dim": series.time_dim,
+        "components": list(series.components),
+        "dates": [date.isoformat() for date in series.time_index]
+    }
+    with open(os.path.join(directory, index_file + suffix), "w") as file:
+        json.dump(index, file)
+    os.replace(os.path.join(directory, index_file + suffix), os.path.join(directory, index_file))
+
+
+def load_series(directory:str, mmap_mode:Optional[str] = "r"):
+
+    """
+    This function is responsible for rebuilding an exported TimeSeries on top of its memory-mapped values, so every
+    process mapping the file shares its pages through the page cache instead of holding a private copy
+    """
+
+    from darts import TimeSeries
+    import xarray as xr
+
+    with open(os.path.join(directory, index_file)) as file:
+        index = json.load(file)
+
+    values = np.load(os.path.join(directory, values_file), mmap_mode = mmap_mode)
+    return TimeSeries(xr.DataArray(
+        values,
+        dims = (index["time_dim"], "component", "sample"),
+        coords = {index["time_dim"]: pd.DatetimeIndex(index["dates"], freq = "infer"), "component": index["components"]}
+    ))
+
+
+def shared_series(path:str, serving_dir:str):
+
+    """
+    This function is responsible for serving a pickled TimeSeries from a memory-mapped export, exporting it first
+    when the pickle has no export yet. Exports are keyed by the path, size and modification time of the pickle,
+    and the exports of older pickles are removed.
+    """
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    directory = os.path.join(serving_dir, f"{name}-{source_signature(path)}")
+
+    if not os.path.exists(os.path.join(directory, index_file)):
+        logging.info(f"exporting {path} to memory-mappable arrays in {directory}")
+        export_series(joblib.load(path), directory)
+
+        # processes still mapping an old export keep its pages until they let go of them
+        for entry in os.scandir(serving_dir):
+            if entry.is_dir() and entry.name.startswith(f"{name}-") and entry.path != directory:
+                shutil.rmtree(entry.path, ignore_errors = True)
+
+    return load_series(directory)
@@ -0,0 +1,195 @@
+from src.utils.logger import logging
+from src.utils.instrumentation import span
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+import hashlib
+import inspect
+import json
+import time
+import os
+
+
+@dataclass
+class StageRunnerConfig:
+    state_file:str = os.path.join("artifacts", "pipeline_state.json")
+    chunk_size:int = 1 << 20
+
+@dataclass
+class Stage:
+    name:str
+    run:Callable[[], Any]
+    inputs:Sequence[str] = ()
+    outputs:Sequence[str] = ()
+    params:Dict[str, Any] = field(default_factory = dict)
+    code:Sequence[Any] = ()
+
+@dataclass
+class StageResult:
+    name:str
+    status:str
+    seconds:float
+    saved_seconds:float = 0.0
+    reason:str = ""
+
+
+class StageRunner:
+    """
+    Runs the stages of a pipeline in order and skips the ones whose outputs are already up to date. Every stage
+    is keyed by a content hash of its input artifacts, its parameters and the source of the modules it runs;
+    a stage reruns when the key differs from the one recorded on its last successful run, or when one of its
+    outputs is missing or was changed since. File hashes are cached against size and modification time, so an
+    unchanged artifact is only read once.
+    """
+
+    def __init__(self, stages:List[Stage], config:Optional[StageRunnerConfig] = None):
+        self.stages = stages
+        self.stagerunnerconfig = config if config is not None else StageRunnerConfig()
+        self.state = self._read_state()
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self.stagerunnerconfig.state_file) as file:
+                state = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        state.setdefault("files", {})
+        state.setdefault("stages", {})
+        return state
+
+    def _write_state(self):
+        os.makedirs(os.path.dirname(self.stagerunnerconfig.state_file) or ".", exist_ok = True)
+        partial_file = self.stagerunnerconfig.state_file + ".partial"
+        with open(partial_file, "w") as file:
+            json.dump(self.state, file, indent = 2)
+        os.replace(partial_file, self.stagerunnerconfig.state_file)
+
+    def file_hash(self, path:str) -> Optional[str]:
+
+        """
+        This function is responsible for the md5 of a file, or of every file of a directory, reusing the cached
+        hash while the size and modification time are unchanged. Missing paths hash to None.
+        """
+
+        if os.path.isdir(path):
+            digest = hashlib.md5()
+            for entry in sorted(os.scandir(path), key = lambda entry: entry.name):
+                if entry.is_file():
+                    digest.update(f"{entry.name}:{self.file_hash(entry.path)};".encode())
+            return digest.hexdigest()
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        cached = self.state["files"].get(path)
+        if cached is not None and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["md5"]
+
+        digest = hashlib.md5()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(self.stagerunnerconfig.chunk_size), b""):
+                digest.update(chunk)
+        self.state["files"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "md5": digest.hexdigest()}
+        return digest.hexdigest()
+
+    @staticmethod
+    def _modified_at(path:str) -> float:
+        if os.path.isdir(path):
+            return max((entry.stat().st_mtime for entry in os.scandir(path) if entry.is_file()), default = 0.0)
+        return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+    def stage_key(self, stage:Stage) -> str:
+
+        """
+        This function is responsible for hashing the inputs, parameters and code of a stage into its cache key
+        """
+
+        digest = hashlib.md5()
+        for path in stage.inputs:
+            digest.update(f"input {path}:{self.file_hash(path)};".encode())
+        digest.update(f"params {json.dumps(stage.params, sort_keys = True, default = str)};".encode())
+        for module in stage.code:
+            source_file = inspect.getsourcefile(module)
+            digest.update(f"code {module.__name__}:{self.file_hash(source_file)};".encode())
+        return digest.hexdigest()
+
+    def _stale_reason(self, stage:Stage, key:str) -> Optional[str]:
+        record = self.state["stages"].get(stage.name)
+        if record is None:
+            return "never run"
+        if record["key"] != key:
+            return "inputs, parameters or code changed"
+        for path in stage.outputs:
+            output_hash = self.file_hash(path)
+            if output_hash is None:
+                return f"{path} is missing"
+            if output_hash != record["outputs"].get(path):
+                return f"{path} changed since the last run"
+        return None
+
+    def run(self, force:Iterable[str] = ()) -> List[StageResult]:
+
+        """
+        This function is responsible for running every stage that is out of date, or forced by name ("all" forces
+        every stage), and stopping at the first stage that does not produce all of its outputs
+        """
+
+        force = set(force)
+        unknown = force - {stage.name for stage in self.stages} - {"all"}
+        if unknown:
+            raise ValueError(f"unknown stages {sorted(unknown)}, expected one of {[stage.name for stage in self.stages]}")
+
+        results = []
+        for stage in self.stages:
+            key = self.stage_key(stage)
+            forced = "all" in force or stage.name in force
+            reason = "forced" if forced else self._stale_reason(stage, key)
+
+            if reason is None:
+                saved_seconds = self.state["stages"][stage.name]["seconds"]
+                logging.info(f"skipping stage {stage.name}, outputs up to date")
+                results.append(StageResult(name = stage.name, status = "skipped", seconds = 0.0, saved_seconds = saved_seconds))
+                continue
+
+            logging.info(f"running stage {stage.name}: {reason}")
+            started_at = time.time()
+            start = time.perf_counter()
+            # a profile of the whole stage is dumped when PIPELINE_PROFILE is set
+            with span(f"stage.{stage.name}", reason = reason):
+                stage.run()
+            seconds = round(time.perf_counter() - start, 3)
+
+            # components log their failures instead of raising, so a stage only counts as done once it rewrote all its outputs
+            missing = [path for path in stage.outputs if self._modified_at(path) < started_at - 1]
+            if missing:
+                logging.info(f"stage {stage.name} failed to write {missing}, stopping the pipeline")
+                self.state["stages"].pop(stage.name, None)
+                self._write_state()
+                results.append(StageResult(name = stage.name, status = "failed", seconds = seconds, reason = f"did not write {missing}"))
+                break
+
+            self.state["stages"][stage.name] = {
+                "key": key,
+                "outputs": {path: self.file_hash(path) for path in stage.outputs},
+                "seconds": seconds,
+                "completed_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+            }
+            self._write_state()
+            results.append(StageResult(name = stage.name, status = "ran", seconds = seconds, reason = reason))
+
+        return results
+
+    @staticmethod
+    def summary(results:List[StageResult]) -> str:
+
+        """
+        This function is responsible for rendering the status and timing of every stage along with the time saved by skipping
+        """
+
+        lines = [f"{'stage':<20} {'status':<8} {'seconds':>9} {'saved':>9}  reason"]
+        for result in results:
+            lines.append(f"{result.name:<20} {result.status:<8} {result.seconds:>9.2f} {result.saved_seconds:>9.2f}  {result.reason}")
+        ran = sum(result.seconds for result in results)
+        saved = sum(result.saved_seconds for result in results)
+        lines.append(f"ran {sum(result.status == 'ran' for result in results)} stages in {ran:.2f}s, "
+                     f"skipped {sum(result.status == 'skipped' for result in results)} saving about {saved:.2f}s")
+        return "\n".join(lines)
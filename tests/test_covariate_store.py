@@ -0,0 +1,100 @@
+from src.utils.covariate_store import CovariateStore
+from darts import TimeSeries
+import joblib
+import numpy as np
+import pandas as pd
+import os
+import pytest
+
+series_keys = [str((1, "AUTOMOTIVE")), str((1, "BEVERAGES")), str((2, "AUTOMOTIVE"))]
+components = ["onpromotion", "dcoilwtico", "is_holiday"]
+
+
+def covariates_of(seed = 0, n_days = 30):
+    # per-series promotions and holidays, with the oil price shared by every series
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2017-01-01", periods = n_days)
+    oil = 50 + rng.normal(size = n_days).cumsum()
+    return {
+        key: TimeSeries.from_times_and_values(
+            dates,
+            np.column_stack([rng.integers(0, 20, n_days), oil, rng.random(n_days) < 0.1]).astype(np.float64),
+            columns = components
+        )
+        for key in series_keys
+    }
+
+
+def assert_same_series(series, expected):
+    assert series.time_index.equals(expected.time_index)
+    assert list(series.components) == list(expected.components)
+    np.testing.assert_array_equal(series.values(copy = False), expected.values(copy = False))
+
+
+@pytest.fixture
+def covariates():
+    return covariates_of()
+
+
+def test_shared_features_are_stored_once(covariates):
+    store = CovariateStore.from_timeseries(covariates)
+
+    assert store.global_features == ["dcoilwtico"]
+    assert store.series_features == ["onpromotion", "is_holiday"]
+    assert store.series_values.shape == (len(series_keys), 30, 2)
+    assert store.global_values.shape == (30, 1)
+
+
+def test_items_equal_the_original_series(covariates):
+    store = CovariateStore.from_timeseries(covariates)
+
+    assert list(store) == series_keys
+    for key in series_keys:
+        assert_same_series(store[key], covariates[key])
+        # the per-series features are a view into the store, not a copy
+        assert np.shares_memory(store.series_array(key), store.series_values)
+
+
+@pytest.mark.parametrize("mmap_mode", ["r", None])
+def test_save_and_load_round_trip(covariates, tmp_path, mmap_mode):
+    directory = str(tmp_path / "covariates")
+    CovariateStore.from_timeseries(covariates).save(directory)
+
+    store = CovariateStore.load(directory, mmap_mode = mmap_mode)
+
+    assert isinstance(store.series_values, np.memmap) == (mmap_mode == "r")
+    assert store.dates.freq == "D"
+    for key in series_keys:
+        assert_same_series(store[key], covariates[key])
+        assert np.shares_memory(store.series_array(key), store.series_values)
+
+
+def test_save_replaces_files_without_touching_mapped_arrays(covariates, tmp_path):
+    directory = str(tmp_path / "covariates")
+    CovariateStore.from_timeseries(covariates).save(directory)
+    mapped = CovariateStore.load(directory)
+
+    replacement = covariates_of(seed = 1, n_days = 40)
+    CovariateStore.from_timeseries(replacement).save(directory)
+
+    # the store mapped before keeps reading the arrays it mapped, and no temporary file is left behind
+    for key in series_keys:
+        assert_same_series(mapped[key], covariates[key])
+        assert_same_series(CovariateStore.load(directory)[key], replacement[key])
+    assert sorted(os.listdir(directory)) == sorted([CovariateStore.series_values_file, CovariateStore.global_values_file, CovariateStore.index_file])
+
+
+def test_legacy_covariates_are_loaded_until_the_store_is_saved(covariates, tmp_path):
+    directory = str(tmp_path / "covariates")
+    joblib.dump(covariates, str(tmp_path / "covariates.joblib"))
+
+    assert CovariateStore.index_path(directory) == CovariateStore.legacy_path(directory)
+    assert CovariateStore.size_on_disk(directory) == os.path.getsize(CovariateStore.legacy_path(directory))
+    legacy = CovariateStore.load(directory)
+    for key in series_keys:
+        assert_same_series(legacy[key], covariates[key])
+
+    legacy.save(directory)
+
+    assert CovariateStore.index_path(directory) == os.path.join(directory, CovariateStore.index_file)
+    assert isinstance(CovariateStore.load(directory).series_values, np.memmap)
@@ -0,0 +1,155 @@
+from src.components.data_ingestion import DataIngestion, DataIngestionConfig
+from src.pipelines.train_pipeline import build_stages
+from src.utils.artifact_store import ArtifactStore
+import pandas as pd
+import pytest
+
+
+class FakeCursor(list):
+    def batch_size(self, size):
+        return self
+
+
+class FakeCollection:
+    """
+    In-memory stand-in for a MongoDB collection, supporting the date $gt queries and projections of the ingestion and
+    recording the queries it receives
+    """
+
+    def __init__(self, documents):
+        self.documents = [{"_id": index, **document} for index, document in enumerate(documents)]
+        self.finds = []
+        self.counts = []
+
+    def insert_many(self, documents):
+        self.documents += [{"_id": len(self.documents) + index, **document} for index, document in enumerate(documents)]
+
+    def _match(self, query):
+        if not query:
+            return list(self.documents)
+        return [document for document in self.documents if document["date"] > query["date"]["$gt"]]
+
+    def find(self, query = None, projection = None):
+        self.finds.append((query, projection))
+        documents = self._match(query)
+        if projection is not None:
+            documents = [
+                {field: value for field, value in document.items() if projection.get(field, 0) == 1}
+                for document in documents
+            ]
+        return FakeCursor(documents)
+
+    def count_documents(self, query):
+        self.counts.append(query)
+        return len(self._match(query))
+
+
+def sales(dates, stores = (1, 2)):
+    return [
+        {"id": index, "date": date, "store_nbr": store, "family": "AUTOMOTIVE", "sales": float(index), "onpromotion": 0}
+        for index, (date, store) in enumerate((date, store) for date in dates for store in stores)
+    ]
+
+
+@pytest.fixture
+def client():
+    return {"StoreSales": {
+        "Dataset": FakeCollection(sales(["2017-01-01", "2017-01-02", "2017-01-03"])),
+        "Oil": FakeCollection([{"date": date, "dcoilwtico": 50.0 + day} for day, date in enumerate(["2017-01-01", "2017-01-02", "2017-01-03"])]),
+        "Stores": FakeCollection([{"store_nbr": store, "city": "Quito", "state": "Pichincha", "type": "D", "cluster": 13} for store in (1, 2)]),
+        "Holidays": FakeCollection([{"date": "2017-01-01", "type": "Holiday", "locale": "National", "locale_name": "Ecuador", "description": "Primer dia del ano", "transferred": False}])
+    }}
+
+
+@pytest.fixture
+def ingestion(tmp_path):
+    ingestion = DataIngestion()
+    config = ingestion.dataingestionconfig
+    config.artifacts_dir = str(tmp_path)
+    config.raw_data = str(tmp_path / "raw_data.parquet")
+    config.oil = str(tmp_path / "oil.parquet")
+    config.stores = str(tmp_path / "stores.parquet")
+    config.holidays = str(tmp_path / "holidays.parquet")
+    config.batch_size = 4
+    return ingestion
+
+
+def test_stream_mode_projects_fields_without_id(ingestion, client):
+    ingestion.load_dataset(client = client, mode = "stream")
+
+    raw_data = ArtifactStore().load(ingestion.dataingestionconfig.raw_data)
+    assert len(raw_data) == 6
+    assert list(raw_data.columns) == list(ingestion.dataingestionconfig.raw_data_fields)
+    for collection_name, _, fields, _ in ingestion._collections():
+        assert client["StoreSales"][collection_name].finds == [({}, {**{field: 1 for field in fields}, "_id": 0})]
+
+
+def test_incremental_mode_appends_only_new_records(ingestion, client):
+    ingestion.load_dataset(client = client, mode = "stream")
+    database = client["StoreSales"]
+    database["Dataset"].insert_many(sales(["2017-01-04", "2017-01-05"]))
+    database["Oil"].insert_many([{"date": "2017-01-04", "dcoilwtico": 54.0}])
+    for collection in database.values():
+        collection.finds.clear()
+
+    ingestion.load_dataset(client = client, mode = "incremental")
+
+    query = {"date": {"$gt": "2017-01-03"}}
+    assert database["Dataset"].counts == [query]
+    assert database["Dataset"].finds[0][0] == query
+    assert database["Dataset"].finds[0][1]["_id"] == 0
+    assert database["Oil"].finds[0][0] == query
+    # undated collections are read whole
+    assert database["Stores"].finds[0][0] == {}
+
+    raw_data = ArtifactStore().load(ingestion.dataingestionconfig.raw_data)
+    assert len(raw_data) == 10
+    assert not raw_data.duplicated(subset = ["date", "store_nbr"]).any()
+    assert list(raw_data["date"].dt.strftime("%Y-%m-%d").unique()) == ["2017-01-01", "2017-01-02", "2017-01-03", "2017-01-04", "2017-01-05"]
+    assert len(ArtifactStore().load(ingestion.dataingestionconfig.oil)) == 4
+
+
+def test_incremental_mode_without_new_records_pulls_nothing(ingestion, client):
+    ingestion.load_dataset(client = client, mode = "stream")
+    database = client["StoreSales"]
+    database["Dataset"].finds.clear()
+
+    ingestion.load_dataset(client = client, mode = "incremental")
+
+    assert database["Dataset"].counts == [{"date": {"$gt": "2017-01-03"}}]
+    assert database["Dataset"].finds == []
+    assert len(ArtifactStore().load(ingestion.dataingestionconfig.raw_data)) == 6
+
+
+def test_full_mode_drops_id(ingestion, client):
+    ingestion.load_dataset(client = client, mode = "full")
+
+    raw_data = ArtifactStore().load(ingestion.dataingestionconfig.raw_data)
+    stores = ArtifactStore().load(ingestion.dataingestionconfig.stores)
+    assert "_id" not in raw_data.columns and "_id" not in stores.columns
+    assert len(raw_data) == 6
+    assert client["StoreSales"]["Dataset"].finds == [(None, None)]
+
+
+def test_columns_null_in_the_first_batch_take_the_type_of_later_batches(ingestion, client):
+    # the oil price is missing on the first days of the collection
+    prices = [None] * 5 + [50.0, 51.0, 52.0]
+    client["StoreSales"]["Oil"] = FakeCollection([
+        {"date": date.strftime("%Y-%m-%d"), "dcoilwtico": price}
+        for date, price in zip(pd.date_range("2017-01-01", periods = len(prices)), prices)
+    ])
+
+    ingestion.load_dataset(client = client, mode = "stream")
+
+    oil = ArtifactStore().load(ingestion.dataingestionconfig.oil)
+    assert oil["dcoilwtico"].dtype == "float64"
+    assert oil["dcoilwtico"].isna().sum() == 5
+    assert oil["dcoilwtico"].dropna().tolist() == [50.0, 51.0, 52.0]
+
+
+def test_incremental_training_pulls_only_new_documents():
+    stages = {stage.name: stage for stage in build_stages(incremental = True)}
+    assert stages["data_ingestion"].params["ingestion_mode"] == "incremental"
+
+    stages = {stage.name: stage for stage in build_stages()}
+    assert stages["data_ingestion"].params["ingestion_mode"] == DataIngestionConfig().ingestion_mode
@@ -0,0 +1,237 @@
+from src.components.data_transformation import DataTransformation, mark_holidays, transform_covariate_shard
+from src.utils.artifact_store import ArtifactStore, PartitionedDataset
+from darts import TimeSeries
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def reference_mark_holidays(processed_data, holidays):
+    # the per-holiday loop mark_holidays replaced, kept as the reference it must agree with
+    holidays = holidays[holidays["transferred"] != True]
+    holidays = holidays.drop(["transferred", "description"], axis = 1)
+    holidays = holidays[holidays["type"] != "Work Day"]
+    holidays = holidays.drop("type", axis = 1)
+
+    national_holidays = holidays[holidays["locale"] == "National"][["date"]]
+    regional_holidays = holidays[((holidays["locale"] == "Regional") & (~holidays["date"].isin(national_holidays["date"])))]
+    local_holidays = holidays[((holidays["locale"] == "Local") & (~holidays["date"].isin(national_holidays["date"])))]
+    regional_holidays = regional_holidays[["date", "locale_name"]].rename(columns = {"locale_name":"state"})
+    local_holidays = local_holidays[["date", "locale_name"]].rename(columns = {"locale_name":"city"})
+    national_holidays = national_holidays[~national_holidays.duplicated(keep = "first")]
+    regional_holidays = regional_holidays[~regional_holidays.duplicated(keep = "first")]
+    local_holidays = local_holidays[~local_holidays.duplicated(keep = "first")]
+
+    is_holiday = np.zeros(shape = (len(processed_data), )).astype(int)
+    is_holiday[processed_data["date"].isin(national_holidays["date"]).to_numpy()] = 1
+    for date, state in zip(regional_holidays["date"], regional_holidays["state"]):
+        is_holiday[((processed_data["date"] == date) & (processed_data["state"] == state)).to_numpy()] = 1
+    for date, city in zip(local_holidays["date"], local_holidays["city"]):
+        is_holiday[((processed_data["date"] == date) & (processed_data["city"] == city)).to_numpy()] = 1
+    return is_holiday
+
+
+def small_frames():
+    stores = pd.DataFrame({
+        "store_nbr": [1, 2, 3, 4],
+        "city": ["Quito", "Quito", "Guayaquil", "Cuenca"],
+        "state": ["Pichincha", "Pichincha", "Guayas", "Azuay"]
+    })
+    dates = pd.date_range("2017-01-01", periods = 8).strftime("%Y-%m-%d")
+    data = pd.DataFrame([(date, store) for date in dates for store in stores["store_nbr"]], columns = ["date", "store_nbr"])
+    data = data.merge(stores, on = "store_nbr")
+    holidays = pd.DataFrame([
+        ("2017-01-01", "Holiday", "National", "Ecuador", False),
+        # a regional and a local holiday on a national one, flagged once
+        ("2017-01-01", "Holiday", "Regional", "Guayas", False),
+        ("2017-01-01", "Holiday", "Local", "Quito", False),
+        ("2017-01-02", "Holiday", "Regional", "Pichincha", False),
+        ("2017-01-02", "Holiday", "Regional", "Pichincha", False),
+        ("2017-01-03", "Additional", "Local", "Guayaquil", False),
+        ("2017-01-04", "Holiday", "Local", "Cuenca", False),
+        ("2017-01-04", "Holiday", "Regional", "Guayas", False),
+        # transferred holidays and work days are not holidays, the transfer day is
+        ("2017-01-05", "Holiday", "National", "Ecuador", True),
+        ("2017-01-06", "Transfer", "National", "Ecuador", False),
+        ("2017-01-07", "Holiday", "Local", "Quito", True),
+        ("2017-01-07", "Work Day", "National", "Ecuador", False),
+        ("2017-01-08", "Bridge", "Local", "Loja", False)
+    ], columns = ["date", "type", "locale", "locale_name", "transferred"])
+    holidays["description"] = "holiday"
+    return data, holidays
+
+
+def random_frames(seed = 1):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2016-01-01", periods = 120).strftime("%Y-%m-%d")
+    stores = pd.DataFrame({
+        "store_nbr": range(1, 13),
+        "city": rng.choice(["Quito", "Guayaquil", "Cuenca", "Ambato"], 12),
+        "state": rng.choice(["Pichincha", "Guayas", "Azuay", "Tungurahua"], 12)
+    })
+    data = pd.DataFrame([(date, store) for date in dates for store in stores["store_nbr"]], columns = ["date", "store_nbr"])
+    data = data.merge(stores, on = "store_nbr")
+    holidays = pd.DataFrame({
+        "date": rng.choice(dates, 60),
+        "type": rng.choice(["Holiday", "Work Day", "Additional", "Transfer"], 60),
+        "locale": rng.choice(["National", "Regional", "Local"], 60),
+        "locale_name": rng.choice(["Ecuador", "Quito", "Pichincha", "Guayas", "Cuenca", "Azuay"], 60),
+        "description": "holiday",
+        "transferred": rng.choice([True, False], 60, p = [0.2, 0.8])
+    })
+    return data, holidays
+
+
+def typed(data, holidays):
+    data, holidays = data.copy(), holidays.copy()
+    data["date"] = pd.to_datetime(data["date"])
+    holidays["date"] = pd.to_datetime(holidays["date"])
+    for column in ("city", "state"):
+        data[column] = data[column].astype("category")
+    for column in ("type", "locale", "locale_name"):
+        holidays[column] = holidays[column].astype("category")
+    return data, holidays
+
+
+@pytest.mark.parametrize("frames", [small_frames, random_frames])
+@pytest.mark.parametrize("column_types", ["string", "typed"])
+def test_mark_holidays_matches_reference(frames, column_types):
+    data, holidays = frames()
+    expected = reference_mark_holidays(data, holidays)
+    if column_types == "typed":
+        data, holidays = typed(data, holidays)
+
+    np.testing.assert_array_equal(mark_holidays(data, holidays), expected)
+
+
+def test_mark_holidays_small_frame():
+    data, holidays = small_frames()
+    flagged = data.loc[mark_holidays(data, holidays) == 1, ["date", "store_nbr"]]
+
+    assert sorted(map(tuple, flagged.to_numpy().tolist())) == [
+        ("2017-01-01", 1), ("2017-01-01", 2), ("2017-01-01", 3), ("2017-01-01", 4),
+        ("2017-01-02", 1), ("2017-01-02", 2),
+        ("2017-01-03", 3),
+        ("2017-01-04", 3), ("2017-01-04", 4),
+        ("2017-01-06", 1), ("2017-01-06", 2), ("2017-01-06", 3), ("2017-01-06", 4)
+    ]
+
+
+def reference_transform_covariates(covariates, all_missing_dates):
+    # the single-process conversion transform_covariate_shard replaced: missing dates enlarged one by one, forward
+    # filled from the last record, then converted series by series
+    covariates = {key: covariate.copy() for key, covariate in covariates.items()}
+    for cov in covariates:
+        for date in all_missing_dates:
+            covariates[cov].loc[date, :] = [np.nan] * covariates[cov].shape[1]
+        covariates[cov] = covariates[cov].ffill()
+    for cov_key in covariates:
+        temp_cov = covariates[cov_key]
+        temp_cov.set_index(pd.to_datetime(temp_cov.index), inplace = True)
+        covariates[cov_key] = TimeSeries.from_dataframe(temp_cov)
+    return covariates
+
+
+def covariate_frames(seed = 0):
+    rng = np.random.default_rng(seed)
+    full_dates = pd.date_range("2016-12-01", periods = 60)
+    # dates missing from every series, such as Christmas, and one at the end of the range
+    all_missing_dates = full_dates[[24, 31, 58]]
+    dates = full_dates.difference(all_missing_dates)
+    oil = 50 + rng.normal(size = len(dates)).cumsum()
+    oil[rng.random(len(dates)) < 0.1] = np.nan
+    covariates = {}
+    for store in range(1, 4):
+        for family in ("AUTOMOTIVE", "BEVERAGES", "DAIRY"):
+            covariate = pd.DataFrame({
+                "onpromotion": rng.integers(0, 20, len(dates)),
+                "dcoilwtico": oil,
+                "is_holiday": (rng.random(len(dates)) < 0.1).astype(int)
+            }, index = dates)
+            covariate.index.name = "date"
+            covariates[str((store, family))] = covariate
+    return covariates, full_dates, all_missing_dates
+
+
+@pytest.mark.parametrize("n_workers", [1, 3])
+def test_covariate_shards_match_single_process_transformation(n_workers):
+    covariates, full_dates, all_missing_dates = covariate_frames()
+    expected = reference_transform_covariates(covariates, all_missing_dates)
+
+    transformation = DataTransformation()
+    transformation.datatransformationconfig.n_workers = n_workers
+    transformed = transformation.map_shards(
+        transform_covariate_shard,
+        list(covariates.items()),
+        full_dates = full_dates,
+        missing_dates = all_missing_dates
+    )
+
+    assert [key for key, _ in transformed] == list(covariates)
+    for key, series in transformed:
+        assert series.time_index.equals(expected[key].time_index)
+        assert list(series.components) == list(expected[key].components)
+        np.testing.assert_array_equal(series.values(), expected[key].values())
+
+
+def raw_frames(seed = 2):
+    # three months of sales over a month boundary and a year boundary, with oil prices missing on weekends
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2016-11-20", "2017-02-10")
+    stores = pd.DataFrame({
+        "store_nbr": [1, 2, 3],
+        "city": ["Quito", "Guayaquil", "Cuenca"],
+        "state": ["Pichincha", "Guayas", "Azuay"],
+        "type": ["D", "A", "B"],
+        "cluster": [13, 1, 6]
+    })
+    data = pd.DataFrame([(date, store, family) for date in dates for store in stores["store_nbr"] for family in ("AUTOMOTIVE", "BEVERAGES")], columns = ["date", "store_nbr", "family"])
+    data.insert(0, "id", range(len(data)))
+    data["sales"] = rng.gamma(2.0, 50.0, len(data))
+    data["onpromotion"] = rng.integers(0, 10, len(data))
+    oil_dates = dates[dates.dayofweek < 5]
+    oil = pd.DataFrame({"date": oil_dates, "dcoilwtico": 50 + rng.normal(size = len(oil_dates)).cumsum()})
+    holidays = pd.DataFrame([
+        ("2016-12-25", "Holiday", "National", "Ecuador", "Navidad", False),
+        ("2017-01-01", "Holiday", "National", "Ecuador", "Primer dia del ano", False),
+        ("2016-12-06", "Holiday", "Local", "Quito", "Fundacion de Quito", False),
+        ("2017-01-02", "Transfer", "National", "Ecuador", "Traslado", False),
+        ("2017-02-01", "Holiday", "Regional", "Azuay", "Provincializacion", False)
+    ], columns = ["date", "type", "locale", "locale_name", "description", "transferred"])
+    holidays["date"] = pd.to_datetime(holidays["date"])
+    return data, oil, stores, holidays
+
+
+def sorted_records(frame):
+    return frame.sort_values(["date", "store_nbr", "family"]).reset_index(drop = True)
+
+
+def test_partitioned_integration_and_split_match_the_in_memory_ones(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = ArtifactStore()
+    data, oil, stores, holidays = raw_frames()
+    transformation = DataTransformation()
+    config = transformation.datatransformationconfig
+    for frame, path in ((data, config.data), (oil, config.oil), (stores, config.stores), (holidays, config.holidays)):
+        store.save(frame, path)
+
+    config.integration_mode = "full"
+    transformation.integrate_data()
+    transformation.split_data(number_of_test_days = 15)
+    expected = {name: sorted_records(store.load(path)) for name, path in (("processed", config.processed_data), ("train", config.train_data), ("test", config.test_data))}
+
+    config.integration_mode = "partitioned"
+    config.processed_data = str(tmp_path / "artifacts" / "partitioned_data.parquet")
+    config.train_data = str(tmp_path / "artifacts" / "partitioned_train.parquet")
+    config.test_data = str(tmp_path / "artifacts" / "partitioned_test.parquet")
+    # raw records streamed in batches smaller than a month, spilling several files per partition
+    transformation.artifactstore.artifactstoreconfig.batch_size = 100
+    transformation.integrate_data()
+    transformation.split_data(number_of_test_days = 15)
+
+    assert [partition["file"] for partition in PartitionedDataset(config.processed_data).partitions()] == [
+        "part-2016-11.parquet", "part-2016-12.parquet", "part-2017-01.parquet", "part-2017-02.parquet"
+    ]
+    for name, path in (("processed", config.processed_data), ("train", config.train_data), ("test", config.test_data)):
+        pd.testing.assert_frame_equal(sorted_records(store.load(path)), expected[name], check_categorical = False)
+    assert expected["test"]["date"].min() == pd.Timestamp("2017-01-27")
@@ -0,0 +1,43 @@
+from src.utils.drift_monitor import StreamingStats
+import numpy as np
+
+
+def window_of(reference, values):
+    window = reference.empty_like()
+    values = np.asarray(values, dtype = np.float64)
+    window.update(np.repeat(np.arange(len(values)), values.shape[1]), values.reshape(-1))
+    return window
+
+
+def test_holiday_shift_raises_psi():
+    # mostly zero reference with a few holidays, and a reference without any
+    reference_values = np.zeros((2, 365))
+    reference_values[0, ::30] = 1
+    reference = StreamingStats.from_values(reference_values, n_bins = 10)
+
+    unchanged = window_of(reference, reference_values[:, :60])
+    shifted = window_of(reference, np.ones((2, 60)))
+
+    assert np.all(unchanged.psi(reference) < 0.1)
+    assert np.all(shifted.psi(reference) > 0.25)
+
+
+def test_zero_inflated_values_keep_their_own_bin():
+    rng = np.random.default_rng(0)
+    reference_values = np.where(rng.random((1, 365)) < 0.8, 0.0, rng.gamma(2.0, 10.0, (1, 365)))
+    reference = StreamingStats.from_values(reference_values, n_bins = 10)
+
+    assert np.all(np.diff(reference.edges[np.isfinite(reference.edges)]) > 0)
+    assert reference.histogram[0, 0] == (reference_values == 0).sum()
+    assert window_of(reference, np.full((1, 60), 0.5)).psi(reference)[0] > 0.25
+
+
+def test_continuous_values_fill_quantile_bins():
+    rng = np.random.default_rng(0)
+    reference_values = rng.normal(size = (3, 1000))
+    reference = StreamingStats.from_values(reference_values, n_bins = 10)
+
+    assert np.all(np.isfinite(reference.edges))
+    assert np.all(reference.histogram == 100)
+    assert np.all(window_of(reference, rng.normal(size = (3, 1000))).psi(reference) < 0.05)
+    assert np.all(window_of(reference, rng.normal(loc = 1.0, size = (3, 1000))).psi(reference) > 0.25)
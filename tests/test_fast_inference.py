@@ -0,0 +1,81 @@
+from src.components.model_trainer import ModelTrainer
+from src.utils.covariate_store import CovariateStore
+from src.utils.fast_inference import FastForecaster
+from darts import TimeSeries
+import numpy as np
+import pandas as pd
+import pytest
+
+series_keys = [str((1, "AUTOMOTIVE")), str((1, "BEVERAGES")), str((2, "AUTOMOTIVE"))]
+components = ["onpromotion", "dcoilwtico", "is_holiday"]
+
+
+def covariate_values(rng, n_series, n_days):
+    # per-series promotions and holidays, with the oil price shared by every series
+    values = np.empty((n_series, n_days, len(components)))
+    values[:, :, 0] = rng.integers(0, 20, size = (n_series, n_days))
+    values[:, :, 1] = 50 + rng.normal(size = n_days).cumsum()
+    values[:, :, 2] = rng.random((n_series, n_days)) < 0.1
+    return values
+
+
+@pytest.fixture(scope = "module")
+def trained():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2016-01-01", periods = 160)
+    history = covariate_values(rng, len(series_keys), len(dates))
+    sales = 100 + 5 * history[:, :, 0] + 30 * history[:, :, 2] + rng.normal(scale = 10, size = history.shape[:2])
+
+    timeseries_data = TimeSeries.from_times_and_values(dates, sales.T, columns = series_keys)
+    covariates = {
+        key: TimeSeries.from_times_and_values(dates, history[position], columns = components)
+        for position, key in enumerate(series_keys)
+    }
+    model = ModelTrainer().create_sales_model(n_estimators = 30)
+    model.fit(series = [timeseries_data[key] for key in series_keys], past_covariates = [covariates[key] for key in series_keys])
+    return model, timeseries_data, covariates
+
+
+@pytest.mark.parametrize("horizon", [1, 7, 30])
+def test_fast_forecaster_matches_lightgbm_model(trained, horizon):
+    model, timeseries_data, covariates = trained
+    forecaster = FastForecaster.from_artifacts(
+        trained_model = model,
+        timeseries_data = timeseries_data,
+        covariates = CovariateStore.from_timeseries(covariates)
+    )
+    future = covariate_values(np.random.default_rng(horizon), len(series_keys), horizon)
+    future[:, :, 1] = future[0, :, 1]
+    future_dates = pd.date_range(timeseries_data.end_time() + pd.Timedelta(days = 1), periods = horizon)
+
+    predictions = model.predict(
+        n = horizon,
+        series = [timeseries_data[key] for key in series_keys],
+        past_covariates = [
+            covariates[key].append(TimeSeries.from_times_and_values(future_dates, future[position], columns = components))
+            for position, key in enumerate(series_keys)
+        ]
+    )
+    reference = np.stack([prediction.values(copy = False)[:, 0] for prediction in predictions])
+
+    new_covariates = np.stack([
+        forecaster.covariate_rows(dict(zip(components, future[position].T)), n = horizon)
+        for position in range(len(series_keys))
+    ])
+    np.testing.assert_allclose(forecaster.predict(series_keys, new_covariates), reference, rtol = 0, atol = 1e-9)
+
+
+def test_fast_forecaster_predicts_a_subset_in_any_order(trained):
+    model, timeseries_data, covariates = trained
+    forecaster = FastForecaster.from_artifacts(
+        trained_model = model,
+        timeseries_data = timeseries_data,
+        covariates = CovariateStore.from_timeseries(covariates)
+    )
+    new_covariates = np.zeros((len(series_keys), 5, len(components)))
+    new_covariates[:, :, components.index("dcoilwtico")] = 50.0
+
+    forecasts = forecaster.predict(series_keys, new_covariates)
+    reordered = forecaster.predict(series_keys[::-1][:2], new_covariates[::-1][:2])
+
+    np.testing.assert_array_equal(reordered, forecasts[::-1][:2])
@@ -0,0 +1,73 @@
+from src.utils import forecast_cache
+from src.utils.forecast_cache import ForecastCache, ForecastCacheConfig, MISS
+import pytest
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(forecast_cache.time, "monotonic", clock)
+    return clock
+
+
+def key_of(store_nbr, horizon = 2):
+    return ForecastCache.make_key(store_nbr, "AUTOMOTIVE", horizon, [0] * horizon, [0] * horizon)
+
+
+def test_hits_and_misses(clock):
+    cache = ForecastCache()
+
+    assert cache.get(key_of(1), "v1") is MISS
+    cache.put(key_of(1), "v1", [1.0, 2.0])
+
+    assert cache.get(key_of(1), "v1") == [1.0, 2.0]
+    assert cache.get(key_of(2), "v1") is MISS
+    metrics = cache.metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["hit_ratio"]) == (1, 2, round(1 / 3, 4))
+
+
+def test_covariates_past_the_horizon_share_a_key():
+    assert ForecastCache.make_key(1, "AUTOMOTIVE", 2, [3, 4, 5], [0, 1, 1]) == ForecastCache.make_key(1, "AUTOMOTIVE", 2, [3, 4], [0, 1])
+    assert ForecastCache.make_key(1, "AUTOMOTIVE", 2, [3, 4], [0, 1]) != ForecastCache.make_key(1, "AUTOMOTIVE", 3, [3, 4, 5], [0, 1, 1])
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = ForecastCache(ForecastCacheConfig(max_entries = 16, ttl_seconds = 60.0))
+    cache.put(key_of(1), "v1", [1.0])
+
+    clock.now += 59.0
+    assert cache.get(key_of(1), "v1") == [1.0]
+    clock.now += 2.0
+    assert cache.get(key_of(1), "v1") is MISS
+    assert cache.metrics()["expirations"] == 1
+    assert cache.metrics()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = ForecastCache(ForecastCacheConfig(max_entries = 2, ttl_seconds = 60.0))
+    cache.put(key_of(1), "v1", [1.0])
+    cache.put(key_of(2), "v1", [2.0])
+    cache.get(key_of(1), "v1")
+    cache.put(key_of(3), "v1", [3.0])
+
+    assert cache.get(key_of(2), "v1") is MISS
+    assert cache.get(key_of(1), "v1") == [1.0]
+    assert cache.metrics()["evictions"] == 1
+
+
+def test_a_new_artifacts_version_drops_the_cache(clock):
+    cache = ForecastCache()
+    cache.put(key_of(1), "v1", [1.0])
+    cache.put(key_of(2), "v1", [2.0])
+
+    assert cache.get(key_of(1), "v2") is MISS
+    assert cache.metrics()["invalidations"] == 2
+    assert cache.metrics()["version"] == "v2"
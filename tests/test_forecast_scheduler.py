@@ -0,0 +1,163 @@
+from src.pipelines.forecast_scheduler import ForecastScheduler, ForecastSchedulerConfig
+from src.pipelines.prediction_pipeline import PredictionPipeline
+from src.utils.forecast_cache import ForecastCache, MISS
+from types import SimpleNamespace
+import asyncio
+import threading
+import pytest
+
+
+def request_of(store_nbr, family = "AUTOMOTIVE", horizon = 2):
+    return {"store_nbr": store_nbr, "family": family, "horizon": horizon, "onpromotion": [0] * horizon, "is_holiday": [0] * horizon}
+
+
+class RecordingPipeline:
+    # forecasts every request as its store number, recording the batches it is handed
+    def __init__(self, cached = None):
+        self.cached = cached or {}
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def lookup_cached(self, request):
+        return self.cached.get(request["store_nbr"], MISS)
+
+    def produce_batch_forecasts(self, requests, cache_checked = False):
+        assert cache_checked
+        self.release.wait(timeout = 5)
+        self.batches.append([request["store_nbr"] for request in requests])
+        return {
+            "forecasts": [[float(request["store_nbr"])] if request["store_nbr"] > 0 else None for request in requests],
+            "errors": [None if request["store_nbr"] > 0 else "Invalid combination of store_nbr and family supplied" for request in requests]
+        }
+
+
+def run_scheduler(pipeline, config, scenario):
+    async def main():
+        scheduler = ForecastScheduler(pipeline = pipeline, config = config)
+        await scheduler.start()
+        try:
+            return await scenario(scheduler), scheduler.stats()
+        finally:
+            await scheduler.stop()
+    return asyncio.run(main())
+
+
+def test_requests_arriving_together_share_a_batch():
+    pipeline = RecordingPipeline()
+    config = ForecastSchedulerConfig(max_batch_size = 64, max_wait_ms = 50.0, max_queue_depth = 1024, n_workers = 1)
+
+    async def scenario(scheduler):
+        return await asyncio.gather(*(scheduler.submit(request_of(store_nbr)) for store_nbr in (1, 2, 0, 3)))
+
+    results, stats = run_scheduler(pipeline, config, scenario)
+
+    assert pipeline.batches == [[1, 2, 0, 3]]
+    # every caller gets its own slice of the batch, an invalid request its error
+    assert results == [[1.0], [2.0], "Invalid combination of store_nbr and family supplied", [3.0]]
+    assert stats["batches"] == 1 and stats["requests"] == 4
+
+
+def test_full_batches_are_flushed_without_waiting():
+    pipeline = RecordingPipeline()
+    config = ForecastSchedulerConfig(max_batch_size = 2, max_wait_ms = 10_000.0, max_queue_depth = 1024, n_workers = 1)
+
+    async def scenario(scheduler):
+        return await asyncio.wait_for(
+            asyncio.gather(*(scheduler.submit(request_of(store_nbr)) for store_nbr in range(1, 5))),
+            timeout = 5
+        )
+
+    results, stats = run_scheduler(pipeline, config, scenario)
+
+    assert results == [[1.0], [2.0], [3.0], [4.0]]
+    assert pipeline.batches == [[1, 2], [3, 4]]
+    assert stats["batch_size_histogram"]["2"] == 2
+
+
+def test_cached_requests_are_not_queued():
+    pipeline = RecordingPipeline(cached = {7: [70.0]})
+    config = ForecastSchedulerConfig(max_batch_size = 64, max_wait_ms = 1.0, max_queue_depth = 1024, n_workers = 1)
+
+    async def scenario(scheduler):
+        return await scheduler.submit(request_of(7))
+
+    result, stats = run_scheduler(pipeline, config, scenario)
+
+    assert result == [70.0]
+    assert pipeline.batches == []
+    assert stats["requests"] == 0
+
+
+def test_full_queue_rejects_requests():
+    pipeline = RecordingPipeline()
+    pipeline.release.clear()
+    config = ForecastSchedulerConfig(max_batch_size = 1, max_wait_ms = 1.0, max_queue_depth = 1, n_workers = 1)
+
+    async def scenario(scheduler):
+        # the first request holds the only worker, the second is batched waiting for it, the third waits in the
+        # queue and the fourth finds it full
+        submitted = []
+        for store_nbr in (1, 2, 3):
+            submitted.append(asyncio.ensure_future(scheduler.submit(request_of(store_nbr))))
+            await asyncio.sleep(0.05)
+        with pytest.raises(asyncio.QueueFull):
+            await scheduler.submit(request_of(4))
+        pipeline.release.set()
+        return await asyncio.gather(*submitted)
+
+    results, stats = run_scheduler(pipeline, config, scenario)
+
+    assert results == [[1.0], [2.0], [3.0]]
+    assert stats["rejected"] == 1
+
+
+class FailingPipeline(PredictionPipeline):
+    # forecasts every series as its store number, failing every group holding a series of store 13
+    def _predict_group(self, artifacts, horizon, series_names, requests):
+        if any(request["store_nbr"] == 13 for request in requests):
+            raise ValueError("covariates could not be generated")
+        return [[float(request["store_nbr"])] * horizon for request in requests]
+
+
+class StaticRegistry:
+    def __init__(self, artifacts = None, error = None):
+        self.artifacts = artifacts
+        self.error = error
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.artifacts
+
+    def current(self):
+        return self.artifacts
+
+
+def served_artifacts(store_nbrs):
+    return SimpleNamespace(version = "v1", covariates = {str((store_nbr, "AUTOMOTIVE")) for store_nbr in store_nbrs})
+
+
+def test_a_failing_request_does_not_fail_its_batch():
+    cache = ForecastCache()
+    pipeline = FailingPipeline(registry = StaticRegistry(served_artifacts([1, 2, 13])), cache = cache)
+    requests = [request_of(1), request_of(13), request_of(2), request_of(4), request_of(2, horizon = 3)]
+
+    response = pipeline.produce_batch_forecasts(requests)
+
+    assert response["forecasts"] == [[1.0, 1.0], None, [2.0, 2.0], None, [2.0, 2.0, 2.0]]
+    assert response["errors"][0] is None and response["errors"][2] is None and response["errors"][4] is None
+    assert response["errors"][1] == "Forecasting failed: covariates could not be generated"
+    assert response["errors"][3] == "Invalid combination of store_nbr and family supplied"
+    # the requests forecasted one by one after their group failed are cached like any other
+    assert pipeline.lookup_cached(request_of(1)) == [1.0, 1.0]
+    assert pipeline.lookup_cached(request_of(13)) is MISS
+
+
+def test_unloadable_artifacts_fail_every_request_with_its_error():
+    pipeline = FailingPipeline(registry = StaticRegistry(error = FileNotFoundError("artifacts/trained_model.joblib")))
+
+    response = pipeline.produce_batch_forecasts([request_of(1), request_of(2)])
+
+    assert response["forecasts"] == [None, None]
+    assert response["errors"] == ["Artifacts could not be loaded: artifacts/trained_model.joblib"] * 2
@@ -0,0 +1,61 @@
+from src.utils.metrics import error_sums, group_sums, metrics_from_sums, metrics_table
+from sklearn.metrics import mean_absolute_error, mean_squared_error, mean_squared_log_error
+import numpy as np
+import pytest
+
+series_keys = [str((store_nbr, family)) for store_nbr in (1, 2, 3) for family in ("AUTOMOTIVE", "BEVERAGES")]
+
+
+@pytest.fixture
+def forecasts():
+    rng = np.random.default_rng(0)
+    actual = rng.gamma(2.0, 50.0, size = (28, len(series_keys)))
+    actual[rng.random(actual.shape) < 0.2] = 0.0
+    predicted = np.clip(actual + rng.normal(scale = 20.0, size = actual.shape), 0, None)
+    # a few missing actuals, left out of every metric
+    actual[[0, 5, 9], [1, 1, 4]] = np.nan
+    return actual, predicted
+
+
+def pooled(actual, predicted, columns):
+    actual, predicted = actual[:, columns].reshape(-1), predicted[:, columns].reshape(-1)
+    valid = ~np.isnan(actual)
+    return actual[valid], predicted[valid]
+
+
+def test_series_metrics_match_direct_computation(forecasts):
+    actual, predicted = forecasts
+    metrics = metrics_from_sums(error_sums(actual, predicted))
+
+    for column in range(len(series_keys)):
+        series_actual, series_predicted = pooled(actual, predicted, [column])
+        assert metrics["mse"][column] == pytest.approx(mean_squared_error(series_actual, series_predicted))
+        assert metrics["mae"][column] == pytest.approx(mean_absolute_error(series_actual, series_predicted))
+        assert metrics["rmsle"][column] == pytest.approx(np.sqrt(mean_squared_log_error(series_actual, series_predicted)))
+
+
+def test_group_metrics_pool_the_errors_of_their_series(forecasts):
+    actual, predicted = forecasts
+    families = [key.split(", ")[1] for key in series_keys]
+
+    groups, sums = group_sums(error_sums(actual, predicted), families)
+    metrics = metrics_from_sums(sums)
+
+    for position, family in enumerate(groups):
+        group_actual, group_predicted = pooled(actual, predicted, [column for column, label in enumerate(families) if label == family])
+        assert metrics["mse"][position] == pytest.approx(mean_squared_error(group_actual, group_predicted))
+        assert metrics["mae"][position] == pytest.approx(mean_absolute_error(group_actual, group_predicted))
+        assert metrics["wape"][position] == pytest.approx(np.abs(group_predicted - group_actual).sum() / np.abs(group_actual).sum())
+        assert metrics["bias"][position] == pytest.approx((group_predicted - group_actual).mean())
+
+
+def test_metrics_table_levels(forecasts):
+    actual, predicted = forecasts
+    table = metrics_table(actual, predicted, series_keys)
+
+    assert table.groupby("level").size().to_dict() == {"series": 6, "store": 3, "family": 2, "global": 1}
+    all_actual, all_predicted = pooled(actual, predicted, list(range(len(series_keys))))
+    overall = table[table["level"] == "global"].iloc[0]
+    assert overall["observations"] == len(all_actual)
+    assert overall["mse"] == pytest.approx(mean_squared_error(all_actual, all_predicted))
+    assert overall["mae"] == pytest.approx(mean_absolute_error(all_actual, all_predicted))
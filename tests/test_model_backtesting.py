@@ -0,0 +1,39 @@
+from src.components.model_backtesting import build_design_matrix, lag_window
+from darts import TimeSeries
+from darts.utils.data.tabularization import create_lagged_training_data
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize("target_lags, past_lags", [
+    ([-1, -2, -7], [-1, -3]),
+    # past covariate lags reaching further back than the target lags
+    ([-1, -3], [-2, -6]),
+    ([-2], [-1, -9])
+])
+def test_design_matrix_matches_darts_samples(target_lags, past_lags):
+    rng = np.random.default_rng(0)
+    n_dates, n_series, components = 40, 3, ["onpromotion", "dcoilwtico", "is_holiday"]
+    targets = rng.normal(size = (n_dates, n_series))
+    covariates = rng.normal(size = (n_series, n_dates, len(components)))
+    dates = pd.date_range("2017-01-01", periods = n_dates)
+
+    features, labels = build_design_matrix(targets, covariates, target_lags, past_lags)
+
+    expected_features, expected_labels, *_ = create_lagged_training_data(
+        target_series = [TimeSeries.from_times_and_values(dates, targets[:, series]) for series in range(n_series)],
+        output_chunk_length = 1,
+        past_covariates = [TimeSeries.from_times_and_values(dates, covariates[series], columns = components) for series in range(n_series)],
+        lags = target_lags,
+        lags_past_covariates = past_lags,
+        uses_static_covariates = False,
+        concatenate = False
+    )
+    assert len(labels) == (n_dates - lag_window(target_lags, past_lags)) * n_series
+    # rows are ordered date by date, darts returns the samples series by series
+    features = features.reshape(-1, n_series, features.shape[1])
+    labels = labels.reshape(-1, n_series)
+    for series in range(n_series):
+        np.testing.assert_array_equal(features[:, series], expected_features[series][:, :, 0])
+        np.testing.assert_array_equal(labels[:, series], expected_labels[series][:, 0, 0])
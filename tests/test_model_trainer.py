@@ -0,0 +1,75 @@
+from src.components.model_trainer import ModelTrainer
+from src.utils.covariate_store import CovariateStore
+from darts import TimeSeries
+import joblib
+import json
+import numpy as np
+import pandas as pd
+import os
+import pytest
+
+series_keys = [str((1, "AUTOMOTIVE")), str((1, "BEVERAGES")), str((2, "AUTOMOTIVE"))]
+components = ["onpromotion", "dcoilwtico", "is_holiday"]
+
+
+def save_artifacts(values, covariate_values, n_days):
+    # the training series and covariates of the first n_days dates, as the transformation stage writes them
+    dates = pd.date_range("2016-01-01", periods = n_days)
+    joblib.dump(TimeSeries.from_times_and_values(dates, values[:n_days], columns = series_keys), os.path.join("artifacts", "timeseries_data.joblib"))
+    CovariateStore.from_timeseries({
+        key: TimeSeries.from_times_and_values(dates, covariate_values[position, :n_days], columns = components)
+        for position, key in enumerate(series_keys)
+    }).save(os.path.join("artifacts", "covariates"))
+
+
+def read_manifest():
+    with open(os.path.join("artifacts", "model_manifest.json")) as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def artifacts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("artifacts")
+    rng = np.random.default_rng(0)
+    n_days = 220
+    covariate_values = np.empty((len(series_keys), n_days, len(components)))
+    covariate_values[:, :, 0] = rng.integers(0, 20, size = (len(series_keys), n_days))
+    covariate_values[:, :, 1] = 50 + rng.normal(size = n_days).cumsum()
+    covariate_values[:, :, 2] = rng.random((len(series_keys), n_days)) < 0.1
+    values = (100 + 5 * covariate_values[:, :, 0] + rng.normal(scale = 10, size = (len(series_keys), n_days))).T
+    return values, covariate_values
+
+
+def test_incremental_update_and_no_op(artifacts):
+    values, covariate_values = artifacts
+    save_artifacts(values, covariate_values, 200)
+    ModelTrainer().train_model(mode = "full")
+    full = read_manifest()["versions"][-1]
+    assert full["mode"] == "full"
+
+    save_artifacts(values, covariate_values, 210)
+    ModelTrainer().train_model(mode = "incremental")
+    versions = read_manifest()["versions"]
+    assert len(versions) == 2
+    assert versions[-1]["mode"] == "incremental"
+    assert versions[-1]["parent"] == full["version"]
+    assert versions[-1]["new_days"] == 10
+    assert versions[-1]["trained_last_date"] == "2016-07-28"
+    assert versions[-1]["trees"] > full["trees"]
+
+    # no new dates: the models are kept, and the oil forecasts deleted since are rebuilt
+    trainer = ModelTrainer()
+    outputs = (trainer.modeltrainerconfig.oil_model, trainer.modeltrainerconfig.trained_model, trainer.modeltrainerconfig.oil_forecasts)
+    os.remove(trainer.modeltrainerconfig.oil_forecasts)
+    model_bytes = open(trainer.modeltrainerconfig.trained_model, "rb").read()
+    past = 1_000_000_000
+    for path in outputs[:2]:
+        os.utime(path, (past, past))
+
+    trainer.train_model(mode = "incremental")
+
+    assert len(read_manifest()["versions"]) == 2
+    assert open(trainer.modeltrainerconfig.trained_model, "rb").read() == model_bytes
+    assert joblib.load(trainer.modeltrainerconfig.oil_forecasts)["horizon"] == trainer.modeltrainerconfig.oil_forecast_horizon
+    assert all(os.path.getmtime(path) > past for path in outputs)
@@ -0,0 +1,58 @@
+from src.utils.oil_forecast_cache import OilForecastCache, OilForecastCacheConfig
+from darts import TimeSeries
+import joblib
+import numpy as np
+import pandas as pd
+import os
+import pytest
+
+
+class ConstantOilModel:
+    # stands in for the oil model, forecasting its last training price
+    def __init__(self, price):
+        self.training_series = TimeSeries.from_times_and_values(pd.date_range("2017-01-01", periods = 10), np.full(10, price))
+
+    def predict(self, n):
+        start = self.training_series.end_time() + pd.Timedelta(days = 1)
+        return TimeSeries.from_times_and_values(pd.date_range(start, periods = n), np.full(n, self.training_series.values()[-1, 0]))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    config = OilForecastCacheConfig(
+        oil_model = str(tmp_path / "oil_model.joblib"),
+        oil_forecasts = str(tmp_path / "oil_forecasts.joblib"),
+        horizon = 5
+    )
+    joblib.dump(ConstantOilModel(50.0), config.oil_model)
+    return OilForecastCache(config)
+
+
+def test_load_forecasts_in_memory_without_writing(cache):
+    forecasts = cache.load()
+
+    assert forecasts["forecasts"] == [50.0] * 5
+    assert not os.path.exists(cache.oilforecastcacheconfig.oil_forecasts)
+
+
+def test_refresh_saves_forecasts_that_load_then_reads(cache):
+    cache.refresh()
+    saved = os.path.getmtime(cache.oilforecastcacheconfig.oil_forecasts)
+
+    assert cache.load()["forecasts"] == [50.0] * 5
+    assert cache.refresh()["horizon"] == 5
+    assert os.path.getmtime(cache.oilforecastcacheconfig.oil_forecasts) == saved
+
+
+def test_stale_forecasts_are_not_served(cache):
+    cache.refresh()
+    joblib.dump(ConstantOilModel(60.0), cache.oilforecastcacheconfig.oil_model)
+    stale = joblib.load(cache.oilforecastcacheconfig.oil_forecasts)
+
+    # a new oil model, or a longer horizon than the one saved, is forecasted again and only refresh saves it
+    assert cache.load()["forecasts"] == [60.0] * 5
+    assert cache.load(horizon = 8)["forecasts"] == [60.0] * 8
+    assert joblib.load(cache.oilforecastcacheconfig.oil_forecasts) == stale
+
+    assert cache.refresh(horizon = 8)["forecasts"] == [60.0] * 8
+    assert joblib.load(cache.oilforecastcacheconfig.oil_forecasts)["horizon"] == 8
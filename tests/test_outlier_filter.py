@@ -0,0 +1,42 @@
+from src.utils.outlier_filter import hampel_filter
+from hampel import hampel
+import numpy as np
+import pytest
+
+
+def synthetic_sales(records, series, seed):
+    # gamma distributed sales with spikes and a few all-zero series
+    rng = np.random.default_rng(seed)
+    sales = rng.gamma(2.0, 40.0, size = (records, series)).round(2)
+    sales[rng.random(sales.shape) < 0.02] *= 30
+    sales[:, : max(1, series // 50)] = 0.0
+    return sales
+
+
+def reference_filter(sales, window_size, n_sigma):
+    return np.stack([
+        hampel(sales[:, column], window_size = window_size, n_sigma = n_sigma).filtered_data
+        for column in range(sales.shape[1])
+    ], axis = 1)
+
+
+@pytest.mark.parametrize("window_size, n_sigma", [(7, 3.0), (5, 2.0), (8, 3.0)])
+def test_hampel_filter_matches_hampel_package(window_size, n_sigma):
+    sales = synthetic_sales(records = 200, series = 60, seed = 0)
+
+    filtered = hampel_filter(sales, window_size = window_size, n_sigma = n_sigma, block_size = 16)
+
+    assert (filtered != sales.astype(np.float32)).any()
+    np.testing.assert_array_equal(filtered, reference_filter(sales, window_size, n_sigma))
+
+
+def test_hampel_filter_leaves_short_series_untouched():
+    sales = synthetic_sales(records = 6, series = 3, seed = 0)
+
+    np.testing.assert_array_equal(hampel_filter(sales, window_size = 7), sales.astype(np.float32))
+
+
+def test_hampel_filter_one_dimensional():
+    sales = synthetic_sales(records = 100, series = 1, seed = 1)[:, 0]
+
+    np.testing.assert_array_equal(hampel_filter(sales), reference_filter(sales[:, None], 7, 3.0)[:, 0])
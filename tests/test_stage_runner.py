@@ -0,0 +1,126 @@
+from src.utils.stage_runner import Stage, StageRunner, StageRunnerConfig
+import os
+import pytest
+
+
+class Pipeline:
+    """
+    Two stages over text files, doubling the numbers of an input file and then summing them, counting their runs
+    """
+
+    def __init__(self, directory):
+        self.input = str(directory / "numbers.txt")
+        self.doubled = str(directory / "doubled.txt")
+        self.total = str(directory / "total.txt")
+        self.config = StageRunnerConfig(state_file = str(directory / "pipeline_state.json"))
+        self.runs = {"double": 0, "sum": 0}
+        self.factor = 2
+        self.write("1 2 3", self.input)
+
+    @staticmethod
+    def write(text, path):
+        with open(path, "w") as file:
+            file.write(text)
+
+    @staticmethod
+    def read(path):
+        with open(path) as file:
+            return [int(value) for value in file.read().split()]
+
+    def double(self):
+        self.runs["double"] += 1
+        self.write(" ".join(str(self.factor * value) for value in self.read(self.input)), self.doubled)
+
+    def sum(self):
+        self.runs["sum"] += 1
+        self.write(str(sum(self.read(self.doubled))), self.total)
+
+    def runner(self):
+        return StageRunner([
+            Stage(name = "double", run = self.double, inputs = (self.input,), outputs = (self.doubled,), params = {"factor": self.factor}),
+            Stage(name = "sum", run = self.sum, inputs = (self.doubled,), outputs = (self.total,))
+        ], self.config)
+
+    def run(self, force = ()):
+        return {result.name: result.status for result in self.runner().run(force = force)}
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    return Pipeline(tmp_path)
+
+
+def test_unchanged_stages_are_skipped(pipeline):
+    assert pipeline.run() == {"double": "ran", "sum": "ran"}
+    assert pipeline.run() == {"double": "skipped", "sum": "skipped"}
+    assert pipeline.runs == {"double": 1, "sum": 1}
+    assert pipeline.read(pipeline.total) == [12]
+
+
+def test_a_changed_input_reruns_the_stages_it_reaches(pipeline):
+    pipeline.run()
+    pipeline.write("1 2 4", pipeline.input)
+
+    assert pipeline.run() == {"double": "ran", "sum": "ran"}
+    assert pipeline.read(pipeline.total) == [14]
+
+    # rewriting an input with the same content changes its modification time but not its hash
+    pipeline.write("1 2 4", pipeline.input)
+    assert pipeline.run() == {"double": "skipped", "sum": "skipped"}
+
+
+def test_a_rerun_with_the_same_output_skips_the_next_stages(pipeline):
+    pipeline.run()
+    # the input changes but the doubled numbers written from it do not
+    pipeline.write("1 2 3\n", pipeline.input)
+
+    assert pipeline.run() == {"double": "ran", "sum": "skipped"}
+    assert pipeline.runs == {"double": 2, "sum": 1}
+
+
+def test_changed_parameters_rerun_the_stage(pipeline):
+    pipeline.run()
+    pipeline.factor = 3
+
+    assert pipeline.run() == {"double": "ran", "sum": "ran"}
+    assert pipeline.read(pipeline.total) == [18]
+
+
+def test_a_missing_or_edited_output_reruns_the_stage(pipeline):
+    pipeline.run()
+    os.remove(pipeline.total)
+    assert pipeline.run() == {"double": "skipped", "sum": "ran"}
+
+    pipeline.write("0", pipeline.total)
+    assert pipeline.run() == {"double": "skipped", "sum": "ran"}
+    assert pipeline.read(pipeline.total) == [12]
+
+
+def test_forced_stages_rerun(pipeline):
+    pipeline.run()
+
+    assert pipeline.run(force = ["sum"]) == {"double": "skipped", "sum": "ran"}
+    assert pipeline.run(force = ["all"]) == {"double": "ran", "sum": "ran"}
+    assert pipeline.runs == {"double": 2, "sum": 3}
+    with pytest.raises(ValueError):
+        pipeline.run(force = ["train"])
+
+
+def test_a_stage_leaving_its_outputs_older_than_the_run_fails(pipeline):
+    pipeline.run()
+    past = os.path.getmtime(pipeline.doubled) - 60
+    os.utime(pipeline.doubled, (past, past))
+    # the component logs its failure instead of raising, leaving the output of the previous run in place
+    pipeline.double = lambda: None
+    pipeline.write("5 5 5", pipeline.input)
+
+    results = pipeline.runner().run()
+
+    assert [(result.name, result.status) for result in results] == [("double", "failed")]
+    assert "did not write" in results[0].reason
+    assert pipeline.runs["sum"] == 1
+
+    # the failed stage is not recorded as done, so it runs again next time
+    del pipeline.double
+    assert pipeline.run() == {"double": "ran", "sum": "ran"}
+    assert pipeline.read(pipeline.total) == [30]